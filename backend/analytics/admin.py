@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     UserActivity, Metric, UserEngagement,
     ConversationAnalytics, OrderAnalytics, SystemPerformance,
-    Report, DashboardWidget
+    Report, DashboardWidget, ActivityRollup, MetricRollup
 )
 
 @admin.register(UserActivity)
@@ -12,6 +12,13 @@ class UserActivityAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email', 'action']
     readonly_fields = ['created_at']
 
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ['period', 'bucket', 'user', 'group', 'action', 'count']
+    list_filter = ['period', 'action', 'bucket']
+    search_fields = ['user__email', 'action']
+    readonly_fields = ['updated_at']
+
 @admin.register(Metric)
 class MetricAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'value', 'period', 'recorded_at']
@@ -19,6 +26,12 @@ class MetricAdmin(admin.ModelAdmin):
     search_fields = ['name', 'category']
     readonly_fields = ['recorded_at']
 
+@admin.register(MetricRollup)
+class MetricRollupAdmin(admin.ModelAdmin):
+    list_display = ['name', 'category', 'period', 'bucket', 'count', 'min', 'max', 'p95']
+    list_filter = ['period', 'category', 'bucket']
+    search_fields = ['name']
+
 @admin.register(UserEngagement)
 class UserEngagementAdmin(admin.ModelAdmin):
     list_display = ['user', 'date', 'session_duration', 'page_views', 'conversations_count']
@@ -28,10 +41,13 @@ class UserEngagementAdmin(admin.ModelAdmin):
 
 @admin.register(ConversationAnalytics)
 class ConversationAnalyticsAdmin(admin.ModelAdmin):
-    list_display = ['conversation', 'message_count', 'avg_response_time', 'satisfaction_score', 'created_at']
+    list_display = ['conversation', 'message_count', 'last_message_at', 'avg_response_time', 'satisfaction_score', 'created_at']
     list_filter = ['created_at']
     search_fields = ['conversation__id']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = [
+        'message_count', 'user_message_count', 'ai_message_count', 'last_message_at', 'last_message_id',
+        'created_at', 'updated_at'
+    ]
 
 @admin.register(OrderAnalytics)
 class OrderAnalyticsAdmin(admin.ModelAdmin):
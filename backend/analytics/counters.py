@@ -0,0 +1,169 @@
+"""
+Denormalized per-conversation message counters.
+
+``ConversationAnalytics`` keeps the message, user message and AI message
+counts of its conversation plus its newest message (``last_message_at`` /
+``last_message_id``). The signal handlers in ``analytics.signals`` maintain
+them with F() expressions, so concurrent writers never lose an increment,
+and every new conversation gets its row up front. ``Message.save`` runs in
+a transaction, so an insert and its post_save counting commit or roll back
+together; Django already sends post_delete inside the deletion's
+transaction. Conversation lists and status endpoints read the row instead
+of counting ``orders_message``.
+
+Messages written without signals (``bulk_create``, raw SQL) make the
+counters drift; ``reconcile`` recomputes them from the messages. Migration
+0010 runs it once for existing conversations, and the
+``conversation_counters`` command runs it on demand (``backfill`` /
+``reconcile``).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    BigIntegerField, Case, Count, DateTimeField, F, OuterRef, Q, Subquery, Value, When
+)
+from django.utils import timezone
+
+# Sender types with a counter of their own (every message counts in message_count)
+SENDER_COUNTERS = {
+    'user': 'user_message_count',
+    'ai': 'ai_message_count',
+}
+
+COUNTER_FIELDS = ('message_count', 'user_message_count', 'ai_message_count', 'last_message_at', 'last_message_id')
+
+
+def _increments(sender_type, delta):
+    values = {'message_count': F('message_count') + delta, 'updated_at': timezone.now()}
+    field = SENDER_COUNTERS.get(sender_type)
+    if field:
+        values[field] = F(field) + delta
+    return values
+
+
+def _newest(conversation_id):
+    from order.models import Message
+
+    return Message.objects.filter(conversation_id=conversation_id).order_by('-created_at', '-id')
+
+
+def create_counters(conversation_id):
+    """Create the (empty) counters row of a new conversation"""
+    from .models import ConversationAnalytics
+
+    try:
+        with transaction.atomic():
+            ConversationAnalytics.objects.create(conversation_id=conversation_id)
+    except IntegrityError:
+        pass
+
+
+def record_message(message):
+    """Count an inserted message and point last_message at it when it is the newest"""
+    from .models import ConversationAnalytics
+
+    values = _increments(message.sender_type, 1)
+    is_newer = (
+        Q(last_message_at__isnull=True) | Q(last_message_at__lt=message.created_at)
+        | Q(last_message_at=message.created_at, last_message_id__lt=message.id)
+    )
+    values['last_message_at'] = Case(
+        When(is_newer, then=Value(message.created_at)), default=F('last_message_at'), output_field=DateTimeField()
+    )
+    values['last_message_id'] = Case(
+        When(is_newer, then=Value(message.id)), default=F('last_message_id'), output_field=BigIntegerField()
+    )
+    rows = ConversationAnalytics.objects.filter(conversation_id=message.conversation_id)
+    if rows.update(**values):
+        return
+    counts = {'message_count': 1}
+    if message.sender_type in SENDER_COUNTERS:
+        counts[SENDER_COUNTERS[message.sender_type]] = 1
+    try:
+        with transaction.atomic():
+            ConversationAnalytics.objects.create(
+                conversation_id=message.conversation_id, last_message_at=message.created_at,
+                last_message_id=message.id, **counts
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(**values)
+
+
+def record_deleted_message(message):
+    """Uncount a deleted message, moving last_message back when it pointed at it"""
+    from .models import ConversationAnalytics
+
+    rows = ConversationAnalytics.objects.filter(conversation_id=message.conversation_id)
+    rows.update(**_increments(message.sender_type, -1))
+    newest = _newest(message.conversation_id)
+    rows.filter(last_message_id=message.id).update(
+        last_message_at=Subquery(newest.values('created_at')[:1]),
+        last_message_id=Subquery(newest.values('id')[:1]),
+    )
+
+
+def _models(apps=None):
+    """(Conversation, Message, ConversationAnalytics), historical ones when given a migration's apps"""
+    if apps is not None:
+        return (apps.get_model('order', 'Conversation'), apps.get_model('order', 'Message'),
+                apps.get_model('analytics', 'ConversationAnalytics'))
+    from order.models import Conversation, Message
+
+    from .models import ConversationAnalytics
+
+    return Conversation, Message, ConversationAnalytics
+
+
+def _actual(conversation_ids, apps=None):
+    """Counters computed from the messages of some conversations"""
+    Conversation, Message, _ = _models(apps)
+    newest = Message.objects.filter(conversation_id=OuterRef('pk')).order_by('-created_at', '-id')
+    rows = Conversation.objects.filter(pk__in=conversation_ids).order_by().annotate(
+        total=Count('messages'),
+        user_total=Count('messages', filter=Q(messages__sender_type='user')),
+        ai_total=Count('messages', filter=Q(messages__sender_type='ai')),
+        newest_at=Subquery(newest.values('created_at')[:1]),
+        newest_id=Subquery(newest.values('id')[:1]),
+    ).values_list('pk', 'total', 'user_total', 'ai_total', 'newest_at', 'newest_id')
+    return {row[0]: row[1:] for row in rows}
+
+
+def reconcile(conversation_ids=None, fix=False, batch_size=500, apps=None):
+    """
+    Compare stored counters with the messages, a batch of conversations at a time.
+
+    Returns [(conversation_id, stored values or None, actual values)] of the
+    mismatches, values in COUNTER_FIELDS order; with ``fix`` the stored rows
+    are corrected (and missing ones created).
+    """
+    Conversation, _, ConversationAnalytics = _models(apps)
+    conversations = Conversation.objects.order_by('pk')
+    if conversation_ids:
+        conversations = conversations.filter(pk__in=conversation_ids)
+    ids = list(conversations.values_list('pk', flat=True))
+    mismatches = []
+    for index in range(0, len(ids), batch_size):
+        batch = ids[index:index + batch_size]
+        actual = _actual(batch, apps)
+        stored = {row.conversation_id: row for row in ConversationAnalytics.objects.filter(conversation_id__in=batch)}
+        missing, stale = [], []
+        for conversation_id in batch:
+            values = actual[conversation_id]
+            row = stored.get(conversation_id)
+            current = tuple(getattr(row, field) for field in COUNTER_FIELDS) if row else None
+            if current == values:
+                continue
+            mismatches.append((conversation_id, current, values))
+            if not fix:
+                continue
+            if row is None:
+                missing.append(ConversationAnalytics(conversation_id=conversation_id, **dict(zip(COUNTER_FIELDS, values))))
+            else:
+                for field, value in zip(COUNTER_FIELDS, values):
+                    setattr(row, field, value)
+                stale.append(row)
+        if missing:
+            ConversationAnalytics.objects.bulk_create(missing, ignore_conflicts=True)
+        if stale:
+            ConversationAnalytics.objects.bulk_update(stale, COUNTER_FIELDS)
+    return mismatches
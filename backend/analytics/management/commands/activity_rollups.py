@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from analytics import rollups
+from analytics.models import UserActivity
+from core.utils import day_start
+
+
+class Command(BaseCommand):
+    help = 'Backfill activity rollups from raw UserActivity rows, or check them against the raw data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['backfill', 'check'])
+        parser.add_argument('--since', help='First day (YYYY-MM-DD); default: oldest activity (backfill) or 7 days ago (check)')
+        parser.add_argument('--until', help='Last day, inclusive (YYYY-MM-DD); default: today')
+        parser.add_argument('--period', choices=sorted(rollups.PERIODS), action='append',
+                            help='Limit to this period (repeatable; default: all)')
+        parser.add_argument('--fix', action='store_true', help='check: recompute the mismatching buckets')
+
+    def _day(self, value, name):
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'--{name} must be a date (YYYY-MM-DD)')
+        return day
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        until = self._day(options['until'], 'until') if options['until'] else today
+        periods = options['period'] or sorted(rollups.PERIODS)
+        if options['since']:
+            since = self._day(options['since'], 'since')
+        elif options['action'] == 'backfill':
+            first = UserActivity.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            since = timezone.localtime(first).date() if first else today
+        else:
+            since = today - timedelta(days=7)
+        if since > until:
+            raise CommandError('--since is after --until')
+
+        if options['action'] == 'backfill':
+            written = rollups.backfill(since, until, periods)
+            self.stdout.write(self.style.SUCCESS(f"Backfilled {written} rollup rows from {since} to {until}"))
+            return
+
+        start, end = day_start(since), day_start(until + timedelta(days=1))
+        failed = False
+        for period in periods:
+            mismatches = rollups.check(start, end, period, fix=options['fix'])
+            for bucket, user_id, action, stored, raw in mismatches:
+                self.stdout.write(f"{period}\t{bucket.isoformat()}\tuser={user_id}\t{action}\trollup={stored}\traw={raw}")
+            if not mismatches:
+                self.stdout.write(self.style.SUCCESS(f"{period}: rollups match raw activity"))
+            elif options['fix']:
+                self.stdout.write(self.style.SUCCESS(f"{period}: fixed {len(mismatches)} mismatching buckets"))
+            else:
+                failed = True
+                self.stdout.write(self.style.WARNING(f"{period}: {len(mismatches)} mismatching buckets"))
+        if failed:
+            raise CommandError('Activity rollups differ from raw activity (rerun with --fix)')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import counters
+
+
+class Command(BaseCommand):
+    help = 'Backfill the denormalized conversation counters from the messages, or check them against the messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['backfill', 'reconcile'])
+        parser.add_argument('--conversation', type=int, action='append',
+                            help='Limit to this conversation ID (repeatable; default: all)')
+        parser.add_argument('--fix', action='store_true', help='reconcile: correct the mismatching counters')
+        parser.add_argument('--batch-size', type=int, default=500, help='Conversations per query (default: 500)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        backfill = options['action'] == 'backfill'
+        mismatches = counters.reconcile(
+            options['conversation'], fix=backfill or options['fix'], batch_size=options['batch_size']
+        )
+        if backfill:
+            self.stdout.write(self.style.SUCCESS(f"Backfilled counters of {len(mismatches)} conversations"))
+            return
+
+        fields = counters.COUNTER_FIELDS
+        for conversation_id, stored, actual in mismatches:
+            stored_text = 'missing' if stored is None else ' '.join(f"{f}={v}" for f, v in zip(fields, stored))
+            actual_text = ' '.join(f"{f}={v}" for f, v in zip(fields, actual))
+            self.stdout.write(f"conversation={conversation_id}\tstored: {stored_text}\tactual: {actual_text}")
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Conversation counters match the messages'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed counters of {len(mismatches)} conversations"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(mismatches)} conversations with mismatching counters"))
+            raise CommandError('Conversation counters differ from the messages (rerun with --fix)')
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from analytics import timeseries
+from analytics.models import Metric, MetricPoint, SystemPerformance
+from core.utils import day_start
+
+
+class Command(BaseCommand):
+    help = 'Downsample metric points into rollups, apply retention, or import Metric/SystemPerformance rows as points'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['downsample', 'retention', 'import'])
+        parser.add_argument('--since', help='First day (YYYY-MM-DD); default: oldest point (downsample) or everything (import)')
+        parser.add_argument('--until', help='Last day, inclusive (YYYY-MM-DD); default: today')
+        parser.add_argument('--period', choices=timeseries.PERIODS, action='append',
+                            help='downsample: limit to this period (repeatable; default: all, finest first)')
+        parser.add_argument('--source', choices=['metrics', 'performance'], action='append',
+                            help='import: legacy table to copy (repeatable; default: both)')
+
+    def _day(self, value, name):
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'--{name} must be a date (YYYY-MM-DD)')
+        return day
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'retention':
+            deleted = timeseries.apply_retention()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted or 'nothing'}"))
+            return
+
+        today = timezone.localdate()
+        until = self._day(options['until'], 'until') if options['until'] else today
+        since = self._day(options['since'], 'since') if options['since'] else None
+        if since and since > until:
+            raise CommandError('--since is after --until')
+        end = day_start(until + timedelta(days=1))
+
+        if action == 'import':
+            self._import(options['source'] or ['metrics', 'performance'], since and day_start(since), end)
+            return
+
+        if since is None:
+            first = MetricPoint.objects.order_by('recorded_at').values_list('recorded_at', flat=True).first()
+            since = timezone.localtime(first).date() if first else today
+        start = day_start(since)
+        # Finer levels first: each period is built from the one below
+        for period in [period for period in timeseries.PERIODS if period in (options['period'] or timeseries.PERIODS)]:
+            written = timeseries.downsample(period, start, end)
+            self.stdout.write(self.style.SUCCESS(f"{period}: {written} rollup rows from {since} to {until}"))
+
+    def _import(self, sources, start, end):
+        querysets = {
+            'metrics': (Metric.objects.all(), 'name', 'value'),
+            'performance': (SystemPerformance.objects.all(), 'metric_name', 'metric_value'),
+        }
+        for source in sources:
+            queryset, name_field, value_field = querysets[source]
+            queryset = queryset.filter(recorded_at__lt=end)
+            if start:
+                queryset = queryset.filter(recorded_at__gte=start)
+            rows = queryset.order_by('id').values_list(name_field, 'category', value_field, 'recorded_at')
+            batch, imported = [], 0
+            for name, category, value, recorded_at in rows.iterator(chunk_size=5000):
+                batch.append({'name': name, 'category': category, 'value': float(value), 'recorded_at': recorded_at})
+                if len(batch) >= 5000:
+                    imported += timeseries.ingest(batch)
+                    batch = []
+            imported += timeseries.ingest(batch)
+            self.stdout.write(self.style.SUCCESS(f"{source}: imported {imported} points"))
@@ -0,0 +1,167 @@
+"""
+Request-level activity tracking.
+
+Views declare what a request means with ``@track_activity(action,
+resource_type=...)`` on a handler (a function view, a view method such as
+``post``, or a DRF hook such as ``perform_create``) and fill in details
+with ``annotate_activity(request, resource_id=..., metadata=...)``.
+``ActivityMiddleware`` then records one UserActivity per marked request,
+adding the client IP, user agent, status code, wall time and number of
+database queries, through the buffered ``analytics.recorder``.
+
+A handler that raises or returns an error response leaves no mark, so
+failed attempts (invalid input, permission errors) are not recorded, as
+before.
+"""
+import functools
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+from .recorder import activity_recorder
+
+ACTIVITY_ATTR = '_activity'
+
+
+def _http_request(request):
+    # DRF wraps the Django request; the middleware only sees the inner one
+    return getattr(request, '_request', request)
+
+
+def _find_request(args):
+    for arg in args:
+        if hasattr(arg, 'META'):
+            return arg
+    request = getattr(args[0], 'request', None) if args else None
+    if request is None:
+        raise TypeError('track_activity could not find the request among the handler arguments')
+    return request
+
+
+def annotate_activity(request, **fields):
+    """Set activity fields (resource_id, metadata, user, session_id, ...) for this request"""
+    activity = getattr(_http_request(request), ACTIVITY_ATTR, None)
+    if activity is None:
+        activity = {}
+        setattr(_http_request(request), ACTIVITY_ATTR, activity)
+    activity.update(fields)
+    return activity
+
+
+def track_activity(action, resource_type=''):
+    """
+    Mark a view handler so ActivityMiddleware records the request.
+
+    The first decorated handler to finish sets the action; annotations made
+    inside the handler win over the defaults.
+    """
+    def mark(args, response):
+        if getattr(response, 'status_code', 200) >= 400:
+            return
+        request = _find_request(args)
+        activity = annotate_activity(request)
+        activity.setdefault('action', action)
+        activity.setdefault('resource_type', resource_type)
+        activity.setdefault('user', getattr(request, 'user', None))
+
+    def decorator(handler):
+        if iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(*args, **kwargs):
+                response = await handler(*args, **kwargs)
+                mark(args, response)
+                return response
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            response = handler(*args, **kwargs)
+            mark(args, response)
+            return response
+        return wrapper
+    return decorator
+
+
+class QueryCounter:
+    """
+    execute_wrapper that counts the queries run on a connection
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class ActivityMiddleware:
+    """
+    Records the activity marked by track_activity once per request
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        self._record(request, response, started, counter.count)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        counter = QueryCounter()
+        # Sync views and the async ORM run this request's queries in one thread-sensitive
+        # thread (ThreadSensitiveContext); count them there
+        await sync_to_async(self._count_queries)(counter)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await sync_to_async(self._stop_counting)(counter)
+            raise
+        # Off the loop: the buffered recorder may talk to Redis, the sync one inserts
+        await sync_to_async(self._finish)(request, response, started, counter)
+        return response
+
+    def _count_queries(self, counter):
+        for connection in connections.all():
+            connection.execute_wrappers.append(counter)
+
+    def _stop_counting(self, counter):
+        for connection in connections.all():
+            if counter in connection.execute_wrappers:
+                connection.execute_wrappers.remove(counter)
+
+    def _finish(self, request, response, started, counter):
+        self._stop_counting(counter)
+        self._record(request, response, started, counter.count)
+
+    def _record(self, request, response, started, query_count):
+        activity = getattr(request, ACTIVITY_ATTR, None)
+        if not activity or 'action' not in activity:
+            return
+        fields = dict(activity)
+        user = fields.pop('user', None)
+        if user is None or not getattr(user, 'is_authenticated', False):
+            return
+        activity_recorder.record(
+            user, fields.pop('action'), request=request,
+            status_code=response.status_code,
+            duration_ms=round((time.perf_counter() - started) * 1000, 2),
+            query_count=query_count,
+            **fields
+        )
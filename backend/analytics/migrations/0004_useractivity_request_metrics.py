@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_useractivity_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useractivity',
+            name='duration_ms',
+            field=models.FloatField(blank=True, null=True, verbose_name='duration (ms)'),
+        ),
+        migrations.AddField(
+            model_name='useractivity',
+            name='query_count',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='query count'),
+        ),
+        migrations.AddField(
+            model_name='useractivity',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='status code'),
+        ),
+    ]
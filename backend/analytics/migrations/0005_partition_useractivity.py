@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def partition_useractivity(apps, schema_editor):
+    from core.partitions import convert_to_partitioned
+
+    convert_to_partitioned(schema_editor.connection, 'analytics_useractivity')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_useractivity_request_metrics'),
+    ]
+
+    operations = [
+        # PostgreSQL only: monthly range partitions on created_at (see core.partitions)
+        migrations.RunPython(partition_useractivity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_rollups(apps, schema_editor):
+    from django.utils import timezone
+
+    from analytics.rollups import backfill
+
+    # The summary views read all-time totals from rollups, so history has to be in them
+    UserActivity = apps.get_model('analytics', 'UserActivity')
+    first = UserActivity.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    if first is not None:
+        backfill(timezone.localtime(first).date(), timezone.localdate(), apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_partition_auditlog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('authentication', '0002_initial'),
+        ('analytics', '0005_partition_useractivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10, verbose_name='period')),
+                ('bucket', models.DateTimeField(verbose_name='bucket start')),
+                ('action', models.CharField(max_length=50, verbose_name='action')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='count')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Activity Rollup',
+                'verbose_name_plural': 'Activity Rollups',
+                'db_table': 'analytics_activityrollup',
+                'ordering': ['-bucket'],
+                'indexes': [models.Index(fields=['period', 'bucket'], name='analytics_a_period_c8b739_idx'), models.Index(fields=['group', 'period', 'bucket'], name='analytics_a_group_i_beed1b_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activityrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'user', 'action'), name='activity_rollup_unique_bucket'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:56
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_activityrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='metric name')),
+                ('category', models.CharField(blank=True, max_length=50, verbose_name='category')),
+                ('value', models.FloatField(verbose_name='value')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='recorded at')),
+            ],
+            options={
+                'verbose_name': 'Metric Point',
+                'verbose_name_plural': 'Metric Points',
+                'db_table': 'analytics_metricpoint',
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='metric name')),
+                ('category', models.CharField(blank=True, max_length=50, verbose_name='category')),
+                ('period', models.CharField(choices=[('hourly', 'Hourly'), ('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=20, verbose_name='period')),
+                ('bucket', models.DateTimeField(verbose_name='bucket start')),
+                ('count', models.PositiveIntegerField(verbose_name='count')),
+                ('sum', models.FloatField(verbose_name='sum')),
+                ('min', models.FloatField(verbose_name='min')),
+                ('max', models.FloatField(verbose_name='max')),
+                ('p95', models.FloatField(verbose_name='95th percentile')),
+            ],
+            options={
+                'verbose_name': 'Metric Rollup',
+                'verbose_name_plural': 'Metric Rollups',
+                'db_table': 'analytics_metricrollup',
+                'ordering': ['name', 'bucket'],
+                'indexes': [models.Index(fields=['period', 'bucket'], name='analytics_m_period_fd057c_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='metricrollup',
+            constraint=models.UniqueConstraint(fields=('name', 'period', 'bucket'), name='metric_rollup_unique_bucket'),
+        ),
+        migrations.AddIndex(
+            model_name='metricpoint',
+            index=models.Index(fields=['name', 'recorded_at'], name='analytics_m_name_e9b660_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='metricpoint',
+            index=models.Index(fields=['recorded_at'], name='analytics_m_recorde_d13236_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:16
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    from analytics.counters import reconcile
+
+    # Existing conversations start from their actual messages, not from zero
+    reconcile(fix=True, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_keyset_indexes'),
+        ('order', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationanalytics',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='last message at'),
+        ),
+        migrations.AddField(
+            model_name='conversationanalytics',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='last message ID'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
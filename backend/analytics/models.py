@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 
@@ -30,7 +31,12 @@ class UserActivity(models.Model):
     ip_address = models.GenericIPAddressField(_('IP address'), null=True, blank=True)
     user_agent = models.TextField(_('user agent'), blank=True)
     session_id = models.CharField(_('session ID'), max_length=100, blank=True)
-    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    # Request facts captured by analytics.middleware.ActivityMiddleware
+    status_code = models.PositiveSmallIntegerField(_('status code'), null=True, blank=True)
+    duration_ms = models.FloatField(_('duration (ms)'), null=True, blank=True)
+    query_count = models.PositiveIntegerField(_('query count'), null=True, blank=True)
+    # Set when the event happens; rows are written later by analytics.recorder
+    created_at = models.DateTimeField(_('created at'), default=timezone.now)
     metadata = models.JSONField(_('metadata'), default=dict, blank=True)
     
     class Meta:
@@ -39,7 +45,9 @@ class UserActivity(models.Model):
         verbose_name_plural = _('User Activities')
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['user', 'created_at']),
+            # (created_at, id) keys the activity feed's keyset pagination (core.pagination)
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['created_at', 'id']),
             models.Index(fields=['action', 'created_at']),
         ]
     
@@ -111,6 +119,9 @@ class ConversationAnalytics(models.Model):
     message_count = models.IntegerField(_('message count'), default=0)
     user_message_count = models.IntegerField(_('user message count'), default=0)
     ai_message_count = models.IntegerField(_('AI message count'), default=0)
+    # Counters and the newest message are maintained on Message insert/delete (analytics.counters)
+    last_message_at = models.DateTimeField(_('last message at'), null=True, blank=True)
+    last_message_id = models.BigIntegerField(_('last message ID'), null=True, blank=True)
     avg_response_time = models.FloatField(_('average response time (seconds)'), null=True, blank=True)
     total_duration = models.IntegerField(_('total duration (seconds)'), null=True, blank=True)
     satisfaction_score = models.FloatField(_('satisfaction score'), null=True, blank=True)
@@ -179,6 +190,13 @@ class Report(models.Model):
         ('custom', _('Custom Report')),
     ]
     
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    ]
+    
     name = models.CharField(_('report name'), max_length=200)
     report_type = models.CharField(_('report type'), max_length=50, choices=REPORT_TYPE_CHOICES)
     parameters = models.JSONField(_('parameters'), default=dict, blank=True)
@@ -187,6 +205,10 @@ class Report(models.Model):
     file_path = models.CharField(_('file path'), max_length=500, blank=True)
     file_size = models.IntegerField(_('file size'), null=True, blank=True)
     is_ready = models.BooleanField(_('is ready'), default=False)
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress = models.PositiveSmallIntegerField(_('progress (%)'), default=0)
+    row_count = models.PositiveIntegerField(_('row count'), default=0)
+    error = models.TextField(_('error'), blank=True)
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     completed_at = models.DateTimeField(_('completed at'), null=True, blank=True)
     
@@ -227,4 +249,91 @@ class DashboardWidget(models.Model):
         verbose_name_plural = _('Dashboard Widgets')
     
     def __str__(self):
-        return f"{self.name} ({self.widget_type})"
\ No newline at end of file
+        return f"{self.name} ({self.widget_type})"
+
+class ActivityRollup(models.Model):
+    """
+    UserActivity counts per hour or day bucket, maintained by analytics.rollups
+    """
+    PERIOD_CHOICES = [
+        ('hour', _('Hour')),
+        ('day', _('Day')),
+    ]
+    
+    period = models.CharField(_('period'), max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(_('bucket start'))
+    group = models.ForeignKey('core.Group', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_rollups')
+    action = models.CharField(_('action'), max_length=50)
+    count = models.PositiveIntegerField(_('count'), default=0)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        db_table = 'analytics_activityrollup'
+        verbose_name = _('Activity Rollup')
+        verbose_name_plural = _('Activity Rollups')
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'user', 'action'], name='activity_rollup_unique_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'bucket']),
+            models.Index(fields=['group', 'period', 'bucket']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.action} - {self.period} {self.bucket}: {self.count}"
+
+class MetricPoint(models.Model):
+    """
+    Raw time-series sample, downsampled into MetricRollup by analytics.timeseries
+    """
+    name = models.CharField(_('metric name'), max_length=100)
+    category = models.CharField(_('category'), max_length=50, blank=True)
+    value = models.FloatField(_('value'))
+    recorded_at = models.DateTimeField(_('recorded at'), default=timezone.now)
+    
+    class Meta:
+        db_table = 'analytics_metricpoint'
+        verbose_name = _('Metric Point')
+        verbose_name_plural = _('Metric Points')
+        indexes = [
+            models.Index(fields=['name', 'recorded_at']),
+            models.Index(fields=['recorded_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name}: {self.value} ({self.recorded_at})"
+
+class MetricRollup(models.Model):
+    """
+    Downsampled metric statistics for one bucket of a Metric period
+    """
+    name = models.CharField(_('metric name'), max_length=100)
+    category = models.CharField(_('category'), max_length=50, blank=True)
+    period = models.CharField(_('period'), max_length=20, choices=Metric.PERIOD_CHOICES)
+    bucket = models.DateTimeField(_('bucket start'))
+    count = models.PositiveIntegerField(_('count'))
+    sum = models.FloatField(_('sum'))
+    min = models.FloatField(_('min'))
+    max = models.FloatField(_('max'))
+    p95 = models.FloatField(_('95th percentile'))
+    
+    class Meta:
+        db_table = 'analytics_metricrollup'
+        verbose_name = _('Metric Rollup')
+        verbose_name_plural = _('Metric Rollups')
+        ordering = ['name', 'bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'period', 'bucket'], name='metric_rollup_unique_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'bucket']),
+        ]
+    
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else None
+    
+    def __str__(self):
+        return f"{self.name} - {self.period} {self.bucket}: avg {self.avg}"
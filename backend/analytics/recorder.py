@@ -0,0 +1,327 @@
+"""
+Write-behind recording of UserActivity rows.
+
+Views call ``record_activity`` instead of ``UserActivity.objects.create``;
+the event is appended to a buffer and written with ``bulk_create`` in
+batches of ``ACTIVITY_FLUSH_SIZE``, at least every
+``ACTIVITY_FLUSH_INTERVAL`` seconds, and once more at interpreter exit.
+
+``ACTIVITY_BUFFER`` selects the buffer:
+
+- ``memory``: a per-process deque drained by a background thread;
+- ``redis``: a shared Redis list (survives worker restarts, drained by
+  whichever worker's flusher runs next);
+- ``sync``: write immediately, for tests and management commands.
+
+The buffer is bounded by ``ACTIVITY_BUFFER_MAX``. When a batch fails to
+insert its events are retried one at a time and only those that fail
+again are dropped; a batch none of which goes in is retried whole, then
+dropped. Dropped events are counted in ``stats()['dropped']``.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = 'analytics:activity_buffer'
+REDIS_DROPPED_KEY = 'analytics:activity_dropped'
+
+# Failed batches are retried this many times before their events are dropped
+MAX_FLUSH_ATTEMPTS = 3
+
+
+def activity_event(user, action, request=None, resource_type='', resource_id=None,
+                   metadata=None, session_id=None, status_code=None, duration_ms=None,
+                   query_count=None, created_at=None):
+    """Build the field dict of a UserActivity row, stamped with the current time"""
+    event = {
+        'user_id': user.pk,
+        'action': action,
+        'resource_type': resource_type,
+        'resource_id': resource_id,
+        'ip_address': None,
+        'user_agent': '',
+        'session_id': session_id or '',
+        'metadata': metadata or {},
+        'status_code': status_code,
+        'duration_ms': duration_ms,
+        'query_count': query_count,
+        'created_at': created_at or timezone.now(),
+    }
+    if request is not None:
+        event['ip_address'] = request.META.get('REMOTE_ADDR')
+        event['user_agent'] = request.META.get('HTTP_USER_AGENT', '')
+        if session_id is None:
+            session = getattr(request, 'session', None)
+            event['session_id'] = (session.session_key if session is not None else None) or ''
+    return event
+
+
+class MemoryBuffer:
+    """
+    Bounded per-process event queue
+    """
+
+    def __init__(self, max_size):
+        self.events = deque()
+        self.max_size = max_size
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.events)
+
+    def push(self, event):
+        with self._lock:
+            if len(self.events) >= self.max_size:
+                self.dropped += 1
+                return False
+            self.events.append(event)
+            return True
+
+    def pop_batch(self, size):
+        with self._lock:
+            return [self.events.popleft() for _ in range(min(size, len(self.events)))]
+
+    def requeue(self, events):
+        with self._lock:
+            room = max(0, self.max_size - len(self.events))
+            self.events.extendleft(reversed(events[:room]))
+            self.dropped += len(events) - min(room, len(events))
+
+    def drop(self, count):
+        with self._lock:
+            self.dropped += count
+
+    def dropped_count(self):
+        return self.dropped
+
+
+class RedisBuffer:
+    """
+    Event queue in a Redis list shared by all workers
+    """
+
+    def __init__(self, max_size):
+        from django_redis import get_redis_connection
+
+        self.redis = get_redis_connection('default')
+        self.max_size = max_size
+
+    def __len__(self):
+        return self.redis.llen(REDIS_KEY)
+
+    def push(self, event):
+        if self.redis.llen(REDIS_KEY) >= self.max_size:
+            self.redis.incr(REDIS_DROPPED_KEY)
+            return False
+        self.redis.rpush(REDIS_KEY, json.dumps(event, cls=DjangoJSONEncoder))
+        return True
+
+    def pop_batch(self, size):
+        with self.redis.pipeline() as pipe:
+            pipe.lrange(REDIS_KEY, 0, size - 1)
+            pipe.ltrim(REDIS_KEY, size, -1)
+            raw, _ = pipe.execute()
+        events = []
+        for item in raw:
+            event = json.loads(item)
+            event['created_at'] = parse_datetime(event['created_at'])
+            events.append(event)
+        return events
+
+    def requeue(self, events):
+        room = max(0, self.max_size - len(self))
+        if events[:room]:
+            self.redis.lpush(REDIS_KEY, *[
+                json.dumps(event, cls=DjangoJSONEncoder) for event in reversed(events[:room])
+            ])
+        if len(events) > room:
+            self.drop(len(events) - room)
+
+    def drop(self, count):
+        self.redis.incrby(REDIS_DROPPED_KEY, count)
+
+    def dropped_count(self):
+        return int(self.redis.get(REDIS_DROPPED_KEY) or 0)
+
+
+class ActivityRecorder:
+    """
+    Buffers activity events and flushes them with bulk_create
+    """
+
+    def __init__(self):
+        self._buffer = None
+        self._mode = None
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._attempts = 0
+        self.flushed = 0
+        atexit.register(self.shutdown)
+
+    @property
+    def mode(self):
+        return getattr(settings, 'ACTIVITY_BUFFER', 'memory')
+
+    def _get_buffer(self):
+        mode = self.mode
+        if self._buffer is not None and self._mode == mode:
+            return self._buffer
+        with self._thread_lock:
+            if self._buffer is not None and self._mode == mode:
+                return self._buffer
+            max_size = getattr(settings, 'ACTIVITY_BUFFER_MAX', 10000)
+            if mode == 'redis':
+                try:
+                    self._buffer = RedisBuffer(max_size)
+                except Exception as e:
+                    logger.warning(f"Redis activity buffer unavailable, buffering in memory: {str(e)}")
+                    self._buffer = MemoryBuffer(max_size)
+            else:
+                self._buffer = MemoryBuffer(max_size)
+            self._mode = mode
+        return self._buffer
+
+    def record(self, user, action, request=None, **fields):
+        """Queue one activity (see activity_event for the accepted fields)"""
+        if user is None or not getattr(user, 'pk', None):
+            return
+        event = activity_event(user, action, request=request, **fields)
+        if self.mode == 'sync':
+            self._write([event])
+            return
+
+        try:
+            buffer = self._get_buffer()
+            buffer.push(event)
+            size = len(buffer)
+        except Exception as e:
+            logger.error(f"Could not buffer activity '{action}': {str(e)}")
+            return
+        self._ensure_flusher()
+        if size >= getattr(settings, 'ACTIVITY_FLUSH_SIZE', 200):
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every buffered event now; returns the number written"""
+        if self._buffer is None:
+            return 0
+        written = 0
+        batch_size = getattr(settings, 'ACTIVITY_FLUSH_SIZE', 200)
+        with self._flush_lock:
+            while True:
+                events = self._buffer.pop_batch(batch_size)
+                if not events:
+                    break
+                try:
+                    self._write(events)
+                except Exception as e:
+                    # One bad row fails the whole bulk insert; keep the rows that go in on their own
+                    saved, failed = self._write_each(events)
+                    if not saved:
+                        # Nothing went in, most likely the database itself: retry the batch
+                        self._attempts += 1
+                        if self._attempts >= MAX_FLUSH_ATTEMPTS:
+                            logger.error(f"Dropping {len(events)} activity events after repeated failures: {str(e)}")
+                            self._buffer.drop(len(events))
+                            self._attempts = 0
+                        else:
+                            logger.warning(f"Activity flush failed, will retry: {str(e)}")
+                            self._buffer.requeue(events)
+                        break
+                    logger.error(f"Dropping {len(failed)} activity events that could not be inserted: {str(e)}")
+                    self._buffer.drop(len(failed))
+                    written += saved
+                    self._attempts = 0
+                    continue
+                self._attempts = 0
+                written += len(events)
+        return written
+
+    def _write(self, events):
+        from .models import UserActivity
+
+        with transaction.atomic():
+            UserActivity.objects.bulk_create([UserActivity(**event) for event in events])
+        self.flushed += len(events)
+        if getattr(settings, 'ACTIVITY_ROLLUP_ON_FLUSH', True):
+            from .rollups import apply_events
+
+            # The rows are written; a failed increment is repaired by the next rollup refresh
+            try:
+                apply_events(events)
+            except Exception as e:
+                logger.warning(f"Could not update activity rollups: {str(e)}")
+
+    def _write_each(self, events):
+        """Insert events one at a time; returns (rows written, events that failed)"""
+        saved, failed = 0, []
+        for event in events:
+            try:
+                self._write([event])
+            except Exception as e:
+                logger.warning(f"Could not insert activity '{event.get('action')}': {str(e)}")
+                failed.append(event)
+            else:
+                saved += 1
+        return saved, failed
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so prefork servers start one per child
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='activity-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 2.0))
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Activity flusher error: {str(e)}")
+            finally:
+                connections.close_all()
+
+    def shutdown(self):
+        """Flush what is left, e.g. when the worker exits"""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Could not flush activity buffer on shutdown: {str(e)}")
+
+    def stats(self):
+        buffer = self._buffer
+        return {
+            'mode': self.mode,
+            'buffered': len(buffer) if buffer is not None else 0,
+            'flushed': self.flushed,
+            'dropped': buffer.dropped_count() if buffer is not None else 0,
+        }
+
+
+activity_recorder = ActivityRecorder()
+
+
+def record_activity(user, action, request=None, **fields):
+    """Record a UserActivity through the shared recorder"""
+    activity_recorder.record(user, action, request=request, **fields)
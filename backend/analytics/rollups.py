@@ -0,0 +1,228 @@
+"""
+Pre-aggregated UserActivity counts.
+
+``ActivityRollup`` holds one row per (period, bucket, user, action) for
+hourly and daily buckets (days in the current time zone), with the user's
+group denormalised for group-level dashboards. Two paths keep it current:
+
+- ``recompute(start, end)`` rebuilds the buckets of a window from the raw
+  table; it is authoritative and idempotent. The Celery beat task
+  ``refresh_activity_rollups`` re-runs it for the hours of the last
+  ``ACTIVITY_ROLLUP_LOOKBACK_HOURS`` so buffered or late events settle,
+  then sums the days it touched from their hourly rows rather than
+  scanning a whole day of raw activity. ``backfill`` covers history
+  (migration 0006 and ``activity_rollups backfill``).
+- ``apply_events(events)`` adds freshly written events to their buckets
+  right after the activity recorder flushes them, so dashboards do not
+  wait for the next recompute (``ACTIVITY_ROLLUP_ON_FLUSH``).
+
+``summary`` and ``trends`` answer the analytics views from rollups.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from core.utils import day_start
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+}
+
+
+def bucket_start(moment, period):
+    """Start of the hour or (local) day containing an aware datetime"""
+    local = timezone.localtime(moment)
+    if period == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    return day_start(local.date())
+
+
+def _aligned(start, end, period):
+    """Widen [start, end) to whole buckets of the period"""
+    start = bucket_start(start, period)
+    last = bucket_start(end - timedelta(microseconds=1), period)
+    if period == 'hour':
+        return start, last + timedelta(hours=1)
+    return start, day_start(timezone.localtime(last).date() + timedelta(days=1))
+
+
+def _models(apps=None):
+    """(User, UserActivity, ActivityRollup), historical ones when given a migration's apps"""
+    if apps is not None:
+        return (apps.get_model('authentication', 'User'), apps.get_model('analytics', 'UserActivity'),
+                apps.get_model('analytics', 'ActivityRollup'))
+    from authentication.models import User
+
+    from .models import ActivityRollup, UserActivity
+
+    return User, UserActivity, ActivityRollup
+
+
+def raw_counts(start, end, period, user=None, apps=None):
+    """Counter of (bucket, user_id, action) from UserActivity over [start, end)"""
+    _, UserActivity, _ = _models(apps)
+    activities = UserActivity.objects.filter(created_at__gte=start, created_at__lt=end)
+    if user is not None:
+        activities = activities.filter(user=user)
+    rows = activities.annotate(bucket=PERIODS[period]('created_at')).values(
+        'bucket', 'user_id', 'action'
+    ).annotate(count=Count('id')).order_by()
+    return Counter({(row['bucket'], row['user_id'], row['action']): row['count'] for row in rows})
+
+
+def _groups_of(user_ids, apps=None):
+    User, _, _ = _models(apps)
+    return dict(User.objects.filter(id__in=set(user_ids)).values_list('id', 'group_id'))
+
+
+def _replace(period, start, end, counts, apps=None):
+    """Swap the period's buckets in [start, end) for counts; returns rows written"""
+    _, _, ActivityRollup = _models(apps)
+    groups = _groups_of((user_id for _, user_id, _ in counts), apps)
+    rows = [
+        ActivityRollup(
+            period=period, bucket=bucket, user_id=user_id, group_id=groups.get(user_id),
+            action=action, count=count
+        )
+        for (bucket, user_id, action), count in counts.items()
+    ]
+    with transaction.atomic():
+        ActivityRollup.objects.filter(period=period, bucket__gte=start, bucket__lt=end).delete()
+        ActivityRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def recompute(start, end, periods=('hour', 'day'), apps=None):
+    """Rebuild the rollup buckets overlapping [start, end); returns rows written"""
+    written = 0
+    for period in periods:
+        period_start, period_end = _aligned(start, end, period)
+        counts = raw_counts(period_start, period_end, period, apps=apps)
+        written += _replace(period, period_start, period_end, counts, apps)
+    return written
+
+
+def days_from_hours(start, end):
+    """Rebuild the day buckets overlapping [start, end) by summing their hourly rollups"""
+    from .models import ActivityRollup
+
+    period_start, period_end = _aligned(start, end, 'day')
+    rows = ActivityRollup.objects.filter(period='hour', bucket__gte=period_start, bucket__lt=period_end).annotate(
+        day=TruncDay('bucket')
+    ).values('day', 'user_id', 'action').annotate(total=Sum('count')).order_by()
+    counts = Counter({(row['day'], row['user_id'], row['action']): row['total'] for row in rows})
+    return _replace('day', period_start, period_end, counts)
+
+
+def backfill(since, until, periods=('hour', 'day'), apps=None):
+    """Recompute every day from since to until (inclusive); returns rows written"""
+    # A day at a time keeps each delete + insert transaction small
+    day = since
+    written = 0
+    while day <= until:
+        written += recompute(day_start(day), day_start(day + timedelta(days=1)), periods, apps)
+        day += timedelta(days=1)
+    return written
+
+
+def refresh(now=None):
+    """Recompute the recent window (beat task entry point)"""
+    now = now or timezone.now()
+    lookback = getattr(settings, 'ACTIVITY_ROLLUP_LOOKBACK_HOURS', 2)
+    start = now - timedelta(hours=lookback)
+    end = now + timedelta(microseconds=1)
+    # Only the lookback's hours come from raw activity; their days are summed from hourly rows
+    return recompute(start, end, periods=('hour',)) + days_from_hours(start, end)
+
+
+def apply_events(events):
+    """Add recorder events (dicts with user_id, action, created_at) to their buckets"""
+    from .models import ActivityRollup
+
+    increments = Counter()
+    for event in events:
+        for period in PERIODS:
+            increments[(period, bucket_start(event['created_at'], period), event['user_id'], event['action'])] += 1
+    if not increments:
+        return
+    groups = _groups_of(key[2] for key in increments)
+    for (period, bucket, user_id, action), count in increments.items():
+        lookup = {'period': period, 'bucket': bucket, 'user_id': user_id, 'action': action}
+        if ActivityRollup.objects.filter(**lookup).update(count=F('count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                ActivityRollup.objects.create(group_id=groups.get(user_id), count=count, **lookup)
+        except IntegrityError:
+            # Another writer created the bucket first
+            ActivityRollup.objects.filter(**lookup).update(count=F('count') + count)
+
+
+def _scoped(user=None, group_id=None):
+    from .models import ActivityRollup
+
+    rollups = ActivityRollup.objects.filter(period='day')
+    if user is not None:
+        rollups = rollups.filter(user=user)
+    if group_id is not None:
+        rollups = rollups.filter(group_id=group_id)
+    return rollups
+
+
+def summary(today, since, user=None, group_id=None):
+    """Activity totals (all time, today, since a day) from daily rollups in one query"""
+    totals = _scoped(user, group_id).aggregate(
+        total=Sum('count'),
+        today=Sum('count', filter=Q(bucket=day_start(today))),
+        since=Sum('count', filter=Q(bucket__gte=day_start(since))),
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def trends(since, user=None, group_id=None):
+    """Per-day, per-action counts since a day, shaped like the raw GROUP BY"""
+    rows = _scoped(user, group_id).filter(bucket__gte=day_start(since)).values(
+        'bucket', 'action'
+    ).annotate(count=Sum('count')).order_by('bucket', 'action')
+    return [
+        {'created_at__date': timezone.localtime(row['bucket']).date(), 'action': row['action'], 'count': row['count']}
+        for row in rows
+    ]
+
+
+def check(start, end, period='day', fix=False):
+    """
+    Compare rollups with raw counts over [start, end).
+
+    Returns a list of (bucket, user_id, action, rollup_count, raw_count)
+    mismatches; with fix=True the affected buckets are recomputed.
+    """
+    from .models import ActivityRollup
+
+    period_start, period_end = _aligned(start, end, period)
+    raw = raw_counts(period_start, period_end, period)
+    stored = Counter({
+        (row['bucket'], row['user_id'], row['action']): row['count']
+        for row in ActivityRollup.objects.filter(
+            period=period, bucket__gte=period_start, bucket__lt=period_end
+        ).values('bucket', 'user_id', 'action', 'count')
+    })
+    mismatches = sorted(
+        (key + (stored.get(key, 0), raw.get(key, 0)) for key in set(raw) | set(stored)
+         if stored.get(key, 0) != raw.get(key, 0)),
+        key=lambda item: (item[0], item[1], item[2])
+    )
+    if fix:
+        step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+        for bucket in sorted({item[0] for item in mismatches}):
+            recompute(bucket, bucket + step, periods=(period,))
+    return mismatches
@@ -1,4 +1,10 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import serializers
+from .reports import resolve as resolve_report
 from .models import (
     UserActivity, Metric, UserEngagement, ConversationAnalytics,
     OrderAnalytics, SystemPerformance, Report, DashboardWidget
@@ -16,9 +22,12 @@ class UserActivitySerializer(serializers.ModelSerializer):
         model = UserActivity
         fields = [
             'id', 'user', 'user_email', 'action', 'resource_type', 'resource_id',
-            'ip_address', 'user_agent', 'session_id', 'created_at', 'metadata'
+            'ip_address', 'user_agent', 'session_id', 'status_code', 'duration_ms',
+            'query_count', 'created_at', 'metadata'
         ]
-        read_only_fields = ['id', 'created_at', 'user_email']
+        read_only_fields = ['id', 'created_at', 'user_email', 'status_code', 'duration_ms', 'query_count']
+        # get_user_email reads the user
+        related_fields = ['user']
     
     def get_user_email(self, obj):
         try:
@@ -63,10 +72,15 @@ class ConversationAnalyticsSerializer(serializers.ModelSerializer):
         model = ConversationAnalytics
         fields = [
             'id', 'conversation', 'message_count', 'user_message_count',
-            'ai_message_count', 'avg_response_time', 'total_duration',
+            'ai_message_count', 'last_message_at', 'last_message_id',
+            'avg_response_time', 'total_duration',
             'satisfaction_score', 'intent_accuracy', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        # Counters are maintained from the messages (analytics.counters)
+        read_only_fields = [
+            'id', 'message_count', 'user_message_count', 'ai_message_count',
+            'last_message_at', 'last_message_id', 'created_at', 'updated_at'
+        ]
 
 
 class OrderAnalyticsSerializer(serializers.ModelSerializer):
@@ -107,9 +121,19 @@ class ReportSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'report_type', 'parameters', 'data',
             'generated_by', 'generated_by_email', 'file_path', 'file_size',
-            'is_ready', 'created_at', 'completed_at'
+            'is_ready', 'status', 'progress', 'row_count', 'error', 'created_at', 'completed_at'
+        ]
+        read_only_fields = [
+            'id', 'data', 'generated_by', 'generated_by_email', 'file_path', 'file_size', 'is_ready',
+            'status', 'progress', 'row_count', 'error', 'created_at', 'completed_at'
         ]
-        read_only_fields = ['id', 'created_at', 'generated_by_email', 'is_ready', 'completed_at']
+    
+    def validate(self, attrs):
+        try:
+            resolve_report(attrs.get('report_type'), attrs.get('parameters') or {})
+        except ValueError as e:
+            raise serializers.ValidationError({'parameters': str(e)})
+        return attrs
 
 
 class DashboardWidgetSerializer(serializers.ModelSerializer):
@@ -126,3 +150,89 @@ class DashboardWidgetSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'created_by_email']
+
+
+class MetricPointsField(serializers.Field):
+    """
+    [[timestamp, value], ...] pairs; timestamps are ISO 8601, epoch seconds or null (now)
+    """
+    
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or not data:
+            raise serializers.ValidationError('Expected a non-empty list of [timestamp, value] pairs.')
+        points = []
+        for item in data:
+            if not isinstance(item, (list, tuple)) or len(item) != 2:
+                raise serializers.ValidationError('Each point must be a [timestamp, value] pair.')
+            stamp, value = item
+            points.append((self._parse_time(stamp), self._parse_value(value)))
+        return points
+    
+    def _parse_value(self, value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            try:
+                number = float(value)
+            except OverflowError:
+                number = math.inf
+            # NaN and infinities would poison every rollup they land in
+            if math.isfinite(number):
+                return number
+        raise serializers.ValidationError(f"Invalid value: {value!r}")
+    
+    def _parse_time(self, stamp):
+        if stamp is None:
+            return None
+        try:
+            if isinstance(stamp, (int, float)) and not isinstance(stamp, bool):
+                return datetime.fromtimestamp(stamp, tz=dt_timezone.utc)
+            moment = parse_datetime(stamp) if isinstance(stamp, str) else None
+        except (OverflowError, ValueError, OSError):
+            # Out-of-range epochs and NaN, or well-formed but impossible dates
+            moment = None
+        if moment is None:
+            raise serializers.ValidationError(f"Invalid timestamp: {stamp!r}")
+        return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+class MetricSeriesPointsSerializer(serializers.Serializer):
+    """
+    Points of one metric
+    """
+    name = serializers.CharField(max_length=100)
+    category = serializers.CharField(max_length=50, required=False, allow_blank=True, default='')
+    points = MetricPointsField()
+
+class MetricIngestSerializer(serializers.Serializer):
+    """
+    Batched metric ingest: {"series": [{"name", "category", "points": [[ts, value], ...]}]}
+    """
+    series = MetricSeriesPointsSerializer(many=True, allow_empty=False)
+    
+    def validate(self, attrs):
+        total = sum(len(series['points']) for series in attrs['series'])
+        limit = settings.METRIC_INGEST_MAX_POINTS
+        if total > limit:
+            raise serializers.ValidationError(f"At most {limit} points per request")
+        return attrs
+
+
+class WidgetSourceRequestSerializer(serializers.Serializer):
+    """
+    Ad-hoc data request: a registered source, its parameters and the acceptable age
+    """
+    key = serializers.CharField(max_length=100)
+    source = serializers.CharField(max_length=100)
+    params = serializers.DictField(required=False, default=dict)
+    refresh_interval = serializers.IntegerField(required=False, default=60, min_value=0)
+
+class WidgetDataRequestSerializer(serializers.Serializer):
+    """
+    Batched widget data request; with neither field, every active widget of the user
+    """
+    widget_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    sources = WidgetSourceRequestSerializer(many=True, required=False, default=list)
+    
+    def validate(self, attrs):
+        limit = settings.WIDGET_DATA_MAX_REQUESTS
+        if len(attrs['widget_ids']) + len(attrs['sources']) > limit:
+            raise serializers.ValidationError(f"At most {limit} widgets and sources per request")
+        return attrs
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from order.models import Conversation, Message
+from . import counters
+
+
+@receiver(post_save, sender=Conversation)
+def create_conversation_counters(sender, instance, created, **kwargs):
+    """Give every new conversation its counters row"""
+    if created:
+        counters.create_counters(instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def count_message(sender, instance, created, **kwargs):
+    """Count a new message in the same transaction as its insert"""
+    if created:
+        counters.record_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def uncount_message(sender, instance, **kwargs):
+    counters.record_deleted_message(instance)
@@ -0,0 +1,45 @@
+import logging
+from celery import shared_task
+from . import reports, rollups, timeseries
+from .models import Report
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_activity_rollups():
+    """Rebuild the recent hourly and daily activity rollups from raw rows"""
+    written = rollups.refresh()
+    logger.info(f"Refreshed activity rollups ({written} rows)")
+    return written
+
+
+@shared_task
+def downsample_metrics():
+    """Fold recent raw metric points into the hourly, daily, weekly and monthly rollups"""
+    return timeseries.refresh()
+
+
+@shared_task
+def apply_metric_retention():
+    """Delete metric points and rollups past their retention"""
+    deleted = timeseries.apply_retention()
+    if deleted:
+        logger.info(f"Metric retention deleted {deleted}")
+    return deleted
+
+
+@shared_task
+def generate_report(report_id):
+    """Build the file of a pending report"""
+    try:
+        report = Report.objects.select_related('generated_by').get(id=report_id)
+    except Report.DoesNotExist:
+        logger.warning(f"Skipping generation of missing report {report_id}")
+        return None
+    try:
+        reports.build_report(report)
+    except Exception as e:
+        logger.error(f"Report {report_id} failed: {str(e)}")
+        return 'failed'
+    return 'completed'
@@ -0,0 +1,268 @@
+"""
+Metric time series.
+
+Raw samples are written in batches to ``MetricPoint`` (``ingest``) and
+downsampled into ``MetricRollup`` for each of ``Metric.PERIOD_CHOICES``:
+raw points -> hourly -> daily -> weekly and monthly. Each rollup keeps
+count, sum, min, max and the 95th percentile of its bucket. Hourly
+percentiles are exact (computed with NumPy from the raw values); coarser
+levels keep the highest p95 of their children, a conservative upper bound.
+
+The ``downsample_metrics`` beat task recomputes every bucket touched in the
+last ``METRIC_DOWNSAMPLE_LOOKBACK_HOURS`` so late points are folded in, and
+``apply_metric_retention`` drops raw points and rollups older than
+``METRIC_RETENTION_DAYS`` of their level. ``query_series`` returns series
+aligned on a common bucket list; the still-open bucket is aggregated on
+read from the level below.
+"""
+import logging
+from datetime import timedelta
+from itertools import groupby
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from core.partitions import add_months
+from core.utils import day_start
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('hourly', 'daily', 'weekly', 'monthly')
+
+# Level each period is downsampled from (None: raw points)
+SOURCES = {
+    'hourly': None,
+    'daily': 'hourly',
+    'weekly': 'daily',
+    'monthly': 'daily',
+}
+
+TRUNCATE = {
+    'hourly': TruncHour,
+    'daily': TruncDay,
+    'weekly': TruncWeek,
+    'monthly': TruncMonth,
+}
+
+STATS = ('count', 'min', 'max', 'avg', 'p95')
+
+# Range queried when a series request gives no start
+DEFAULT_WINDOWS = {
+    'hourly': timedelta(hours=24),
+    'daily': timedelta(days=30),
+    'weekly': timedelta(weeks=12),
+    'monthly': timedelta(days=365),
+}
+
+
+def bucket_floor(moment, period):
+    """Start of the bucket containing an aware datetime (weeks start on Monday)"""
+    local = timezone.localtime(moment)
+    if period == 'hourly':
+        return local.replace(minute=0, second=0, microsecond=0)
+    day = local.date()
+    if period == 'weekly':
+        day -= timedelta(days=day.weekday())
+    elif period == 'monthly':
+        day = day.replace(day=1)
+    return day_start(day)
+
+
+def next_bucket(bucket, period):
+    if period == 'hourly':
+        return bucket + timedelta(hours=1)
+    day = timezone.localtime(bucket).date()
+    if period == 'daily':
+        return day_start(day + timedelta(days=1))
+    if period == 'weekly':
+        return day_start(day + timedelta(days=7))
+    return day_start(add_months(day, 1))
+
+
+def bucket_starts(start, end, period):
+    """Starts of the buckets overlapping [start, end)"""
+    buckets = []
+    bucket = bucket_floor(start, period)
+    while bucket < end:
+        buckets.append(bucket)
+        bucket = next_bucket(bucket, period)
+    return buckets
+
+
+def ingest(points):
+    """Store raw points (dicts with name, value, optional category and recorded_at)"""
+    from .models import MetricPoint
+
+    now = timezone.now()
+    rows = [
+        MetricPoint(
+            name=point['name'], category=point.get('category', ''), value=point['value'],
+            recorded_at=point.get('recorded_at') or now
+        )
+        for point in points
+    ]
+    MetricPoint.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def record_metric(name, value, category=''):
+    """Store a single raw point recorded now"""
+    return ingest([{'name': name, 'value': value, 'category': category}])
+
+
+def _from_points(start, end, names=None):
+    from .models import MetricPoint
+
+    points = MetricPoint.objects.filter(recorded_at__gte=start, recorded_at__lt=end)
+    if names:
+        points = points.filter(name__in=names)
+    rows = points.annotate(bucket=TruncHour('recorded_at')).order_by('name', 'bucket').values_list(
+        'name', 'bucket', 'category', 'value'
+    )
+    results = []
+    for (name, bucket), group in groupby(rows.iterator(chunk_size=5000), key=lambda row: (row[0], row[1])):
+        group = list(group)
+        values = np.fromiter((row[3] for row in group), dtype=float, count=len(group))
+        results.append({
+            'name': name,
+            'bucket': bucket,
+            'category': group[-1][2],
+            'count': len(values),
+            'sum': float(values.sum()),
+            'min': float(values.min()),
+            'max': float(values.max()),
+            'p95': float(np.percentile(values, 95)),
+        })
+    return results
+
+
+def _from_rollups(source, period, start, end, names=None):
+    from .models import MetricRollup
+
+    rollups = MetricRollup.objects.filter(period=source, bucket__gte=start, bucket__lt=end)
+    if names:
+        rollups = rollups.filter(name__in=names)
+    # Aliases differ from the field names, which annotations may not shadow
+    rows = rollups.annotate(target=TRUNCATE[period]('bucket')).values('name', 'target').annotate(
+        last_category=Max('category'), n=Sum('count'), total=Sum('sum'),
+        low=Min('min'), high=Max('max'), upper_p95=Max('p95'),
+    ).order_by('name', 'target')
+    return [
+        {
+            'name': row['name'], 'bucket': row['target'], 'category': row['last_category'],
+            'count': row['n'], 'sum': row['total'], 'min': row['low'], 'max': row['high'],
+            'p95': row['upper_p95'],
+        }
+        for row in rows
+    ]
+
+
+def aggregate(period, start, end, names=None):
+    """Bucket statistics of a period over [start, end), computed from the level below"""
+    source = SOURCES[period]
+    if source is None:
+        return _from_points(start, end, names)
+    return _from_rollups(source, period, start, end, names)
+
+
+def downsample(period, start, end):
+    """Recompute and store a period's buckets overlapping [start, end); returns rows written"""
+    from .models import MetricRollup
+
+    buckets = bucket_starts(start, end, period)
+    if not buckets:
+        return 0
+    written = 0
+    # Hourly buckets are built from raw points, a day at a time to bound memory
+    step = 24 if period == 'hourly' else len(buckets)
+    for index in range(0, len(buckets), step):
+        window_start = buckets[index]
+        window_end = next_bucket(buckets[min(index + step, len(buckets)) - 1], period)
+        rows = [MetricRollup(period=period, **stats) for stats in aggregate(period, window_start, window_end)]
+        with transaction.atomic():
+            MetricRollup.objects.filter(period=period, bucket__gte=window_start, bucket__lt=window_end).delete()
+            MetricRollup.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
+
+
+def refresh(now=None):
+    """Downsample every bucket touched by the lookback window, finest level first"""
+    now = now or timezone.now()
+    since = now - timedelta(hours=getattr(settings, 'METRIC_DOWNSAMPLE_LOOKBACK_HOURS', 2))
+    return {period: downsample(period, since, now) for period in PERIODS}
+
+
+def apply_retention(now=None):
+    """Delete raw points and rollups past their retention; returns deleted counts"""
+    from .models import MetricPoint, MetricRollup
+
+    now = now or timezone.now()
+    retention = getattr(settings, 'METRIC_RETENTION_DAYS', {})
+    deleted = {}
+    for level in ('raw',) + PERIODS:
+        days = retention.get(level)
+        if not days:
+            continue
+        cutoff = now - timedelta(days=days)
+        if level == 'raw':
+            deleted[level], _ = MetricPoint.objects.filter(recorded_at__lt=cutoff).delete()
+        else:
+            deleted[level], _ = MetricRollup.objects.filter(period=level, bucket__lt=cutoff).delete()
+    return deleted
+
+
+def query_series(names, period, start, end, stats=STATS):
+    """
+    Aligned series of the named metrics over [start, end).
+
+    Returns {'buckets': [...], 'series': [{'name', 'category', <stat>: [...]}]}
+    where every stat list has one value (or None) per bucket.
+    """
+    from .models import MetricRollup
+
+    buckets = bucket_starts(start, end, period)
+    limit = getattr(settings, 'METRIC_SERIES_MAX_BUCKETS', 2000)
+    if len(buckets) > limit:
+        raise ValueError(f"At most {limit} buckets per query; narrow the range or use a coarser period")
+    if not buckets:
+        return {'buckets': [], 'series': []}
+    positions = {bucket: index for index, bucket in enumerate(buckets)}
+    range_end = next_bucket(buckets[-1], period)
+    open_bucket = bucket_floor(timezone.now(), period)
+
+    rows = list(MetricRollup.objects.filter(
+        name__in=names, period=period, bucket__gte=buckets[0], bucket__lt=min(range_end, open_bucket)
+    ).values('name', 'category', 'bucket', 'count', 'sum', 'min', 'max', 'p95'))
+    if buckets[0] <= open_bucket < range_end:
+        rows.extend(aggregate(period, open_bucket, next_bucket(open_bucket, period), names))
+
+    fields = ('count', 'sum', 'min', 'max', 'p95')
+    arrays = {name: {field: np.full(len(buckets), np.nan) for field in fields} for name in names}
+    categories = {}
+    for row in rows:
+        index = positions.get(bucket_floor(row['bucket'], period))
+        if index is None:
+            continue
+        categories[row['name']] = row['category']
+        for field in fields:
+            arrays[row['name']][field][index] = row[field]
+
+    series = []
+    for name in names:
+        values = arrays[name]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values['avg'] = values['sum'] / values['count']
+        values['count'] = np.nan_to_num(values['count'])
+        entry = {'name': name, 'category': categories.get(name, '')}
+        for stat in stats:
+            if stat == 'count':
+                entry[stat] = values['count'].astype(int).tolist()
+            else:
+                entry[stat] = [None if np.isnan(value) else round(float(value), 6) for value in values[stat]]
+        series.append(entry)
+    return {'buckets': [bucket.isoformat() for bucket in buckets], 'series': series}
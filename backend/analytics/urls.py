@@ -3,7 +3,7 @@ from .views import (
     # User Activity
     UserActivityListView, UserActivityDetailView,
     # Metrics
-    MetricListView, MetricDetailView,
+    MetricListView, MetricDetailView, MetricIngestView, MetricSeriesView,
     # User Engagement
     UserEngagementListView, UserEngagementDetailView,
     # Conversation Analytics
@@ -13,9 +13,9 @@ from .views import (
     # System Performance
     SystemPerformanceListView, SystemPerformanceDetailView,
     # Reports
-    ReportListView, ReportDetailView,
+    ReportListView, ReportDetailView, ReportDownloadView,
     # Dashboard Widgets
-    DashboardWidgetListView, DashboardWidgetDetailView,
+    DashboardWidgetListView, DashboardWidgetDetailView, WidgetDataView, WidgetDataSourceListView,
     # Summary Views
     AnalyticsSummaryView, ActivityTrendsView,
 )
@@ -30,6 +30,8 @@ urlpatterns = [
     # Metric endpoints
     path('metrics/', MetricListView.as_view(), name='metric-list'),
     path('metrics/<int:pk>/', MetricDetailView.as_view(), name='metric-detail'),
+    path('metrics/ingest/', MetricIngestView.as_view(), name='metric-ingest'),
+    path('metrics/series/', MetricSeriesView.as_view(), name='metric-series'),
     
     # User Engagement endpoints
     path('engagement/', UserEngagementListView.as_view(), name='user-engagement-list'),
@@ -50,10 +52,13 @@ urlpatterns = [
     # Report endpoints
     path('reports/', ReportListView.as_view(), name='report-list'),
     path('reports/<int:pk>/', ReportDetailView.as_view(), name='report-detail'),
+    path('reports/<int:pk>/download/', ReportDownloadView.as_view(), name='report-download'),
     
     # Dashboard Widget endpoints
     path('widgets/', DashboardWidgetListView.as_view(), name='dashboard-widget-list'),
     path('widgets/<int:pk>/', DashboardWidgetDetailView.as_view(), name='dashboard-widget-detail'),
+    path('widgets/data/', WidgetDataView.as_view(), name='dashboard-widget-data'),
+    path('widgets/data-sources/', WidgetDataSourceListView.as_view(), name='dashboard-widget-data-sources'),
     
     # Summary endpoints
     path('summary/', AnalyticsSummaryView.as_view(), name='analytics-summary'),
@@ -1,9 +1,22 @@
 from rest_framework import generics, status, permissions
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db import transaction
 from django.db.models import Count, Avg, Sum, Q
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.utils.text import slugify
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from datetime import timedelta
+from core.pagination import ActivityKeysetPagination
+from core.permissions import IsAdminOrSuperAdmin
+from core.query_shaping import QueryShapingMixin
+from core.utils import day_params_filter, day_start
+from . import reports, rollups, timeseries, widgets
+from .tasks import generate_report
 from .models import (
     UserActivity, Metric, UserEngagement, ConversationAnalytics,
     OrderAnalytics, SystemPerformance, Report, DashboardWidget
@@ -11,20 +24,35 @@ from .models import (
 from .serializers import (
     UserActivitySerializer, MetricSerializer, UserEngagementSerializer,
     ConversationAnalyticsSerializer, OrderAnalyticsSerializer,
-    SystemPerformanceSerializer, ReportSerializer, DashboardWidgetSerializer
+    SystemPerformanceSerializer, ReportSerializer, DashboardWidgetSerializer,
+    MetricIngestSerializer, WidgetDataRequestSerializer
 )
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Read size of streamed report downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _dispatch_report(report_id):
+    """Queue report generation, running it inline if the broker is unreachable"""
+    try:
+        generate_report.delay(report_id)
+    except Exception as e:
+        logger.error(f"Could not queue report generation, running inline: {str(e)}")
+        generate_report(report_id)
+
 
 # User Activity Views
 class UserActivityListView(generics.ListCreateAPIView):
     """
     List and create user activities
-    Supports pagination and limit parameter for recent activities
+    Supports keyset pagination (?cursor=, ?since_cursor=) and limit parameter for recent activities
     """
     serializer_class = UserActivitySerializer
+    pagination_class = ActivityKeysetPagination
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
@@ -35,26 +63,27 @@ class UserActivityListView(generics.ListCreateAPIView):
         if user and hasattr(user, 'role') and user.role not in ['admin', 'superadmin']:
             queryset = queryset.filter(user=user)
         
-        return queryset
+        # Optional ?since=/&until= days, as created_at ranges
+        return queryset.filter(**day_params_filter('created_at', self.request.query_params))
     
     def get(self, request, *args, **kwargs):
         try:
             queryset = self.get_queryset()
             
-            # Support limit parameter for dashboard
+            # Support limit parameter for dashboard (a plain list of the latest rows)
             limit = request.query_params.get('limit')
             if limit:
                 try:
-                    queryset = queryset[:int(limit)]
+                    return Response(self.get_serializer(queryset[:int(limit)], many=True).data)
                 except (ValueError, TypeError):
                     pass
             
-            # Check if queryset is empty
-            if not queryset.exists():
-                return Response([])
-            
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
+            # Otherwise keyset pages, newest first
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        except NotFound:
+            raise
         except Exception as e:
             import traceback
             error_traceback = traceback.format_exc()
@@ -69,7 +98,7 @@ class UserActivityListView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class UserActivityDetailView(generics.RetrieveAPIView):
+class UserActivityDetailView(QueryShapingMixin, generics.RetrieveAPIView):
     """
     Retrieve user activity
     """
@@ -84,7 +113,7 @@ class UserActivityDetailView(generics.RetrieveAPIView):
 
 
 # Metric Views
-class MetricListView(generics.ListCreateAPIView):
+class MetricListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create metrics
     """
@@ -96,7 +125,7 @@ class MetricListView(generics.ListCreateAPIView):
         serializer.save()
 
 
-class MetricDetailView(generics.RetrieveAPIView):
+class MetricDetailView(QueryShapingMixin, generics.RetrieveAPIView):
     """
     Retrieve metric
     """
@@ -105,8 +134,77 @@ class MetricDetailView(generics.RetrieveAPIView):
     queryset = Metric.objects.all()
 
 
+class MetricIngestView(generics.GenericAPIView):
+    """
+    Write batched raw metric points
+    """
+    serializer_class = MetricIngestSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrSuperAdmin]
+    
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        points = [
+            {'name': series['name'], 'category': series['category'], 'recorded_at': recorded_at, 'value': value}
+            for series in serializer.validated_data['series']
+            for recorded_at, value in series['points']
+        ]
+        return Response({'ingested': timeseries.ingest(points)}, status=status.HTTP_201_CREATED)
+
+
+class MetricSeriesView(APIView):
+    """
+    Aligned metric series from the downsampled rollups
+    ?name=<metric> (repeatable or comma-separated), &period=hourly|daily|weekly|monthly,
+    &since=/&until= (ISO datetime or date), &stats=count,min,max,avg,p95
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def _parse_time(self, value):
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            return day_start(day) if day else None
+        return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+    
+    def get(self, request):
+        params = request.query_params
+        names = list(dict.fromkeys(
+            name.strip() for value in params.getlist('name') for name in value.split(',') if name.strip()
+        ))
+        period = params.get('period', 'hourly')
+        stats = [stat.strip() for stat in params.get('stats', ','.join(timeseries.STATS)).split(',') if stat.strip()]
+        if not names:
+            return Response({'error': 'name is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if period not in timeseries.PERIODS:
+            return Response({'error': f"period must be one of {', '.join(timeseries.PERIODS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not stats or set(stats) - set(timeseries.STATS):
+            return Response({'error': f"stats must be among {', '.join(timeseries.STATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            until = self._parse_time(params['until']) if params.get('until') else timezone.now()
+            since = self._parse_time(params['since']) if params.get('since') else until - timeseries.DEFAULT_WINDOWS[period]
+        except ValueError:
+            since = until = None
+        if since is None or until is None or since >= until:
+            return Response({'error': 'since and until must be ISO datetimes or dates, since before until'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            result = timeseries.query_series(names, period, since, until, stats)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'period': period,
+            'start': since.isoformat(),
+            'end': until.isoformat(),
+            **result
+        })
+
+
 # User Engagement Views
-class UserEngagementListView(generics.ListCreateAPIView):
+class UserEngagementListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create user engagement metrics
     """
@@ -123,7 +221,7 @@ class UserEngagementListView(generics.ListCreateAPIView):
         serializer.save()
 
 
-class UserEngagementDetailView(generics.RetrieveUpdateAPIView):
+class UserEngagementDetailView(QueryShapingMixin, generics.RetrieveUpdateAPIView):
     """
     Retrieve and update user engagement
     """
@@ -138,7 +236,7 @@ class UserEngagementDetailView(generics.RetrieveUpdateAPIView):
 
 
 # Conversation Analytics Views
-class ConversationAnalyticsListView(generics.ListCreateAPIView):
+class ConversationAnalyticsListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create conversation analytics
     """
@@ -147,7 +245,7 @@ class ConversationAnalyticsListView(generics.ListCreateAPIView):
     queryset = ConversationAnalytics.objects.all()
 
 
-class ConversationAnalyticsDetailView(generics.RetrieveUpdateAPIView):
+class ConversationAnalyticsDetailView(QueryShapingMixin, generics.RetrieveUpdateAPIView):
     """
     Retrieve and update conversation analytics
     """
@@ -157,7 +255,7 @@ class ConversationAnalyticsDetailView(generics.RetrieveUpdateAPIView):
 
 
 # Order Analytics Views
-class OrderAnalyticsListView(generics.ListCreateAPIView):
+class OrderAnalyticsListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create order analytics
     """
@@ -166,7 +264,7 @@ class OrderAnalyticsListView(generics.ListCreateAPIView):
     queryset = OrderAnalytics.objects.all()
 
 
-class OrderAnalyticsDetailView(generics.RetrieveUpdateAPIView):
+class OrderAnalyticsDetailView(QueryShapingMixin, generics.RetrieveUpdateAPIView):
     """
     Retrieve and update order analytics
     """
@@ -176,7 +274,7 @@ class OrderAnalyticsDetailView(generics.RetrieveUpdateAPIView):
 
 
 # System Performance Views
-class SystemPerformanceListView(generics.ListCreateAPIView):
+class SystemPerformanceListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create system performance metrics
     """
@@ -185,7 +283,7 @@ class SystemPerformanceListView(generics.ListCreateAPIView):
     queryset = SystemPerformance.objects.all()
 
 
-class SystemPerformanceDetailView(generics.RetrieveAPIView):
+class SystemPerformanceDetailView(QueryShapingMixin, generics.RetrieveAPIView):
     """
     Retrieve system performance metric
     """
@@ -195,7 +293,7 @@ class SystemPerformanceDetailView(generics.RetrieveAPIView):
 
 
 # Report Views
-class ReportListView(generics.ListCreateAPIView):
+class ReportListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create reports
     """
@@ -209,10 +307,11 @@ class ReportListView(generics.ListCreateAPIView):
         return Report.objects.filter(generated_by=user)
     
     def perform_create(self, serializer):
-        serializer.save(generated_by=self.request.user)
+        report = serializer.save(generated_by=self.request.user)
+        transaction.on_commit(lambda: _dispatch_report(report.id))
 
 
-class ReportDetailView(generics.RetrieveAPIView):
+class ReportDetailView(QueryShapingMixin, generics.RetrieveAPIView):
     """
     Retrieve report
     """
@@ -226,8 +325,49 @@ class ReportDetailView(generics.RetrieveAPIView):
         return Report.objects.filter(generated_by=user)
 
 
+async def _file_chunks(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Read a file in fixed-size chunks off the event loop.
+
+    Under ASGI Django reads a sync iterator (as FileResponse has) to the
+    end before sending anything; an async one is sent chunk by chunk, so
+    memory stays bounded whatever the file size.
+    """
+    handle = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        while True:
+            chunk = await sync_to_async(handle.read, thread_sensitive=False)(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(handle.close, thread_sensitive=False)()
+
+
+class ReportDownloadView(ReportDetailView):
+    """
+    Stream the file of a generated report
+    """
+    
+    def get(self, request, *args, **kwargs):
+        report = self.get_object()
+        if not report.is_ready or not report.file_path or not os.path.exists(report.file_path):
+            return Response({
+                'error': 'Report is not ready',
+                'status': report.status,
+                'progress': report.progress,
+            }, status=status.HTTP_409_CONFLICT)
+        filename = f"{slugify(report.name) or 'report'}-{report.pk}{reports.report_extension(report)}"
+        response = StreamingHttpResponse(
+            _file_chunks(report.file_path), content_type=reports.report_content_type(report)
+        )
+        response['Content-Length'] = str(os.path.getsize(report.file_path))
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+
 # Dashboard Widget Views
-class DashboardWidgetListView(generics.ListCreateAPIView):
+class DashboardWidgetListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create dashboard widgets
     """
@@ -244,7 +384,7 @@ class DashboardWidgetListView(generics.ListCreateAPIView):
         serializer.save(created_by=self.request.user)
 
 
-class DashboardWidgetDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DashboardWidgetDetailView(QueryShapingMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete dashboard widget
     """
@@ -258,6 +398,61 @@ class DashboardWidgetDetailView(generics.RetrieveUpdateDestroyAPIView):
         return DashboardWidget.objects.filter(created_by=user)
 
 
+class WidgetDataView(generics.GenericAPIView):
+    """
+    Resolve the data of many dashboard widgets in one request
+    {"widget_ids": [...], "sources": [{"key", "source", "params", "refresh_interval"}]}
+    """
+    serializer_class = WidgetDataRequestSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        user = self.request.user
+        if user.role in ['admin', 'superadmin']:
+            return DashboardWidget.objects.filter(is_active=True)
+        return DashboardWidget.objects.filter(created_by=user, is_active=True)
+    
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        widget_list = self.get_queryset()
+        if data['widget_ids']:
+            widget_list = widget_list.filter(id__in=data['widget_ids'])
+        elif data['sources']:
+            widget_list = widget_list.none()
+        widget_list = list(widget_list)
+        
+        # Widget keys are their ids; ad-hoc keys are namespaced so they cannot collide
+        results = widgets.resolve(
+            request.user,
+            [widgets.widget_request(widget) for widget in widget_list]
+            + [dict(source, key=f"source:{source['key']}") for source in data['sources']]
+        )
+        return Response({
+            'widgets': {
+                str(widget.pk): dict(results[str(widget.pk)], name=widget.name, widget_type=widget.widget_type)
+                for widget in widget_list
+            },
+            'sources': {source['key']: results[f"source:{source['key']}"] for source in data['sources']},
+            'timestamp': timezone.now().isoformat()
+        })
+
+
+class WidgetDataSourceListView(APIView):
+    """
+    List the registered widget data sources
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        return Response([
+            {'name': source.name, 'scope': source.scope, 'params': source.params, 'description': source.description}
+            for source in widgets.data_sources.all()
+        ])
+
+
 # Analytics Summary Views
 class AnalyticsSummaryView(APIView):
     """
@@ -272,15 +467,9 @@ class AnalyticsSummaryView(APIView):
         last_7_days = today - timedelta(days=7)
         last_30_days = today - timedelta(days=30)
         
-        # User activity stats
-        if user.role in ['admin', 'superadmin']:
-            total_activities = UserActivity.objects.count()
-            activities_today = UserActivity.objects.filter(created_at__date=today).count()
-            activities_7_days = UserActivity.objects.filter(created_at__date__gte=last_7_days).count()
-        else:
-            total_activities = UserActivity.objects.filter(user=user).count()
-            activities_today = UserActivity.objects.filter(user=user, created_at__date=today).count()
-            activities_7_days = UserActivity.objects.filter(user=user, created_at__date__gte=last_7_days).count()
+        # User activity stats from the daily rollups (one aggregate over a small table)
+        scope = None if user.role in ['admin', 'superadmin'] else user
+        activity_totals = rollups.summary(today, last_7_days, user=scope)
         
         # Engagement stats
         if user.role in ['admin', 'superadmin']:
@@ -300,9 +489,9 @@ class AnalyticsSummaryView(APIView):
         
         return Response({
             'user_activity': {
-                'total': total_activities,
-                'today': activities_today,
-                'last_7_days': activities_7_days,
+                'total': activity_totals['total'],
+                'today': activity_totals['today'],
+                'last_7_days': activity_totals['since'],
             },
             'engagement': {
                 'page_views': engagement_data.get('total_page_views', 0) or 0,
@@ -325,19 +514,12 @@ class ActivityTrendsView(APIView):
         days = int(request.query_params.get('days', 7))
         start_date = timezone.now().date() - timedelta(days=days)
         
-        # Get activity trends
-        if user.role in ['admin', 'superadmin']:
-            activities = UserActivity.objects.filter(
-                created_at__date__gte=start_date
-            ).values('created_at__date', 'action').annotate(count=Count('id'))
-        else:
-            activities = UserActivity.objects.filter(
-                user=user,
-                created_at__date__gte=start_date
-            ).values('created_at__date', 'action').annotate(count=Count('id'))
+        # Get activity trends from the daily rollups
+        scope = None if user.role in ['admin', 'superadmin'] else user
+        activities = rollups.trends(start_date, user=scope)
         
         return Response({
             'period': f'{days} days',
             'start_date': start_date.isoformat(),
-            'trends': list(activities)
+            'trends': activities
         })
@@ -0,0 +1,230 @@
+"""
+Dashboard widget data.
+
+Data sources are registered by name with ``register_data_source``; a
+``DashboardWidget.data_source`` names one and its ``configuration``
+supplies the source's parameters. ``resolve`` answers many widgets (or
+ad-hoc source requests) at once:
+
+- each result is cached for the requesting widget's ``refresh_interval``;
+- the cache key is (source, scope, parameters), where the scope is what
+  the source lets the user see (everything, their group, or their own
+  rows), so identical widgets of users sharing a scope share one result;
+- identical requests within a batch are computed once, and all cached
+  results are fetched in one ``get_many`` round trip.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core.dashboard import get_stats, scope_for as group_scope
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'widget_data'
+
+
+def _user_scope(user):
+    # Row-level sources: admins see everything, other users their own rows
+    if user.role in ['admin', 'superadmin']:
+        return {}
+    return {'user_id': user.pk}
+
+
+SCOPES = {
+    'global': lambda user: {},
+    'group': group_scope,
+    'user': _user_scope,
+}
+
+
+class DataSource:
+    """
+    A named function producing widget data for a scope and parameters
+    """
+
+    def __init__(self, name, func, scope='user', params=None, description=''):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown data source scope: {scope}")
+        self.name = name
+        self.func = func
+        self.scope = scope
+        # Accepted parameters and their defaults; other configuration keys are ignored
+        self.params = params or {}
+        self.description = description
+
+    def clean(self, params):
+        params = params or {}
+        return {key: params.get(key, default) for key, default in self.params.items()}
+
+    def __call__(self, scope, params):
+        return self.func(scope, **params)
+
+
+class DataSourceRegistry:
+    """
+    Data sources available to dashboard widgets
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, scope='user', params=None, description=''):
+        """Decorator registering func(scope, **params) as a data source"""
+        def decorator(func):
+            with self._lock:
+                self._sources[name] = DataSource(name, func, scope, params, description or (func.__doc__ or '').strip())
+            return func
+        return decorator
+
+    def get(self, name):
+        return self._sources.get(name)
+
+    def all(self):
+        return sorted(self._sources.values(), key=lambda source: source.name)
+
+
+data_sources = DataSourceRegistry()
+register_data_source = data_sources.register
+
+
+def cache_key(source, scope, params):
+    fingerprint = hashlib.sha1(
+        json.dumps([scope, params], sort_keys=True, cls=DjangoJSONEncoder).encode('utf-8')
+    ).hexdigest()[:20]
+    return f"{KEY_PREFIX}:{source}:{fingerprint}"
+
+
+def resolve(user, requests):
+    """
+    Resolve data requests for a user.
+
+    ``requests`` are dicts with key, source, params and refresh_interval;
+    returns {key: {'data', 'cached', 'computed_at'} or {'error'}}.
+    """
+    now = time.time()
+    results = {}
+    planned = []
+    for request in requests:
+        source = data_sources.get(request['source'])
+        if source is None:
+            results[request['key']] = {'error': f"Unknown data source: {request['source']}"}
+            continue
+        scope = SCOPES[source.scope](user)
+        params = source.clean(request.get('params'))
+        planned.append((request, source, scope, params, cache_key(source.name, scope, params)))
+
+    try:
+        cached = cache.get_many({key for *_, key in planned})
+    except Exception as e:
+        logger.error(f"Could not read cached widget data: {str(e)}")
+        cached = {}
+
+    computed = {}
+    for request, source, scope, params, key in planned:
+        entry = cached.get(key)
+        is_cached = entry is not None and now - entry['computed_at'] <= request['refresh_interval']
+        if not is_cached:
+            entry = computed.get(key)
+            if entry is None:
+                try:
+                    entry = {'data': source(scope, params), 'computed_at': now}
+                except Exception as e:
+                    logger.error(f"Widget data source '{source.name}' failed: {str(e)}")
+                    results[request['key']] = {'error': str(e)}
+                    continue
+                computed[key] = entry
+        results[request['key']] = {
+            'data': entry['data'],
+            'cached': is_cached,
+            'computed_at': datetime.fromtimestamp(entry['computed_at'], tz=dt_timezone.utc).isoformat(),
+        }
+
+    if computed:
+        try:
+            cache.set_many(computed, timeout=getattr(settings, 'WIDGET_DATA_CACHE_TTL', 3600))
+        except Exception as e:
+            logger.error(f"Could not cache widget data: {str(e)}")
+    return results
+
+
+def widget_request(widget):
+    """Data request of a DashboardWidget"""
+    return {
+        'key': str(widget.pk),
+        'source': widget.data_source,
+        'params': widget.configuration,
+        'refresh_interval': widget.refresh_interval,
+    }
+
+
+# Built-in data sources
+
+def _activity_user(scope):
+    return scope.get('user_id')
+
+
+@register_data_source('dashboard_stats', scope='group')
+def dashboard_stats(scope):
+    """User, order and conversation totals (the dashboard stats snapshot)"""
+    return get_stats(**scope)
+
+
+@register_data_source('activity_summary', scope='user')
+def activity_summary(scope):
+    """Activity totals: all time, today and the last 7 days"""
+    from . import rollups
+
+    today = timezone.localdate()
+    totals = rollups.summary(today, today - timedelta(days=7), user=_activity_user(scope))
+    return {'total': totals['total'], 'today': totals['today'], 'last_7_days': totals['since']}
+
+
+@register_data_source('activity_trends', scope='user', params={'days': 7})
+def activity_trends(scope, days):
+    """Activity counts per day and action"""
+    from . import rollups
+
+    days = max(1, min(int(days), 366))
+    return rollups.trends(timezone.localdate() - timedelta(days=days), user=_activity_user(scope))
+
+
+@register_data_source('recent_activity', scope='user', params={'limit': 10})
+def recent_activity(scope, limit):
+    """Latest user activities"""
+    from .models import UserActivity
+    from .serializers import UserActivitySerializer
+
+    activities = UserActivity.objects.select_related('user').order_by('-created_at')
+    if scope.get('user_id'):
+        activities = activities.filter(user_id=scope['user_id'])
+    limit = max(1, min(int(limit), 100))
+    return [dict(item) for item in UserActivitySerializer(activities[:limit], many=True).data]
+
+
+@register_data_source('metric_series', scope='global',
+                      params={'names': [], 'period': 'hourly', 'stats': None})
+def metric_series(scope, names, period, stats):
+    """Aligned metric series over the period's default window"""
+    from . import timeseries
+
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(',') if name.strip()]
+    if not names:
+        raise ValueError('metric_series needs names')
+    if period not in timeseries.PERIODS:
+        raise ValueError(f"period must be one of {', '.join(timeseries.PERIODS)}")
+    stats = stats or timeseries.STATS
+    if set(stats) - set(timeseries.STATS):
+        raise ValueError(f"stats must be among {', '.join(timeseries.STATS)}")
+    end = timezone.now()
+    return timeseries.query_series(list(dict.fromkeys(names)), period, end - timeseries.DEFAULT_WINDOWS[period], end, stats)
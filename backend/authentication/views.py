@@ -13,7 +13,7 @@ from .serializers import (
     PasswordChangeSerializer, UserPermissionSerializer, UserProfileUpdateSerializer
 )
 from .permissions import IsAdminOrSuperAdmin, CanManageUser
-from analytics.models import UserActivity
+from analytics.middleware import track_activity, annotate_activity
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,6 +25,7 @@ class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     permission_classes = [permissions.AllowAny]
     
+    @track_activity('create', resource_type='user')
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -33,14 +34,10 @@ class UserRegistrationView(generics.CreateAPIView):
         # Create token for the new user
         token, created = Token.objects.get_or_create(user=user)
         
-        # Track user registration activity
-        UserActivity.objects.create(
+        annotate_activity(
+            request,
             user=user,
-            action='create',
-            resource_type='user',
             resource_id=user.id,
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
             metadata={'registration_method': 'api'}
         )
         
@@ -57,6 +54,7 @@ class UserLoginView(generics.GenericAPIView):
     serializer_class = UserLoginSerializer
     permission_classes = [permissions.AllowAny]
     
+    @track_activity('login', resource_type='auth')
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -65,9 +63,6 @@ class UserLoginView(generics.GenericAPIView):
         # Create or get token
         token, created = Token.objects.get_or_create(user=user)
         
-        # Update last login
-        user.last_login = user.__class__.objects.get(id=user.id).last_login
-        
         # Create session record
         session_key = request.session.session_key
         if session_key:
@@ -83,15 +78,7 @@ class UserLoginView(generics.GenericAPIView):
         # Log the login
         logger.info(f"User {user.email} logged in from {request.META.get('REMOTE_ADDR')}")
         
-        # Track login activity
-        UserActivity.objects.create(
-            user=user,
-            action='login',
-            resource_type='auth',
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            session_id=session_key or ''
-        )
+        annotate_activity(request, user=user, session_id=session_key or '')
         
         return Response({
             'user': UserSerializer(user).data,
@@ -105,6 +92,7 @@ class UserLogoutView(generics.GenericAPIView):
     """
     permission_classes = [permissions.IsAuthenticated]
     
+    @track_activity('logout', resource_type='auth')
     def post(self, request, *args, **kwargs):
         try:
             # Delete token
@@ -118,14 +106,7 @@ class UserLogoutView(generics.GenericAPIView):
             # Log the logout
             logger.info(f"User {request.user.email} logged out")
             
-            # Track logout activity
-            UserActivity.objects.create(
-                user=request.user,
-                action='logout',
-                resource_type='auth',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT', '')
-            )
+            annotate_activity(request, session_id='')
             
             return Response({'message': 'Logout successful.'}, status=status.HTTP_200_OK)
         except Exception as e:
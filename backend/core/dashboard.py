@@ -0,0 +1,172 @@
+"""
+Cached dashboard statistics.
+
+``compute_stats`` builds the ``DashboardStatsView`` payload with three
+queries, one per model, using conditional aggregation (``Count(...,
+filter=Q(...))``) and a status GROUP BY that also yields the totals.
+
+Snapshots are cached per scope: everything for superadmins, otherwise the
+user's group (or only their own rows when they have no group). A snapshot
+is fresh for ``DASHBOARD_STATS_TTL`` seconds; after that it is still served
+for up to ``DASHBOARD_STATS_STALE_TTL`` seconds while one background thread
+recomputes it (stale-while-revalidate). The ``refresh_dashboard_stats``
+beat task keeps the global and per-group snapshots warm.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .utils import day_range, day_start
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'dashboard_stats'
+
+# Seconds a revalidation lock is held, in case the refreshing thread dies
+REFRESH_LOCK_TIMEOUT = 60
+
+
+def scope_for(user):
+    """Snapshot scope (group_id / user_id kwargs) a user may see"""
+    if user.role == 'superadmin':
+        return {}
+    if user.group_id:
+        return {'group_id': user.group_id}
+    return {'user_id': user.pk}
+
+
+def cache_key(group_id=None, user_id=None):
+    if group_id:
+        return f"{KEY_PREFIX}:group:{group_id}"
+    if user_id:
+        return f"{KEY_PREFIX}:user:{user_id}"
+    return f"{KEY_PREFIX}:all"
+
+
+def _distribution(rows, *fields):
+    """Status -> count, plus per-field totals, from status GROUP BY rows"""
+    totals = {field: 0 for field in fields}
+    distribution = {}
+    for row in rows:
+        distribution[row['status']] = row['total']
+        for field in fields:
+            totals[field] += row[field]
+    return distribution, totals
+
+
+def compute_stats(group_id=None, user_id=None):
+    """Dashboard statistics for a scope, in three queries"""
+    from authentication.models import User
+    from order.models import Order, Conversation
+
+    now = timezone.now()
+    today = timezone.localdate(now)
+    today_start, today_end = day_range(today)
+    week_start = day_start(today - timedelta(days=7))
+    is_today = lambda field: Q(**{f'{field}__gte': today_start, f'{field}__lt': today_end})  # noqa: E731
+
+    users = User.objects.all()
+    orders = Order.objects.all()
+    conversations = Conversation.objects.all()
+    if group_id:
+        users = users.filter(group_id=group_id)
+        orders = orders.filter(user__group_id=group_id)
+        conversations = conversations.filter(user__group_id=group_id)
+    elif user_id:
+        users = users.filter(pk=user_id)
+        orders = orders.filter(user_id=user_id)
+        conversations = conversations.filter(user_id=user_id)
+
+    user_stats = users.aggregate(
+        total=Count('id'),
+        active_today=Count('id', filter=is_today('last_login')),
+        new_7_days=Count('id', filter=Q(date_joined__gte=week_start)),
+    )
+    order_distribution, order_totals = _distribution(
+        orders.order_by().values('status').annotate(
+            total=Count('id'),
+            today=Count('id', filter=is_today('created_at')),
+            last_7_days=Count('id', filter=Q(created_at__gte=week_start)),
+        ),
+        'total', 'today', 'last_7_days'
+    )
+    conversation_distribution, conversation_totals = _distribution(
+        conversations.order_by().values('status').annotate(
+            total=Count('id'),
+            today=Count('id', filter=is_today('started_at')),
+        ),
+        'total', 'today'
+    )
+
+    return {
+        'users': user_stats,
+        'orders': {
+            'total': order_totals['total'],
+            'today': order_totals['today'],
+            'last_7_days': order_totals['last_7_days'],
+            'status_distribution': order_distribution,
+        },
+        'conversations': {
+            'total': conversation_totals['total'],
+            'active': conversation_distribution.get('active', 0),
+            'today': conversation_totals['today'],
+            'status_distribution': conversation_distribution,
+        },
+        'timestamp': now.isoformat()
+    }
+
+
+def refresh(group_id=None, user_id=None):
+    """Recompute and cache a scope's snapshot; returns the stats"""
+    stats = compute_stats(group_id, user_id)
+    try:
+        cache.set(
+            cache_key(group_id, user_id),
+            {'stats': stats, 'refreshed_at': time.time()},
+            timeout=getattr(settings, 'DASHBOARD_STATS_STALE_TTL', 600)
+        )
+    except Exception as e:
+        logger.error(f"Could not cache dashboard stats: {str(e)}")
+    return stats
+
+
+def _revalidate(group_id, user_id):
+    key = cache_key(group_id, user_id)
+    # Only one worker refreshes a stale snapshot at a time
+    if not cache.add(f"{key}:refreshing", 1, timeout=REFRESH_LOCK_TIMEOUT):
+        return
+
+    def run():
+        try:
+            refresh(group_id, user_id)
+        except Exception as e:
+            logger.error(f"Dashboard stats refresh failed for {key}: {str(e)}")
+        finally:
+            cache.delete(f"{key}:refreshing")
+            connections.close_all()
+
+    threading.Thread(target=run, name='dashboard-stats-refresh', daemon=True).start()
+
+
+def get_stats(group_id=None, user_id=None):
+    """Cached snapshot of a scope, computed inline only when there is none"""
+    try:
+        entry = cache.get(cache_key(group_id, user_id))
+    except Exception as e:
+        logger.error(f"Could not read cached dashboard stats: {str(e)}")
+        return compute_stats(group_id, user_id)
+    if entry is None:
+        return refresh(group_id, user_id)
+    if time.time() - entry['refreshed_at'] > getattr(settings, 'DASHBOARD_STATS_TTL', 30):
+        try:
+            _revalidate(group_id, user_id)
+        except Exception as e:
+            logger.error(f"Could not schedule dashboard stats refresh: {str(e)}")
+    return entry['stats']
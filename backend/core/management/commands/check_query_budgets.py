@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from analytics.models import ConversationAnalytics, DashboardWidget, Report, UserActivity
+from authentication.models import User
+from core.models import AuditLog, FileUpload, Notification
+from order.models import Conversation, Message, Order, OrderDocument
+
+# (URL name, URL kwargs from the seeded fixture, maximum queries per request)
+BUDGETS = [
+    ('order:order-list', None, 2),
+    ('order:order-detail', lambda fixture: {'pk': fixture['order'].pk}, 1),
+    ('order:conversation-list', None, 2),
+    ('order:conversation-detail', lambda fixture: {'pk': fixture['conversation'].pk}, 1),
+    ('order:message-list', lambda fixture: {'conversation_id': fixture['conversation'].pk}, 2),
+    ('order:chat-history', lambda fixture: {'conversation_id': fixture['conversation'].pk}, 2),
+    ('order:document-list', lambda fixture: {'order_id': fixture['order'].pk}, 2),
+    ('core:notification-list', None, 2),
+    ('core:audit-log-list', None, 2),
+    ('core:file-upload', None, 2),
+    ('analytics:report-list', None, 2),
+    ('analytics:dashboard-widget-list', None, 2),
+    ('analytics:user-activity-list', None, 2),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that list/detail endpoints stay within their query budgets and do not '
+        'issue more queries as rows grow (seeds fixtures in a transaction that is rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs=2, default=[2, settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)],
+                            metavar=('SMALL', 'LARGE'), help='Rows seeded for the two measurements')
+        parser.add_argument('--endpoint', action='append', help='Only check this URL name (repeatable)')
+
+    def handle(self, *args, **options):
+        budgets = [budget for budget in BUDGETS if not options['endpoint'] or budget[0] in options['endpoint']]
+        if not budgets:
+            raise CommandError('No matching endpoints')
+        counts = {name: [] for name, _, _ in budgets}
+        for rows in options['rows']:
+            try:
+                with transaction.atomic():
+                    fixture = self._seed(rows)
+                    for name, kwargs, _ in budgets:
+                        counts[name].append(self._measure(fixture['user'], name, kwargs(fixture) if kwargs else {}))
+                    raise Rollback
+            except Rollback:
+                pass
+
+        failed = False
+        for name, _, budget in budgets:
+            small, large = counts[name]
+            if large > budget or large != small:
+                failed = True
+                self.stdout.write(self.style.ERROR(
+                    f"{name}: {small} queries with {options['rows'][0]} rows, "
+                    f"{large} with {options['rows'][1]} (budget {budget})"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{name}: {large} queries (budget {budget})"))
+        if failed:
+            raise CommandError('Query budgets exceeded')
+
+    def _measure(self, user, name, kwargs):
+        path = reverse(name, kwargs=kwargs)
+        request = APIRequestFactory().get(path)
+        force_authenticate(request, user=user)
+        match = resolve(path)
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = match.func(request, *match.args, **match.kwargs)
+            response.render()
+        if response.status_code != 200:
+            raise CommandError(f"{name} returned {response.status_code}: {response.content[:200]!r}")
+        return len(queries)
+
+    def _seed(self, rows):
+        user = User.objects.create_user(
+            email='query-budget@example.invalid', username='query-budget', password=None, role='superadmin'
+        )
+        others = [
+            User.objects.create_user(email=f'query-budget-{index}@example.invalid', username=f'query-budget-{index}')
+            for index in range(rows)
+        ]
+        conversations = Conversation.objects.bulk_create([
+            Conversation(user=other, conversation_type='chat') for other in others
+        ])
+        # bulk_create skips the signals that create the counters rows
+        ConversationAnalytics.objects.bulk_create([
+            ConversationAnalytics(conversation=conversation) for conversation in conversations
+        ])
+        orders = Order.objects.bulk_create([
+            Order(user=other, order_type='loan', conversation=conversation, assigned_to=user)
+            for other, conversation in zip(others, conversations)
+        ])
+        Message.objects.bulk_create([
+            Message(conversation=conversations[0], sender=other, sender_type='user', content='hello')
+            for other in others
+        ])
+        OrderDocument.objects.bulk_create([
+            OrderDocument(order=orders[0], document_type='identity', file='order_documents/query-budget.pdf',
+                          original_name='query-budget.pdf', file_size=1, mime_type='application/pdf',
+                          uploaded_by=other)
+            for other in others
+        ])
+        Notification.objects.bulk_create([Notification(title='t', message='m', user=other) for other in others])
+        AuditLog.objects.bulk_create([AuditLog(user=other, action='create') for other in others])
+        FileUpload.objects.bulk_create([
+            FileUpload(file='uploads/query-budget.txt', original_name='query-budget.txt', file_type='document',
+                       file_size=1, mime_type='text/plain', uploaded_by=other)
+            for other in others
+        ])
+        Report.objects.bulk_create([Report(name='r', report_type='order', generated_by=other) for other in others])
+        DashboardWidget.objects.bulk_create([
+            DashboardWidget(name='w', widget_type='metric', data_source='dashboard_stats', created_by=other)
+            for other in others
+        ])
+        UserActivity.objects.bulk_create([UserActivity(user=other, action='login') for other in others])
+        return {'user': user, 'order': orders[0], 'conversation': conversations[0]}
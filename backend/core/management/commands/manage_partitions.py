@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.partitions import PARTITIONED_TABLES, PartitionManager
+
+
+class Command(BaseCommand):
+    help = 'List, pre-create, detach or archive monthly partitions of the log tables (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'ensure', 'detach', 'archive'])
+        parser.add_argument('--table', action='append', choices=sorted(PARTITIONED_TABLES),
+                            help='Limit to this table (repeatable; default: all)')
+        parser.add_argument('--months-ahead', type=int, default=settings.PARTITION_MONTHS_AHEAD,
+                            help='ensure: create partitions through this many future months')
+        parser.add_argument('--keep-months', type=int, default=settings.PARTITION_RETENTION_MONTHS,
+                            help='detach/archive: keep this many months before the current one')
+        parser.add_argument('--archive-dir', default=str(settings.PARTITION_ARCHIVE_DIR),
+                            help='archive: directory for the gzipped CSV exports')
+        parser.add_argument('--dry-run', action='store_true', help='detach/archive: only show what would happen')
+
+    def handle(self, *args, **options):
+        manager = PartitionManager()
+        if manager.connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('Partitioning needs PostgreSQL; nothing to do.'))
+            return
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months must be at least 1')
+
+        for table in options['table'] or sorted(PARTITIONED_TABLES):
+            if not manager.enabled(table):
+                self.stdout.write(self.style.WARNING(f"{table} is not partitioned (run migrate)"))
+                continue
+            action = options['action']
+            if action == 'list':
+                for month, name in manager.partitions(table):
+                    self.stdout.write(f"{table}\t{month:%Y-%m}\t{name}")
+            elif action == 'ensure':
+                created = manager.ensure(table, options['months_ahead'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"{table}: created {', '.join(created)}" if created else f"{table}: up to date"
+                ))
+            else:
+                for month, name in manager.expired(table, options['keep_months']):
+                    if options['dry_run']:
+                        self.stdout.write(f"Would {action} {name}")
+                    elif action == 'detach':
+                        manager.detach(table, name)
+                        self.stdout.write(self.style.SUCCESS(f"Detached {name}"))
+                    else:
+                        path = manager.archive(table, name, options['archive_dir'])
+                        self.stdout.write(self.style.SUCCESS(f"Archived {name} to {path}"))
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def partition_auditlog(apps, schema_editor):
+    from core.partitions import convert_to_partitioned
+
+    convert_to_partitioned(schema_editor.connection, 'core_auditlog')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        # PostgreSQL only: monthly range partitions on created_at (see core.partitions)
+        migrations.RunPython(partition_auditlog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,190 @@
+"""
+Keyset (cursor) pagination.
+
+``PageNumberPagination`` pays for OFFSET and a COUNT(*) on every page, so
+deep pages of long conversations and activity feeds get slower the further
+a user scrolls. ``KeysetPagination`` orders on ``(created_at, id)`` and
+seeks past the last row seen instead, which an index on those columns
+(after any equality filter, e.g. ``(conversation_id, created_at, id)``)
+answers directly at any depth.
+
+Cursors are opaque (url-safe base64 of the boundary row's position):
+
+- ``?cursor=`` pages through the view's ordering; responses carry
+  ``next`` / ``previous`` links;
+- ``?since_cursor=`` returns only rows newer than a position, oldest
+  first, so a chat client can poll for new messages. Every response has a
+  ``since_cursor`` to pass back: the newest row it returned (or the one it
+  was given when nothing is new).
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(position, reverse=False):
+    data = {'t': position[0].isoformat(), 'i': position[1]}
+    if reverse:
+        data['r'] = 1
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value):
+    """((created_at, id), reverse) of a cursor; raises ValueError when malformed"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        created_at = parse_datetime(data['t'])
+        position = (created_at, int(data['i']))
+        reverse = bool(data.get('r'))
+    except (TypeError, ValueError, KeyError, AttributeError):
+        raise ValueError('Invalid cursor')
+    if created_at is None or created_at.tzinfo is None:
+        raise ValueError('Invalid cursor')
+    return position, reverse
+
+
+def seek(queryset, position, ascending, field='created_at'):
+    """Rows strictly after a (field, id) position in the given direction"""
+    value, pk = position
+    if ascending:
+        # The leading range condition is what lets the index bound the scan
+        return queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk}),
+                               **{f'{field}__gte': value})
+    return queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}),
+                           **{f'{field}__lte': value})
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination seeking on (created_at, id)
+    """
+    field = 'created_at'
+    # Newest first when False
+    ascending = True
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    since_query_param = 'since_cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _decode(self, request, param):
+        value = request.query_params.get(param)
+        if not value:
+            return None, False
+        try:
+            return decode_cursor(value)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _position(self, row):
+        return (getattr(row, self.field), row.pk)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        self.since_mode = self.since_query_param in request.query_params
+        self.next_position = self.previous_position = None
+
+        if self.since_mode:
+            position, _ = self._decode(request, self.since_query_param)
+            if position is not None:
+                queryset = seek(queryset, position, True, self.field)
+            rows = list(queryset.order_by(self.field, 'id')[:size + 1])
+            has_more = len(rows) > size
+            rows = rows[:size]
+            self.latest = self._position(rows[-1]) if rows else position
+            if has_more:
+                self.next_position = self.latest
+            return rows
+
+        position, reverse = self._decode(request, self.cursor_query_param)
+        # Previous pages are fetched by walking the ordering backwards
+        ascending = self.ascending != reverse
+        if position is not None:
+            queryset = seek(queryset, position, ascending, self.field)
+        prefix = '' if ascending else '-'
+        rows = list(queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+        # Going forward, more rows mean a next page and a cursor means a previous one;
+        # going backward it is the other way round
+        has_next, has_previous = (position is not None, has_more) if reverse else (has_more, position is not None)
+        if rows:
+            if has_next:
+                self.next_position = self._position(rows[-1])
+            if has_previous:
+                self.previous_position = self._position(rows[0])
+        elif reverse:
+            self.next_position = position
+        else:
+            self.previous_position = position
+        self.latest = max(self._position(row) for row in rows) if rows else None
+        return rows
+
+    def _link(self, param, position, reverse=False):
+        if position is None:
+            return None
+        url = remove_query_param(remove_query_param(self.base_url, self.cursor_query_param), self.since_query_param)
+        return replace_query_param(url, param, encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        if self.since_mode:
+            return self._link(self.since_query_param, self.next_position)
+        return self._link(self.cursor_query_param, self.next_position)
+
+    def get_previous_link(self):
+        return self._link(self.cursor_query_param, self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('since_cursor', encode_cursor(self.latest) if self.latest else None),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        link = {'type': 'string', 'nullable': True, 'format': 'uri'}
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': link,
+                'previous': link,
+                'since_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class MessageKeysetPagination(KeysetPagination):
+    """
+    Messages oldest first, as a conversation reads
+    """
+    ascending = True
+
+
+class ActivityKeysetPagination(KeysetPagination):
+    """
+    Activity feeds newest first
+    """
+    ascending = False
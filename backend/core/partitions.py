@@ -0,0 +1,239 @@
+"""
+Monthly range partitioning for append-only log tables (PostgreSQL).
+
+``PARTITIONED_TABLES`` lists each table with its partition key. Once a
+table is converted (``convert_to_partitioned``, run by the migrations of
+its app), rows live in one partition per calendar month, named
+``<table>_pYYYYMM``, plus ``<table>_default`` for anything outside the
+months that exist. Queries that bound the key with a range (see
+``core.utils.day_range``) only touch the matching months.
+
+``PartitionManager`` creates upcoming months ahead of time, and detaches
+or archives (COPY to a gzipped CSV, then drop) old ones; the
+``manage_partitions`` command wraps it. On other database backends every
+operation is a no-op.
+"""
+import gzip
+import logging
+import os
+from datetime import date
+
+from django.db import connection as default_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = {
+    'analytics_useractivity': 'created_at',
+    'core_auditlog': 'created_at',
+}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def _quote(connection, name):
+    return connection.ops.quote_name(name)
+
+
+def _relkind(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c "
+            "WHERE c.relname = %s AND c.relnamespace = 'public'::regnamespace", [table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def is_partitioned(connection, table):
+    """Whether a table exists as a partitioned (parent) table"""
+    return connection.vendor == 'postgresql' and _relkind(connection, table) == 'p'
+
+
+def convert_to_partitioned(connection, table, key='created_at'):
+    """
+    Rebuild a plain table as a monthly range-partitioned one, keeping its rows.
+
+    The primary key becomes (id, key), as PostgreSQL requires the
+    partition key in every unique constraint; ids continue from the
+    current maximum. Indexes, check constraints and foreign keys are
+    recreated on the parent, which propagates them to every partition.
+    Tables with other unique constraints or indexes are refused: they would
+    come back without the partition key, which PostgreSQL rejects.
+    """
+    # Only plain tables are converted (the table may not exist on this database)
+    if connection.vendor != 'postgresql' or _relkind(connection, table) != 'r':
+        return
+    legacy = f"{table}_unpartitioned"
+    qn = lambda name: _quote(connection, name)  # noqa: E731
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = %s::regclass AND i.indisunique AND NOT i.indisprimary", [table]
+        )
+        unique = [row[0] for row in cursor.fetchall()]
+        if unique:
+            raise ValueError(
+                f"Cannot partition {table}: unique constraints or indexes {', '.join(unique)} "
+                f"do not include the partition key {key}"
+            )
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [table]
+        )
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [table]
+        )
+        identity = bool(cursor.fetchone()[0])
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(f"ALTER TABLE {qn(legacy)} RENAME CONSTRAINT {qn(primary_key)} TO {qn(legacy + '_pkey')}")
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [legacy, legacy + '_pkey']
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('f', 'c')", [legacy]
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(f"SELECT min({qn(key)}), max({qn(key)}) FROM {qn(legacy)}")
+        first, last = cursor.fetchone()
+
+        # Identity columns get a fresh sequence; serial defaults keep the old one
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING IDENTITY, "
+            f"PRIMARY KEY (id, {qn(key)})) PARTITION BY RANGE ({qn(key)})"
+        )
+        if not identity:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [legacy])
+            sequence = cursor.fetchone()[0]
+            if sequence:
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id")
+        cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+
+        manager = PartitionManager(connection)
+        today = month_start(date.today())
+        month = month_start(first.date()) if first else today
+        end = max(month_start(last.date()) if last else today, today)
+        while month <= end:
+            manager._create(cursor, table, key, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {qn(table)} OVERRIDING SYSTEM VALUE SELECT * FROM {qn(legacy)}")
+        if identity:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                f"(SELECT COALESCE(max(id), 0) + 1 FROM {qn(table)}), false)", [table]
+            )
+        cursor.execute(f"DROP TABLE {qn(legacy)}")
+        for name, definition in indexes:
+            cursor.execute(definition.replace(f" ON public.{legacy} ", f" ON public.{table} ")
+                           .replace(f" ON {legacy} ", f" ON {table} "))
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+
+
+class PartitionManager:
+    """
+    Creates, lists, detaches and archives monthly partitions
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection or default_connection
+
+    def enabled(self, table):
+        return is_partitioned(self.connection, table)
+
+    def partitions(self, table):
+        """Attached monthly partitions of a table as [(month, name)], oldest first"""
+        if not self.enabled(table):
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = %s::regclass ORDER BY c.relname", [table]
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        prefix = f"{table}_p"
+        result = []
+        for name in names:
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+                result.append((date(int(suffix[:4]), int(suffix[4:]), 1), name))
+        return result
+
+    def ensure(self, table, months_ahead=3, today=None):
+        """Create partitions from this month through months_ahead; returns the new names"""
+        if not self.enabled(table):
+            return []
+        key = PARTITIONED_TABLES.get(table, 'created_at')
+        existing = {month for month, _ in self.partitions(table)}
+        current = month_start(today or date.today())
+        created = []
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if month in existing:
+                continue
+            with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+                self._create(cursor, table, key, month)
+            created.append(partition_name(table, month))
+        return created
+
+    def _create(self, cursor, table, key, month):
+        # Build, fill from the default partition, then attach, so rows that
+        # landed in the default partition move to their month. Writers are
+        # locked out until commit: a row inserted into the default partition
+        # after the move would make ATTACH fail. Must run in a transaction.
+        name = partition_name(table, month)
+        qn = lambda value: _quote(self.connection, value)  # noqa: E731
+        start, end = month.isoformat(), add_months(month, 1).isoformat()
+        cursor.execute(f"LOCK TABLE {qn(table)} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(table + '_default')} "
+            f"WHERE {qn(key)} >= %s AND {qn(key)} < %s RETURNING *) "
+            f"INSERT INTO {qn(name)} SELECT * FROM moved", [start, end]
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)",
+            [start, end]
+        )
+        logger.info(f"Created partition {name}")
+
+    def expired(self, table, keep_months, today=None):
+        """Partitions entirely older than the last keep_months months"""
+        cutoff = add_months(month_start(today or date.today()), -keep_months)
+        return [(month, name) for month, name in self.partitions(table) if month < cutoff]
+
+    def detach(self, table, name):
+        """Detach a partition; its rows stay in a standalone table"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {_quote(self.connection, table)} "
+                f"DETACH PARTITION {_quote(self.connection, name)}"
+            )
+        logger.info(f"Detached partition {name}")
+
+    def archive(self, table, name, directory):
+        """Detach a partition, write its rows to <directory>/<name>.csv.gz and drop it"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.csv.gz")
+        self.detach(table, name)
+        with self.connection.cursor() as cursor, gzip.open(path, 'wt', newline='') as handle:
+            # copy_expert is psycopg2's COPY interface, reached through Django's cursor wrapper
+            cursor.copy_expert(f"COPY {_quote(self.connection, name)} TO STDOUT WITH CSV HEADER", handle)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {_quote(self.connection, name)}")
+        logger.info(f"Archived partition {name} to {path}")
+        return path
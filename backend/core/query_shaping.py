@@ -0,0 +1,110 @@
+"""
+Queryset shaping from serializer declarations.
+
+``shape_queryset(queryset, serializer_class)`` adds the joins and
+annotations a serializer needs, so serializing a page costs a fixed number
+of queries instead of one or more per row:
+
+- every declared field whose source walks a relation (``user.email``,
+  nested serializers, ``many=True`` related fields) gets a
+  ``select_related`` path, or a ``prefetch_related`` path when the
+  relation is multi-valued; plain primary-key related fields need neither;
+- ``Meta.related_fields`` adds paths for what fields cannot declare, such
+  as relations read inside a SerializerMethodField;
+- ``Meta.annotations`` (name -> expression) is annotated onto the
+  queryset; method fields read the annotation when present, e.g.
+  ``user_count = Count('users')``.
+
+Generic views get this through ``QueryShapingMixin``; the
+``check_query_budgets`` command verifies the result per endpoint.
+"""
+import functools
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+def _relation_path(model, attrs):
+    """(path segments that are relations, whether any is multi-valued)"""
+    path, many = [], False
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        path.append(attr)
+        many = many or field.many_to_many or field.one_to_many
+        model = field.related_model
+    return path, many, model
+
+
+def _collect(serializer, model, prefix, many_prefix, select, prefetch):
+    for field in serializer.fields.values():
+        if field.source == '*' or getattr(field, 'source_attrs', None) is None:
+            continue
+        attrs = field.source_attrs
+        # Primary-key related fields read the <name>_id column, no join
+        if isinstance(field, RelatedField) and field.use_pk_only_optimization() and len(attrs) == 1:
+            continue
+        path, many, related_model = _relation_path(model, attrs)
+        if isinstance(field, ManyRelatedField):
+            many = True
+        if not path:
+            continue
+        full_path = prefix + path
+        is_many = many_prefix or many
+        (prefetch if is_many else select).add('__'.join(full_path))
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.Serializer):
+            _collect(nested, related_model, full_path, is_many, select, prefetch)
+
+
+@functools.lru_cache(maxsize=None)
+def query_plan(serializer_class):
+    """(select_related paths, prefetch_related paths, annotations) of a ModelSerializer"""
+    meta = getattr(serializer_class, 'Meta', None)
+    model = getattr(meta, 'model', None)
+    if model is None:
+        return (), (), {}
+    select, prefetch = set(), set()
+    _collect(serializer_class(), model, [], False, select, prefetch)
+    for path in getattr(meta, 'related_fields', ()):
+        _, many, _ = _relation_path(model, path.split('__'))
+        (prefetch if many else select).add(path)
+    # A select path already covered by a longer one is redundant
+    select = {path for path in select if not any(other.startswith(path + '__') for other in select)}
+    return tuple(sorted(select)), tuple(sorted(prefetch)), dict(getattr(meta, 'annotations', {}))
+
+
+def shape_queryset(queryset, serializer_class):
+    """Apply a serializer's query plan to a queryset of its model"""
+    if not isinstance(queryset, QuerySet) or queryset._fields is not None:
+        return queryset
+    model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    if model is None or not issubclass(queryset.model, model):
+        return queryset
+    select, prefetch, annotations = query_plan(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    annotations = {name: value for name, value in annotations.items() if name not in queryset.query.annotations}
+    if annotations:
+        # Meta.ordering is not applied to GROUP BY queries, so make it explicit
+        if not queryset.query.order_by and queryset.query.default_ordering and queryset.model._meta.ordering:
+            queryset = queryset.order_by(*queryset.model._meta.ordering)
+        queryset = queryset.annotate(**annotations)
+    return queryset
+
+
+class QueryShapingMixin:
+    """
+    Shapes the view's queryset for its serializer before listing or retrieving
+    """
+
+    def filter_queryset(self, queryset):
+        return shape_queryset(super().filter_queryset(queryset), self.get_serializer_class())
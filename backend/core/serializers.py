@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.db.models import Count
 from .models import (
     Group, APIConfiguration, SystemSetting, FileUpload,
     Notification, AuditLog
@@ -18,9 +19,12 @@ class GroupSerializer(serializers.ModelSerializer):
             'created_by_email', 'is_active', 'settings', 'user_count'
         ]
         read_only_fields = ['id', 'created_at', 'created_by_email', 'user_count']
+        # Annotated by core.query_shaping for list/detail views
+        annotations = {'user_count': Count('users')}
     
     def get_user_count(self, obj):
-        return obj.users.count()
+        count = getattr(obj, 'user_count', None)
+        return obj.users.count() if count is None else count
 
 class APIConfigurationSerializer(serializers.ModelSerializer):
     """
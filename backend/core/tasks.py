@@ -0,0 +1,30 @@
+import logging
+from celery import shared_task
+from django.conf import settings
+from . import dashboard
+from .models import Group
+from .partitions import PARTITIONED_TABLES, PartitionManager
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def ensure_partitions():
+    """Create the upcoming monthly partitions of the log tables"""
+    manager = PartitionManager()
+    created = []
+    for table in PARTITIONED_TABLES:
+        created.extend(manager.ensure(table, settings.PARTITION_MONTHS_AHEAD))
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+
+@shared_task
+def refresh_dashboard_stats():
+    """Recompute the global and per-group dashboard snapshots"""
+    dashboard.refresh()
+    group_ids = list(Group.objects.filter(is_active=True).values_list('id', flat=True))
+    for group_id in group_ids:
+        dashboard.refresh(group_id=group_id)
+    return len(group_ids) + 1
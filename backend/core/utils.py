@@ -0,0 +1,40 @@
+"""
+Shared helpers for date-bounded queries.
+
+Filtering with ``created_at__date=...`` wraps the column in a cast, so
+PostgreSQL can use neither the ``created_at`` indexes nor partition
+pruning. These helpers turn calendar days into half-open ``[start, end)``
+datetime ranges in the current time zone instead.
+"""
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+def day_start(day):
+    """Aware datetime at the start of a date in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def day_range(day, days=1):
+    """(start, end) bounds covering ``days`` calendar days from ``day``"""
+    return day_start(day), day_start(day + timedelta(days=days))
+
+
+def _parse_day(value):
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
+
+
+def day_params_filter(field, params):
+    """Range filter kwargs from optional ?since= / ?until= days (YYYY-MM-DD, both inclusive)"""
+    filters = {}
+    since, until = _parse_day(params.get('since')), _parse_day(params.get('until'))
+    if since is not None:
+        filters[f'{field}__gte'] = day_start(since)
+    if until is not None:
+        filters[f'{field}__lt'] = day_start(until + timedelta(days=1))
+    return filters
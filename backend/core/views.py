@@ -15,12 +15,14 @@ from .serializers import (
 )
 from .permissions import IsAdminOrSuperAdmin
 from .services import FileProcessingService, NotificationService
+from .query_shaping import QueryShapingMixin
+from .utils import day_params_filter
 import logging
 
 logger = logging.getLogger(__name__)
 
 # API Configuration Views
-class APIConfigurationListView(generics.ListCreateAPIView):
+class APIConfigurationListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create API configurations
     """
@@ -39,7 +41,7 @@ class APIConfigurationListView(generics.ListCreateAPIView):
         else:
             serializer.save(created_by=self.request.user)
 
-class APIConfigurationDetailView(generics.RetrieveUpdateDestroyAPIView):
+class APIConfigurationDetailView(QueryShapingMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete API configuration
     """
@@ -53,7 +55,7 @@ class APIConfigurationDetailView(generics.RetrieveUpdateDestroyAPIView):
         return APIConfiguration.objects.filter(group=user.group)
 
 # System Setting Views
-class SystemSettingListView(generics.ListCreateAPIView):
+class SystemSettingListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create system settings
     """
@@ -61,7 +63,7 @@ class SystemSettingListView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminOrSuperAdmin]
     queryset = SystemSetting.objects.all()
 
-class SystemSettingDetailView(generics.RetrieveUpdateDestroyAPIView):
+class SystemSettingDetailView(QueryShapingMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete system setting
     """
@@ -73,7 +75,7 @@ class SystemSettingDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_object_or_404(SystemSetting, key=key)
 
 # File Upload Views
-class FileUploadView(generics.ListCreateAPIView):
+class FileUploadView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     Upload and list files
     """
@@ -102,7 +104,7 @@ class FileUploadView(generics.ListCreateAPIView):
                 **processed_file
             )
 
-class FileUploadDetailView(generics.RetrieveDestroyAPIView):
+class FileUploadDetailView(QueryShapingMixin, generics.RetrieveDestroyAPIView):
     """
     Retrieve or delete uploaded file
     """
@@ -116,7 +118,7 @@ class FileUploadDetailView(generics.RetrieveDestroyAPIView):
         return FileUpload.objects.filter(uploaded_by=user)
 
 # Notification Views
-class NotificationListView(generics.ListAPIView):
+class NotificationListView(QueryShapingMixin, generics.ListAPIView):
     """
     List notifications
     """
@@ -133,7 +135,7 @@ class NotificationListView(generics.ListAPIView):
             models.Q(user__isnull=True, group__isnull=True)
         )
 
-class NotificationDetailView(generics.RetrieveAPIView):
+class NotificationDetailView(QueryShapingMixin, generics.RetrieveAPIView):
     """
     Retrieve notification details
     """
@@ -163,79 +165,29 @@ class NotificationMarkReadView(generics.GenericAPIView):
         return Response({'message': 'Notification marked as read'})
 
 # Audit Log Views
-class AuditLogListView(generics.ListAPIView):
+class AuditLogListView(QueryShapingMixin, generics.ListAPIView):
     """
     List audit logs
     """
     serializer_class = AuditLogSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrSuperAdmin]
-    queryset = AuditLog.objects.all()
+    
+    def get_queryset(self):
+        # Optional ?since=/&until= days; range predicates let PostgreSQL prune partitions
+        return AuditLog.objects.filter(**day_params_filter('created_at', self.request.query_params))
 
 # Dashboard Views
 class DashboardStatsView(generics.GenericAPIView):
     """
     Get dashboard statistics
+    Served from a cached snapshot scoped to the user's group (see core.dashboard)
     """
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        from datetime import datetime, timedelta
-        from django.db.models import Count, Avg, Sum
-        from order.models import Order, Conversation
-        from authentication.models import User
-        
-        # Time ranges
-        now = timezone.now()
-        today = now.date()
-        last_7_days = today - timedelta(days=7)
-        last_30_days = today - timedelta(days=30)
-        
-        # User stats
-        total_users = User.objects.count()
-        active_users_today = User.objects.filter(last_login__date=today).count()
-        new_users_7_days = User.objects.filter(date_joined__date__gte=last_7_days).count()
+        from .dashboard import get_stats, scope_for
         
-        # Order stats
-        total_orders = Order.objects.count()
-        orders_today = Order.objects.filter(created_at__date=today).count()
-        orders_7_days = Order.objects.filter(created_at__date__gte=last_7_days).count()
-        
-        # Conversation stats
-        total_conversations = Conversation.objects.count()
-        active_conversations = Conversation.objects.filter(status='active').count()
-        conversations_today = Conversation.objects.filter(started_at__date=today).count()
-        
-        # Status distribution
-        order_status_distribution = dict(
-            Order.objects.values_list('status').annotate(count=Count('status'))
-        )
-        
-        conversation_status_distribution = dict(
-            Conversation.objects.values_list('status').annotate(count=Count('status'))
-        )
-        
-        stats = {
-            'users': {
-                'total': total_users,
-                'active_today': active_users_today,
-                'new_7_days': new_users_7_days,
-            },
-            'orders': {
-                'total': total_orders,
-                'today': orders_today,
-                'last_7_days': orders_7_days,
-                'status_distribution': order_status_distribution,
-            },
-            'conversations': {
-                'total': total_conversations,
-                'active': active_conversations,
-                'today': conversations_today,
-                'status_distribution': conversation_status_distribution,
-            },
-            'timestamp': now.isoformat()
-        }
-        
-        return Response(stats)
+        return Response(get_stats(**scope_for(request.user)))
 
 class SystemHealthView(generics.GenericAPIView):
     """
@@ -280,11 +232,15 @@ class SystemHealthView(generics.GenericAPIView):
         except Exception:
             cache_health = False
         
+        # Buffered activity logging (events waiting, written, dropped)
+        from analytics.recorder import activity_recorder
+        
         health_status = {
             'database': db_health,
             'cache': cache_health,
             'system': system_health is not None,
             'system_resources': system_health,
+            'activity_buffer': activity_recorder.stats(),
             'overall': db_health and cache_health and system_health is not None,
             'timestamp': timezone.now().isoformat()
         }
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class KnowledgeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'knowledge'
\ No newline at end of file
+    name = 'knowledge'
+
+    def ready(self):
+        from . import signals  # noqa: F401
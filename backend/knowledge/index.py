@@ -0,0 +1,193 @@
+"""
+In-process inverted index over knowledge entries.
+
+Each worker keeps one index per group (group entries plus global entries)
+and ranks matches with BM25. Indexes are built lazily on first use, kept
+current by the signal handlers in ``knowledge.signals`` and rebuilt after
+``KNOWLEDGE_INDEX_MAX_AGE`` seconds so that edits made in other worker
+processes are eventually picked up.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'for',
+    'from', 'i', 'if', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or',
+    'our', 'so', 'that', 'the', 'this', 'to', 'was', 'we', 'what', 'with',
+    'you', 'your',
+])
+
+
+def _stem(token):
+    """Strip common English suffixes so 'loans'/'loan' share a term"""
+    if len(token) > 5 and token.endswith('ing'):
+        return token[:-3]
+    if len(token) > 4 and token.endswith('ed'):
+        return token[:-2]
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercase and split text into index terms"""
+    return [_stem(token) for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class KnowledgeIndex:
+    """
+    Inverted index (term -> {entry id: term frequency}) with BM25 scoring
+    """
+
+    def __init__(self, group_id=None, k1=1.5, b=0.75):
+        self.group_id = group_id
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.built_at = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def covers(self, entry):
+        """Whether an entry belongs in this group's index"""
+        return entry.group_id is None or entry.group_id == self.group_id
+
+    def add(self, entry):
+        """Add or replace an entry"""
+        terms = Counter(tokenize(f"{entry.title} {entry.content}"))
+        with self._lock:
+            self._remove(entry.pk)
+            for term, frequency in terms.items():
+                self.postings[term][entry.pk] = frequency
+            length = sum(terms.values())
+            self.doc_lengths[entry.pk] = length
+            self.total_length += length
+            self.documents[entry.pk] = {
+                'id': entry.pk,
+                'title': entry.title,
+                'content': entry.content,
+                'category': entry.category,
+                'version': entry.version,
+                'terms': tuple(terms),
+            }
+
+    def remove(self, entry_id):
+        """Remove an entry if present"""
+        with self._lock:
+            self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        document = self.documents.pop(entry_id, None)
+        if document is None:
+            return
+        for term in document['terms']:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(entry_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(entry_id, 0)
+
+    def search(self, query, limit=3):
+        """Return the best matching entries for a free-text query, best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            doc_count = len(self.documents)
+            if not terms or not doc_count:
+                return []
+            avg_length = self.total_length / doc_count or 1.0
+            scores = defaultdict(float)
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for entry_id, frequency in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[entry_id] / avg_length)
+                    scores[entry_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            results = []
+            for entry_id, score in ranked:
+                document = self.documents[entry_id]
+                results.append({
+                    'id': entry_id,
+                    'title': document['title'],
+                    'content': document['content'],
+                    'category': document['category'],
+                    'version': document['version'],
+                    'score': round(score, 4),
+                })
+            return results
+
+
+class KnowledgeIndexRegistry:
+    """
+    Per-worker registry of group indexes
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, group_id):
+        """Return the index for a group, building it if missing or expired"""
+        max_age = getattr(settings, 'KNOWLEDGE_INDEX_MAX_AGE', 300)
+        index = self._indexes.get(group_id)
+        if index is not None and time.monotonic() - index.built_at < max_age:
+            return index
+
+        with self._lock:
+            index = self._indexes.get(group_id)
+            if index is None or time.monotonic() - index.built_at >= max_age:
+                index = self._build(group_id)
+                self._indexes[group_id] = index
+            return index
+
+    def _build(self, group_id):
+        from .models import KnowledgeEntry
+
+        index = KnowledgeIndex(group_id)
+        entries = KnowledgeEntry.objects.filter(is_active=True).filter(
+            Q(group_id=group_id) | Q(group__isnull=True)
+        ).only('id', 'title', 'content', 'category', 'group', 'version')
+        for entry in entries.iterator():
+            index.add(entry)
+        return index
+
+    def entry_saved(self, entry):
+        """Apply an entry insert/update to every loaded index"""
+        for index in list(self._indexes.values()):
+            if entry.is_active and index.covers(entry):
+                index.add(entry)
+            else:
+                index.remove(entry.pk)
+
+    def entry_deleted(self, entry_id):
+        """Drop a deleted entry from every loaded index"""
+        for index in list(self._indexes.values()):
+            index.remove(entry_id)
+
+    def clear(self):
+        """Forget all loaded indexes"""
+        with self._lock:
+            self._indexes.clear()
+
+
+knowledge_index = KnowledgeIndexRegistry()
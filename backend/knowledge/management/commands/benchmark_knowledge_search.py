@@ -0,0 +1,125 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from knowledge.index import KnowledgeIndex
+from knowledge.models import KnowledgeEntry
+from knowledge.vectors import VectorCollection, get_embedder
+
+PRODUCTS = [
+    ('personal loan', 'personal loans'), ('mortgage', 'mortgages'),
+    ('auto loan', 'auto loans'), ('student loan', 'student loans'),
+    ('home insurance', 'home insurance policies'), ('car insurance', 'car insurance policies'),
+    ('life insurance', 'life insurance policies'), ('credit line', 'credit lines'),
+]
+ASPECTS = [
+    ('eligibility', 'eligible'), ('interest rate', 'interest rates'),
+    ('repayment schedule', 'repayments'), ('claim process', 'claims'),
+    ('required documents', 'documents required'), ('early settlement fee', 'settle early'),
+    ('late payment penalty', 'paying late'), ('coverage limit', 'covered'),
+]
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tor', 'vel', 'zu', 'pra', 'nim', 'sol', 'dex', 'ur']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark recall@k and latency of knowledge search backends against icontains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=2000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        k = options['k']
+        documents = [self._document(rng, i) for i in range(options['entries'])]
+
+        # Entries are written inside a transaction that is always rolled back
+        with transaction.atomic(using='knowledge'):
+            entries = KnowledgeEntry.objects.bulk_create([
+                KnowledgeEntry(title=title, content=content, category='loan', is_active=True)
+                for title, content, _ in documents
+            ])
+            samples = rng.sample(range(len(entries)), min(options['queries'], len(entries)))
+            queries = [(documents[i][2], entries[i].pk) for i in samples]
+            ids = [entry.pk for entry in entries]
+
+            backends = [
+                ('icontains (phrase)', self._icontains_phrase(ids)),
+                ('icontains (any keyword)', self._icontains_keywords(ids)),
+                ('bm25', self._bm25(entries)),
+                ('vector brute-force', self._vectors(entries, ivf_threshold=len(entries) + 1)),
+                ('vector ivf', self._vectors(entries, ivf_threshold=0)),
+            ]
+            self.stdout.write(f"{len(entries)} entries, {len(queries)} queries, k={k}")
+            self.stdout.write(f"{'backend':<26}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}")
+            for name, search in backends:
+                recall, p50, p99 = self._measure(search, queries, k)
+                self.stdout.write(f"{name:<26}{recall:>10.3f}{p50:>10.2f}{p99:>10.2f}")
+
+            transaction.set_rollback(True, using='knowledge')
+
+    def _document(self, rng, i):
+        product, product_plural = rng.choice(PRODUCTS)
+        aspect, aspect_phrase = rng.choice(ASPECTS)
+        plan = ''.join(rng.choice(SYLLABLES) for _ in range(3)) + str(i)
+        amount = rng.randrange(1, 200) * 500
+        title = f"{plan.title()} {product} {aspect}"
+        content = (
+            f"The {plan} {product} has a {aspect} that depends on your profile. "
+            f"Customers applying for {amount} dollars should review the {aspect} carefully. "
+            f"Contact support if you have questions about {product_plural}."
+        )
+        query = f"how does {aspect_phrase} work on {plan} {product_plural}"
+        return title, content, query
+
+    def _icontains_phrase(self, ids):
+        def search(query, k):
+            return list(KnowledgeEntry.objects.filter(
+                Q(title__icontains=query) | Q(content__icontains=query),
+                is_active=True, id__in=ids
+            ).values_list('id', flat=True)[:k])
+        return search
+
+    def _icontains_keywords(self, ids):
+        def search(query, k):
+            keywords = query.lower().split()
+            hits = []
+            for entry in KnowledgeEntry.objects.filter(is_active=True, id__in=ids):
+                text = (entry.title + ' ' + entry.content).lower()
+                if any(keyword in text for keyword in keywords):
+                    hits.append(entry.pk)
+                    if len(hits) == k:
+                        break
+            return hits
+        return search
+
+    def _bm25(self, entries):
+        index = KnowledgeIndex()
+        for entry in entries:
+            index.add(entry)
+        return lambda query, k: [hit['id'] for hit in index.search(query, limit=k)]
+
+    def _vectors(self, entries, ivf_threshold):
+        collection = VectorCollection(get_embedder(), ivf_threshold=ivf_threshold)
+        collection.add_many([
+            (entry.pk, f"{entry.title}\n{entry.content}", {'id': entry.pk}) for entry in entries
+        ])
+        return lambda query, k: [hit['id'] for hit in collection.search(query, k=k)]
+
+    def _measure(self, search, queries, k):
+        latencies = []
+        hits = 0
+        for query, expected_id in queries:
+            started = time.perf_counter()
+            result = search(query, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += expected_id in result
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return hits / len(queries), statistics.median(latencies), p99
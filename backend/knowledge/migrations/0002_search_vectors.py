@@ -0,0 +1,76 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:20
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# (table, weight-A column, weight-B column)
+SEARCH_TABLES = [
+    ('knowledge_knowledgeentry', 'title', 'content'),
+    ('prompts_prompt', 'name', 'content'),
+    ('knowledge_faq', 'question', 'answer'),
+]
+
+
+def create_search_triggers(apps, schema_editor):
+    """Create tsvector triggers, GIN indexes and backfill (PostgreSQL only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, primary, secondary in SEARCH_TABLES:
+        schema_editor.execute(f"""
+            CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('english', coalesce(NEW.{primary}, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(NEW.{secondary}, '')), 'B');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+        """)
+        schema_editor.execute(f"""
+            CREATE TRIGGER {table}_search_vector_trigger
+            BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update();
+        """)
+        schema_editor.execute(
+            f"CREATE INDEX {table}_search_vector_gin ON {table} USING gin (search_vector);"
+        )
+        schema_editor.execute(f"""
+            UPDATE {table} SET search_vector =
+                setweight(to_tsvector('english', coalesce({primary}, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce({secondary}, '')), 'B');
+        """)
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, _, _ in SEARCH_TABLES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_vector_gin;")
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};")
+        schema_editor.execute(f"DROP FUNCTION IF EXISTS {table}_search_vector_update();")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faq',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.AddField(
+            model_name='knowledgeentry',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.AddField(
+            model_name='prompt',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
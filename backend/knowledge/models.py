@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 
@@ -30,6 +31,8 @@ class KnowledgeEntry(models.Model):
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
     metadata = models.JSONField(_('metadata'), default=dict, blank=True)
+    # Maintained by a database trigger on PostgreSQL (see migration 0002)
+    search_vector = SearchVectorField(_('search vector'), null=True, editable=False)
     
     class Meta:
         db_table = 'knowledge_knowledgeentry'
@@ -111,6 +114,8 @@ class Prompt(models.Model):
     version = models.IntegerField(_('version'), default=1)
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    # Maintained by a database trigger on PostgreSQL (see migration 0002)
+    search_vector = SearchVectorField(_('search vector'), null=True, editable=False)
     
     class Meta:
         db_table = 'prompts_prompt'
@@ -218,6 +223,8 @@ class FAQ(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    # Maintained by a database trigger on PostgreSQL (see migration 0002)
+    search_vector = SearchVectorField(_('search vector'), null=True, editable=False)
     
     class Meta:
         db_table = 'knowledge_faq'
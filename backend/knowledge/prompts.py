@@ -0,0 +1,166 @@
+"""
+Process-local registry of compiled prompts.
+
+All active ``Prompt`` rows are loaded in one query and compiled once: the
+template is split into literal and field segments with ``string.Formatter``
+and checked against the prompt's declared ``variables``. Lookups by
+(group, category, name) are then dictionary reads with no database
+round-trip, falling back from the group's prompt to the global one.
+
+Invalidation is versioned. Prompt signal handlers reload this worker
+immediately and bump a shared version number in ``CACHES['default']``;
+other workers compare that number at most every
+``PROMPT_REGISTRY_CHECK_INTERVAL`` seconds and reload when it moved.
+"""
+import logging
+import threading
+import time
+from string import Formatter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'prompt_registry:version'
+
+_formatter = Formatter()
+
+
+def declared_variables(variables):
+    """Names from a prompt's ``variables`` (plain names or {'name': ...} objects)"""
+    names = set()
+    for variable in variables or []:
+        if isinstance(variable, dict):
+            variable = variable.get('name')
+        if isinstance(variable, str) and variable:
+            names.add(variable)
+    return names
+
+
+class CompiledPrompt:
+    """
+    A prompt template parsed once into literal/field segments
+    """
+
+    def __init__(self, prompt):
+        self.id = prompt.pk
+        self.name = prompt.name
+        self.category = prompt.category
+        self.group_id = prompt.group_id
+        self.version = prompt.version
+        self.content = prompt.content
+        self.segments = []
+        self.fields = set()
+        # Nested replacement fields in format specs need the full str.format machinery
+        self.simple = True
+        for literal, field, spec, conversion in _formatter.parse(prompt.content):
+            if field is not None:
+                root = field.split('.', 1)[0].split('[', 1)[0]
+                if not root or root.isdigit():
+                    raise ValueError(f"positional field '{{{field}}}' is not supported")
+                self.fields.add(root)
+                if field != root or (spec and '{' in spec):
+                    self.simple = False
+            self.segments.append((literal, field, spec, conversion))
+        declared = declared_variables(prompt.variables)
+        self.undeclared = self.fields - declared if declared else set()
+
+    def render(self, **kwargs):
+        """Render with variables; same output as Prompt.render"""
+        if not self.simple:
+            try:
+                return self.content.format(**kwargs)
+            except KeyError as e:
+                return f"Error rendering prompt: Missing variable {e}"
+
+        parts = []
+        for literal, field, spec, conversion in self.segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            try:
+                value = kwargs[field]
+            except KeyError as e:
+                return f"Error rendering prompt: Missing variable {e}"
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            parts.append(format(value, spec or ''))
+        return ''.join(parts)
+
+
+class PromptRegistry:
+    """
+    Compiled active prompts keyed by (group, category, name)
+    """
+
+    def __init__(self):
+        self._prompts = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, name, category=None, group_id=None):
+        """Return the group's (else the global) active prompt, or None"""
+        prompts = self._current()
+        for key in ((group_id, category, name), (None, category, name)):
+            prompt = prompts.get(key)
+            if prompt is not None:
+                return prompt
+        return None
+
+    def _current(self):
+        interval = getattr(settings, 'PROMPT_REGISTRY_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        if self._prompts is not None and now - self._checked_at < interval:
+            return self._prompts
+
+        with self._lock:
+            if self._prompts is None or time.monotonic() - self._checked_at >= interval:
+                version = self._shared_version()
+                if self._prompts is None or version != self._version:
+                    self._prompts = self._load()
+                    self._version = version
+                self._checked_at = time.monotonic()
+            return self._prompts
+
+    def _shared_version(self):
+        try:
+            return cache.get(VERSION_KEY, 0)
+        except Exception as e:
+            logger.error(f"Could not read prompt registry version: {str(e)}")
+            return self._version
+
+    def _load(self):
+        from .models import Prompt
+
+        prompts = {}
+        queryset = Prompt.objects.filter(is_active=True).only(
+            'id', 'name', 'category', 'group', 'version', 'content', 'variables'
+        ).order_by('updated_at')
+        for prompt in queryset.iterator():
+            try:
+                compiled = CompiledPrompt(prompt)
+            except ValueError as e:
+                logger.error(f"Skipping prompt {prompt.pk} ({prompt.name}): invalid template: {str(e)}")
+                continue
+            if compiled.undeclared:
+                logger.warning(
+                    f"Prompt {prompt.pk} ({prompt.name}) uses undeclared variables: "
+                    f"{', '.join(sorted(compiled.undeclared))}"
+                )
+            prompts[(prompt.group_id, prompt.category, prompt.name)] = compiled
+        return prompts
+
+    def invalidate(self):
+        """Reload this worker on next use and tell other workers to reload"""
+        try:
+            cache.add(VERSION_KEY, 0, timeout=None)
+            cache.incr(VERSION_KEY)
+        except Exception as e:
+            logger.error(f"Could not bump prompt registry version: {str(e)}")
+        with self._lock:
+            self._prompts = None
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,69 @@
+"""
+Knowledge retrieval used by the chat pipeline.
+
+``KNOWLEDGE_RETRIEVAL_MODE`` selects BM25 (``knowledge.index``), vector
+search (``knowledge.vectors``) or ``hybrid``, which merges both rankings
+with reciprocal rank fusion.
+"""
+from django.conf import settings
+
+from .index import knowledge_index
+from .vectors import vector_store
+
+RRF_K = 60
+
+
+def _fuse(rankings, limit):
+    """Reciprocal rank fusion over several ranked result lists"""
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            entry = fused.setdefault(item['id'], dict(item, score=0.0))
+            entry['score'] += 1.0 / (RRF_K + rank + 1)
+    ranked = sorted(fused.values(), key=lambda item: (-item['score'], item['id']))[:limit]
+    for item in ranked:
+        item['score'] = round(item['score'], 4)
+    return ranked
+
+
+def retrieve_knowledge(query, group_id=None, limit=3, mode=None):
+    """Return the top knowledge entries for a query within a group scope"""
+    mode = mode or getattr(settings, 'KNOWLEDGE_RETRIEVAL_MODE', 'hybrid')
+    min_score = getattr(settings, 'KNOWLEDGE_VECTOR_MIN_SCORE', 0.2)
+
+    if mode == 'bm25':
+        return knowledge_index.get(group_id).search(query, limit=limit)
+    if mode == 'vector':
+        return vector_store.get('knowledge', group_id).search(query, k=limit, min_score=min_score)
+
+    candidates = limit * 4
+    lexical = knowledge_index.get(group_id).search(query, limit=candidates)
+    semantic = vector_store.get('knowledge', group_id).search(query, k=candidates, min_score=min_score)
+    return _fuse([lexical, semantic], limit)
+
+
+def retrieve_knowledge_many(queries, group_id=None, limit=3, mode=None):
+    """
+    Batched retrieve_knowledge: one result list per query, in order.
+
+    The queries are embedded in a single call and scored against the
+    vector collection as one matrix product.
+    """
+    mode = mode or getattr(settings, 'KNOWLEDGE_RETRIEVAL_MODE', 'hybrid')
+    min_score = getattr(settings, 'KNOWLEDGE_VECTOR_MIN_SCORE', 0.2)
+    if not queries:
+        return []
+
+    candidates = limit * 4 if mode == 'hybrid' else limit
+    semantic = [[] for _ in queries]
+    if mode != 'bm25':
+        collection = vector_store.get('knowledge', group_id)
+        semantic = collection.search_vectors(collection.embedder.embed_many(queries), candidates, min_score)
+        if mode == 'vector':
+            return semantic
+
+    index = knowledge_index.get(group_id)
+    lexical = [index.search(query, limit=candidates) for query in queries]
+    if mode == 'bm25':
+        return lexical
+    return [_fuse(pair, limit) for pair in zip(lexical, semantic)]
@@ -0,0 +1,27 @@
+"""
+Full-text search for knowledge, prompt and FAQ listings.
+
+On PostgreSQL the ``search_vector`` columns (kept current by triggers, see
+migration 0002) are matched with ``websearch_to_tsquery`` through their GIN
+indexes and ranked with ``ts_rank``. Other backends fall back to
+``icontains`` over the given fields so local SQLite setups keep working.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+
+SEARCH_CONFIG = 'english'
+
+
+def full_text_search(queryset, query, fields):
+    """Filter (and on PostgreSQL rank) a queryset by a free-text query"""
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at')
+
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import KnowledgeEntry, FAQ, Prompt
+from .index import knowledge_index
+from .prompts import prompt_registry
+from .vectors import vector_store
+
+
+@receiver(post_save, sender=KnowledgeEntry)
+def update_knowledge_index(sender, instance, **kwargs):
+    """Keep the in-process knowledge indexes in step with saved entries"""
+    knowledge_index.entry_saved(instance)
+    vector_store.item_saved('knowledge', instance)
+
+
+@receiver(post_delete, sender=KnowledgeEntry)
+def remove_from_knowledge_index(sender, instance, **kwargs):
+    """Drop deleted entries from the in-process knowledge indexes"""
+    knowledge_index.entry_deleted(instance.pk)
+    vector_store.item_deleted('knowledge', instance.pk)
+
+
+@receiver(post_save, sender=FAQ)
+def update_faq_vectors(sender, instance, update_fields=None, **kwargs):
+    """Re-embed saved FAQs (view-count bumps do not change the text)"""
+    if update_fields and set(update_fields) <= {'view_count'}:
+        return
+    vector_store.item_saved('faq', instance)
+
+
+@receiver(post_delete, sender=FAQ)
+def remove_faq_vectors(sender, instance, **kwargs):
+    """Drop deleted FAQs from the in-process vector store"""
+    vector_store.item_deleted('faq', instance.pk)
+
+
+@receiver(post_save, sender=Prompt)
+@receiver(post_delete, sender=Prompt)
+def reload_prompt_registry(sender, instance, **kwargs):
+    """Recompile prompts after any prompt change"""
+    prompt_registry.invalidate()
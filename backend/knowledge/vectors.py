@@ -0,0 +1,383 @@
+"""
+Local vector retrieval for knowledge entries and FAQs.
+
+Texts are embedded with a deterministic hashing embedder (no network or
+model download) into L2-normalised float32 vectors. Vectors live in
+contiguous NumPy matrices: small collections are searched with a batched
+brute-force dot product, collections above ``KNOWLEDGE_VECTOR_IVF_THRESHOLD``
+switch to an inverted-file (IVF) index that only scores the ``nprobe``
+closest k-means clusters.
+
+The embedder is pluggable through ``KNOWLEDGE_EMBEDDER`` (dotted path to a
+class exposing ``dim`` and ``embed_many(texts)``).
+"""
+import math
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .index import TOKEN_RE, tokenize
+
+ALL_GROUPS = '*'
+
+
+class HashingEmbedder:
+    """
+    Signed feature-hashing embedder over words, word bigrams and char trigrams
+    """
+
+    def __init__(self, dim=512, char_weight=0.5):
+        self.dim = dim
+        self.char_weight = char_weight
+
+    def _features(self, text):
+        words = tokenize(text)
+        features = Counter(words)
+        features.update(f"{a}_{b}" for a, b in zip(words, words[1:]))
+        char_features = Counter()
+        for word in TOKEN_RE.findall(text.lower()):
+            padded = f"<{word}>"
+            char_features.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features, char_features
+
+    def _accumulate(self, vector, features, weight):
+        for feature, count in features.items():
+            digest = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dim] += sign * weight * (1.0 + math.log(count))
+
+    def embed(self, text):
+        """Embed one text into a unit-length float32 vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features, char_features = self._features(text)
+        self._accumulate(vector, features, 1.0)
+        self._accumulate(vector, char_features, self.char_weight)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts):
+        """Embed texts into a (len(texts), dim) float32 matrix"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
+
+
+_embedder = None
+
+
+def get_embedder():
+    """Return the configured process-wide embedder"""
+    global _embedder
+    if _embedder is None:
+        path = getattr(settings, 'KNOWLEDGE_EMBEDDER', 'knowledge.vectors.HashingEmbedder')
+        _embedder = import_string(path)()
+    return _embedder
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first"""
+    if k >= scores.shape[0]:
+        return np.argsort(-scores, kind='stable')
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class BruteForceIndex:
+    """
+    Exact search over a contiguous float32 matrix
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.size = 0
+        self._rows = {}
+
+    def __len__(self):
+        return self.size
+
+    def add(self, item_id, vector):
+        """Insert or replace a vector"""
+        row = self._rows.get(item_id)
+        if row is None:
+            if self.size == self.vectors.shape[0]:
+                self._grow()
+            row = self.size
+            self.size += 1
+            self._rows[item_id] = row
+            self.ids[row] = item_id
+        self.vectors[row] = vector
+        return row
+
+    def remove(self, item_id):
+        """Remove a vector by swapping the last row into its slot"""
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return None
+        last = self.size - 1
+        if row != last:
+            moved_id = int(self.ids[last])
+            self.ids[row] = moved_id
+            self.vectors[row] = self.vectors[last]
+            self._rows[moved_id] = row
+        self.size = last
+        return row, last
+
+    def _grow(self):
+        capacity = max(64, self.vectors.shape[0] * 2)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        self.vectors, self.ids = vectors, ids
+
+    def search(self, queries, k):
+        """Return [(ids, scores)] for each row of a (q, dim) query matrix"""
+        if not self.size:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))] * len(queries)
+        scores = queries @ self.vectors[:self.size].T
+        results = []
+        for row_scores in scores:
+            top = _top_k(row_scores, k)
+            results.append((self.ids[top], row_scores[top]))
+        return results
+
+
+class IVFIndex(BruteForceIndex):
+    """
+    Inverted-file index: k-means coarse quantiser over the brute-force storage
+    """
+
+    def __init__(self, dim, nprobe=8, iterations=10, seed=0):
+        super().__init__(dim)
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+
+    def train(self):
+        """Cluster the current vectors with spherical k-means"""
+        data = self.vectors[:self.size]
+        nlist = max(1, int(math.sqrt(self.size)))
+        rng = np.random.default_rng(self.seed)
+        centroids = data[rng.choice(self.size, size=nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = data[labels == cluster]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[cluster] = centroid / norm if norm > 0 else centroid
+        self.centroids = centroids
+        self.assignments = np.zeros(self.vectors.shape[0], dtype=np.int32)
+        self.assignments[:self.size] = np.argmax(data @ centroids.T, axis=1)
+        self.trained_size = self.size
+
+    def add(self, item_id, vector):
+        row = super().add(item_id, vector)
+        if self.assignments.shape[0] < self.vectors.shape[0]:
+            assignments = np.zeros(self.vectors.shape[0], dtype=np.int32)
+            assignments[:self.assignments.shape[0]] = self.assignments
+            self.assignments = assignments
+        if len(self.centroids):
+            self.assignments[row] = int(np.argmax(self.centroids @ vector))
+        return row
+
+    def remove(self, item_id):
+        moved = super().remove(item_id)
+        if moved is not None:
+            row, last = moved
+            self.assignments[row] = self.assignments[last]
+        return moved
+
+    def search(self, queries, k):
+        if not self.size or not len(self.centroids):
+            return super().search(queries, k)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        assignments = self.assignments[:self.size]
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.flatnonzero(np.isin(assignments, lists))
+            if not len(rows):
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            scores = self.vectors[rows] @ query
+            top = _top_k(scores, k)
+            results.append((self.ids[rows[top]], scores[top]))
+        return results
+
+
+class VectorCollection:
+    """
+    Embedded documents of one source for one group scope
+    """
+
+    def __init__(self, embedder, ivf_threshold=5000, nprobe=8):
+        self.embedder = embedder
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.index = BruteForceIndex(embedder.dim)
+        self.payloads = {}
+        self.built_at = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def add_many(self, items):
+        """Embed and insert [(id, text, payload)] in one batch"""
+        if not items:
+            return
+        vectors = self.embedder.embed_many([text for _, text, _ in items])
+        with self._lock:
+            for (item_id, _, payload), vector in zip(items, vectors):
+                self.index.add(item_id, vector)
+                self.payloads[item_id] = payload
+            self._maybe_retrain()
+
+    def add(self, item_id, text, payload):
+        self.add_many([(item_id, text, payload)])
+
+    def remove(self, item_id):
+        with self._lock:
+            self.index.remove(item_id)
+            self.payloads.pop(item_id, None)
+
+    def _maybe_retrain(self):
+        size = len(self.index)
+        if isinstance(self.index, IVFIndex):
+            if size >= 2 * self.index.trained_size:
+                self.index.train()
+        elif size >= self.ivf_threshold:
+            index = IVFIndex(self.embedder.dim, nprobe=self.nprobe)
+            index.ids, index.vectors, index.size = self.index.ids, self.index.vectors, self.index.size
+            index._rows = self.index._rows
+            index.train()
+            self.index = index
+
+    def search_vectors(self, queries, k, min_score=0.0):
+        """Search pre-embedded queries; returns one result list per query"""
+        with self._lock:
+            batches = self.index.search(queries, k)
+            results = []
+            for ids, scores in batches:
+                results.append([
+                    dict(self.payloads[int(item_id)], score=round(float(score), 4))
+                    for item_id, score in zip(ids, scores)
+                    if score >= min_score
+                ])
+            return results
+
+    def search(self, query, k=5, min_score=0.0):
+        """Return the k nearest documents to a query text, best first"""
+        return self.search_vectors(self.embedder.embed_many([query]), k, min_score)[0]
+
+
+def _knowledge_document(entry):
+    return entry.pk, f"{entry.title}\n{entry.content}", {
+        'id': entry.pk,
+        'title': entry.title,
+        'content': entry.content,
+        'category': entry.category,
+        'version': entry.version,
+    }
+
+
+def _faq_document(faq):
+    return faq.pk, f"{faq.question}\n{faq.answer}", {
+        'id': faq.pk,
+        'question': faq.question,
+        'answer': faq.answer,
+        'category': faq.category,
+    }
+
+
+class VectorStore:
+    """
+    Per-worker registry of vector collections keyed by (source, group scope)
+    """
+
+    SOURCES = {
+        'knowledge': ('knowledge.KnowledgeEntry', _knowledge_document),
+        'faq': ('knowledge.FAQ', _faq_document),
+    }
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def get(self, source, group_id=None):
+        """Return a source's collection for a group (or ALL_GROUPS), building if needed"""
+        max_age = getattr(settings, 'KNOWLEDGE_INDEX_MAX_AGE', 300)
+        key = (source, group_id)
+        collection = self._collections.get(key)
+        if collection is not None and time.monotonic() - collection.built_at < max_age:
+            return collection
+
+        with self._lock:
+            collection = self._collections.get(key)
+            if collection is None or time.monotonic() - collection.built_at >= max_age:
+                collection = self._build(source, group_id)
+                self._collections[key] = collection
+            return collection
+
+    def _build(self, source, group_id):
+        from django.apps import apps
+
+        model_label, to_document = self.SOURCES[source]
+        model = apps.get_model(model_label)
+        queryset = model.objects.filter(is_active=True)
+        if group_id != ALL_GROUPS:
+            queryset = queryset.filter(Q(group_id=group_id) | Q(group__isnull=True))
+
+        collection = VectorCollection(
+            get_embedder(),
+            ivf_threshold=getattr(settings, 'KNOWLEDGE_VECTOR_IVF_THRESHOLD', 5000),
+            nprobe=getattr(settings, 'KNOWLEDGE_VECTOR_NPROBE', 8),
+        )
+        collection.add_many([to_document(obj) for obj in queryset.iterator()])
+        return collection
+
+    def item_saved(self, source, instance):
+        """Apply an insert/update to every loaded collection of a source"""
+        _, to_document = self.SOURCES[source]
+        for (collection_source, group_id), collection in list(self._collections.items()):
+            if collection_source != source:
+                continue
+            in_scope = (
+                group_id == ALL_GROUPS
+                or instance.group_id is None
+                or instance.group_id == group_id
+            )
+            if instance.is_active and in_scope:
+                collection.add(*to_document(instance))
+            else:
+                collection.remove(instance.pk)
+
+    def item_deleted(self, source, item_id):
+        """Drop a deleted item from every loaded collection of a source"""
+        for (collection_source, _), collection in list(self._collections.items()):
+            if collection_source == source:
+                collection.remove(item_id)
+
+    def clear(self):
+        """Forget all loaded collections"""
+        with self._lock:
+            self._collections.clear()
+
+
+vector_store = VectorStore()
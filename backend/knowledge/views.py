@@ -3,7 +3,7 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.conf import settings
 from .models import (
     KnowledgeEntry, KnowledgeVersion, Prompt, PromptVersion,
     TrainingData, AIModelPerformance, FAQ
@@ -14,6 +14,8 @@ from .serializers import (
     TrainingDataSerializer, AIModelPerformanceSerializer,
     FAQSerializer
 )
+from .vectors import vector_store, ALL_GROUPS
+from .search import full_text_search
 
 
 # Knowledge Entry Views
@@ -67,9 +69,7 @@ class KnowledgeEntrySearchView(generics.ListAPIView):
         category = self.request.query_params.get('category', '')
         
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) | Q(content__icontains=query)
-            )
+            queryset = full_text_search(queryset, query, ('title', 'content'))
         
         if category:
             queryset = queryset.filter(category=category)
@@ -199,9 +199,7 @@ class PromptSearchView(generics.ListAPIView):
         category = self.request.query_params.get('category', '')
         
         if query:
-            queryset = queryset.filter(
-                Q(name__icontains=query) | Q(content__icontains=query)
-            )
+            queryset = full_text_search(queryset, query, ('name', 'content'))
         
         if category:
             queryset = queryset.filter(category=category)
@@ -343,9 +341,7 @@ class FAQSearchView(generics.ListAPIView):
         category = self.request.query_params.get('category', '')
         
         if query:
-            queryset = queryset.filter(
-                Q(question__icontains=query) | Q(answer__icontains=query)
-            )
+            queryset = full_text_search(queryset, query, ('question', 'answer'))
         
         if category:
             queryset = queryset.filter(category=category)
@@ -362,24 +358,35 @@ class AISearchView(APIView):
     
     def post(self, request):
         query = request.data.get('query', '')
+        try:
+            limit = max(1, min(int(request.data.get('limit', 5)), 50))
+        except (TypeError, ValueError):
+            limit = 5
         
-        # Basic search implementation
-        # In production, this would use vector search or other AI techniques
-        knowledge_results = KnowledgeEntry.objects.filter(
-            Q(title__icontains=query) | Q(content__icontains=query),
-            is_active=True
-        )[:5]
+        user = request.user
+        scope = ALL_GROUPS if user.role in ['admin', 'superadmin'] else user.group_id
+        min_score = settings.KNOWLEDGE_VECTOR_MIN_SCORE
         
-        faq_results = FAQ.objects.filter(
-            Q(question__icontains=query) | Q(answer__icontains=query),
-            is_active=True
-        )[:5]
+        knowledge_hits = vector_store.get('knowledge', scope).search(query, k=limit, min_score=min_score)
+        faq_hits = vector_store.get('faq', scope).search(query, k=limit, min_score=min_score)
         
         return Response({
             'query': query,
-            'knowledge_entries': KnowledgeEntrySerializer(knowledge_results, many=True).data,
-            'faqs': FAQSerializer(faq_results, many=True).data
+            'knowledge_entries': self._serialize_hits(KnowledgeEntry, KnowledgeEntrySerializer, knowledge_hits),
+            'faqs': self._serialize_hits(FAQ, FAQSerializer, faq_hits)
         })
+    
+    def _serialize_hits(self, model, serializer_class, hits):
+        """Serialize ranked hits in rank order, attaching the similarity score"""
+        objects = model.objects.in_bulk([hit['id'] for hit in hits])
+        results = []
+        for hit in hits:
+            obj = objects.get(hit['id'])
+            if obj is not None:
+                data = serializer_class(obj).data
+                data['score'] = hit['score']
+                results.append(data)
+        return results
 
 
 class AIQueryView(APIView):
@@ -2,6 +2,9 @@
 ASGI config for Omnifin project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django, static files being served in front of it by
+``omnifin.static``; WebSocket connections are routed by path to
+the applications in ``websocket_routes``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +16,27 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'omnifin.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from omnifin.static import ASGIStaticFiles  # noqa: E402
+from order.websocket import chat_websocket  # noqa: E402
+
+http_application = ASGIStaticFiles(django_application)
+
+websocket_routes = {
+    '/ws/chat/': chat_websocket,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        route = websocket_routes.get(scope['path'])
+        if route is None:
+            # Closing before accepting rejects the handshake
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        await route(scope, receive, send)
+        return
+    await http_application(scope, receive, send)
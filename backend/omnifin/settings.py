@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from decouple import config
 import os
 
@@ -59,11 +60,12 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Static files are served in front of Django (omnifin.static), keeping this chain async
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'analytics.middleware.ActivityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -188,6 +190,9 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Conditional chat polling (ETag / If-None-Match) from the browser
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag']
 
 # Celery Configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379')
@@ -196,6 +201,106 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Run tasks inline (no broker needed), e.g. for tests and local development
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_TASK_EAGER_PROPAGATES = True
+# Periodic maintenance run by `celery -A omnifin beat` (intervals in seconds)
+CELERY_BEAT_SCHEDULE = {
+    'refresh-activity-rollups': {
+        'task': 'analytics.tasks.refresh_activity_rollups',
+        'schedule': config('ACTIVITY_ROLLUP_REFRESH_INTERVAL', default=300, cast=float),
+    },
+    'refresh-dashboard-stats': {
+        'task': 'core.tasks.refresh_dashboard_stats',
+        'schedule': config('DASHBOARD_STATS_REFRESH_INTERVAL', default=60, cast=float),
+    },
+    'downsample-metrics': {
+        'task': 'analytics.tasks.downsample_metrics',
+        'schedule': config('METRIC_DOWNSAMPLE_INTERVAL', default=300, cast=float),
+    },
+    'apply-metric-retention': {
+        'task': 'analytics.tasks.apply_metric_retention',
+        'schedule': 24 * 60 * 60,
+    },
+    'ensure-partitions': {
+        'task': 'core.tasks.ensure_partitions',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
+# Chat processing
+# When enabled, chat endpoints return a pending AI message and a Celery task generates the reply
+CHAT_ASYNC_PROCESSING = config('CHAT_ASYNC_PROCESSING', default=False, cast=bool)
+# Chat updates endpoints: longest long-poll (?wait=) and, when the cache is not Redis
+# (no pub/sub), how often a waiting request re-reads the conversation version
+CHAT_UPDATES_MAX_WAIT = config('CHAT_UPDATES_MAX_WAIT', default=25, cast=int)
+CHAT_UPDATES_POLL_INTERVAL = config('CHAT_UPDATES_POLL_INTERVAL', default=1.0, cast=float)
+# Live chat WebSocket (/ws/chat/): channel layer fanning events out to sockets ('memory'
+# within one process, 'redis' across uvicorn workers and Celery) and subscriptions per socket
+CHAT_CHANNEL_LAYER = config('CHAT_CHANNEL_LAYER', default='redis')
+CHAT_WEBSOCKET_MAX_SUBSCRIPTIONS = config('CHAT_WEBSOCKET_MAX_SUBSCRIPTIONS', default=20, cast=int)
+# Cache LLM replies per (group, order type, knowledge set, normalised message);
+# near-duplicate lookup matches paraphrases by embedding similarity
+CHAT_RESPONSE_CACHE = config('CHAT_RESPONSE_CACHE', default=True, cast=bool)
+CHAT_RESPONSE_CACHE_TTL = config('CHAT_RESPONSE_CACHE_TTL', default=3600, cast=int)
+CHAT_RESPONSE_CACHE_NEAR_DUPLICATES = config('CHAT_RESPONSE_CACHE_NEAR_DUPLICATES', default=False, cast=bool)
+CHAT_RESPONSE_CACHE_SIMILARITY = config('CHAT_RESPONSE_CACHE_SIMILARITY', default=0.92, cast=float)
+CHAT_RESPONSE_CACHE_NEAR_DUPLICATE_SIZE = config('CHAT_RESPONSE_CACHE_NEAR_DUPLICATE_SIZE', default=500, cast=int)
+# Prompt token budget (excluding the reply), per-entry knowledge snippet size, share of the
+# budget knowledge may use, turns considered and size of the rolling conversation summary
+CHAT_CONTEXT_TOKEN_BUDGET = config('CHAT_CONTEXT_TOKEN_BUDGET', default=2000, cast=int)
+CHAT_CONTEXT_SNIPPET_TOKENS = config('CHAT_CONTEXT_SNIPPET_TOKENS', default=150, cast=int)
+CHAT_CONTEXT_KNOWLEDGE_SHARE = config('CHAT_CONTEXT_KNOWLEDGE_SHARE', default=0.4, cast=float)
+CHAT_CONTEXT_MAX_MESSAGES = config('CHAT_CONTEXT_MAX_MESSAGES', default=20, cast=int)
+CHAT_SUMMARY_TOKENS = config('CHAT_SUMMARY_TOKENS', default=300, cast=int)
+# Bulk AI processing: messages per request, per processing chunk, and concurrent LLM calls
+BATCH_PROCESS_MAX_MESSAGES = config('BATCH_PROCESS_MAX_MESSAGES', default=5000, cast=int)
+BATCH_PROCESS_CHUNK_SIZE = config('BATCH_PROCESS_CHUNK_SIZE', default=500, cast=int)
+BATCH_LLM_CONCURRENCY = config('BATCH_LLM_CONCURRENCY', default=4, cast=int)
+
+# Activity logging
+# UserActivity rows are buffered ('memory' per process, 'redis' shared, or 'sync' to write
+# immediately) and bulk-inserted in batches, at least every ACTIVITY_FLUSH_INTERVAL seconds
+ACTIVITY_BUFFER = config('ACTIVITY_BUFFER', default='memory')
+ACTIVITY_FLUSH_SIZE = config('ACTIVITY_FLUSH_SIZE', default=200, cast=int)
+ACTIVITY_FLUSH_INTERVAL = config('ACTIVITY_FLUSH_INTERVAL', default=2.0, cast=float)
+ACTIVITY_BUFFER_MAX = config('ACTIVITY_BUFFER_MAX', default=10000, cast=int)
+# Hourly/daily activity counts for dashboards: bumped as the buffer flushes, and rebuilt
+# from raw rows for the last ACTIVITY_ROLLUP_LOOKBACK_HOURS by the beat schedule
+ACTIVITY_ROLLUP_ON_FLUSH = config('ACTIVITY_ROLLUP_ON_FLUSH', default=True, cast=bool)
+ACTIVITY_ROLLUP_LOOKBACK_HOURS = config('ACTIVITY_ROLLUP_LOOKBACK_HOURS', default=2, cast=int)
+# Monthly partitions of analytics_useractivity and core_auditlog (PostgreSQL): months created
+# ahead of time, months kept attached, and where manage_partitions archive writes old months
+PARTITION_MONTHS_AHEAD = config('PARTITION_MONTHS_AHEAD', default=3, cast=int)
+PARTITION_RETENTION_MONTHS = config('PARTITION_RETENTION_MONTHS', default=12, cast=int)
+PARTITION_ARCHIVE_DIR = config('PARTITION_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+
+# Metric time series: points per ingest request, buckets re-downsampled on each run,
+# days each level is kept (0: forever) and buckets per series query
+METRIC_INGEST_MAX_POINTS = config('METRIC_INGEST_MAX_POINTS', default=10000, cast=int)
+METRIC_DOWNSAMPLE_LOOKBACK_HOURS = config('METRIC_DOWNSAMPLE_LOOKBACK_HOURS', default=2, cast=int)
+METRIC_RETENTION_DAYS = {
+    'raw': config('METRIC_RAW_RETENTION_DAYS', default=7, cast=int),
+    'hourly': config('METRIC_HOURLY_RETENTION_DAYS', default=90, cast=int),
+    'daily': config('METRIC_DAILY_RETENTION_DAYS', default=730, cast=int),
+    'weekly': config('METRIC_WEEKLY_RETENTION_DAYS', default=0, cast=int),
+    'monthly': config('METRIC_MONTHLY_RETENTION_DAYS', default=0, cast=int),
+}
+METRIC_SERIES_MAX_BUCKETS = config('METRIC_SERIES_MAX_BUCKETS', default=2000, cast=int)
+
+# Generated reports: where files are written, and rows fetched per server-side cursor chunk
+REPORT_DIR = config('REPORT_DIR', default=str(BASE_DIR / 'reports'))
+REPORT_CHUNK_SIZE = config('REPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Dashboard widget data: how long a shared result is kept (each widget still re-resolves
+# after its refresh_interval) and the widgets/sources accepted per batched request
+WIDGET_DATA_CACHE_TTL = config('WIDGET_DATA_CACHE_TTL', default=3600, cast=int)
+WIDGET_DATA_MAX_REQUESTS = config('WIDGET_DATA_MAX_REQUESTS', default=50, cast=int)
+
+# Dashboard stats snapshots: fresh for DASHBOARD_STATS_TTL seconds, then served stale
+# (while refreshing in the background) until DASHBOARD_STATS_STALE_TTL
+DASHBOARD_STATS_TTL = config('DASHBOARD_STATS_TTL', default=30, cast=int)
+DASHBOARD_STATS_STALE_TTL = config('DASHBOARD_STATS_STALE_TTL', default=600, cast=int)
 
 # Cache Configuration
 CACHES = {
@@ -259,6 +364,31 @@ AUTH_USER_MODEL = 'authentication.User'
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
 ANTHROPIC_API_KEY = config('ANTHROPIC_API_KEY', default='')
 ELEVENLABS_API_KEY = config('ELEVENLABS_API_KEY', default='')
+# Dotted path to the chat LLM client (order.llm.FakeLLMClient answers offline)
+LLM_CLIENT = config('LLM_CLIENT', default='order.llm.OpenAIChatClient')
+# Simulated per-call delay (seconds) for FakeLLMClient in load benchmarks
+FAKE_LLM_LATENCY = config('FAKE_LLM_LATENCY', default=0.0, cast=float)
+# Shared LLM clients: per-call deadline (seconds, retries included), retry budget,
+# circuit breaker and connection pool; clients re-read APIConfiguration after the TTL
+LLM_TIMEOUT = config('LLM_TIMEOUT', default=30.0, cast=float)
+LLM_MAX_RETRIES = config('LLM_MAX_RETRIES', default=2, cast=int)
+LLM_BREAKER_FAILURE_THRESHOLD = config('LLM_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+LLM_BREAKER_RESET_TIMEOUT = config('LLM_BREAKER_RESET_TIMEOUT', default=30.0, cast=float)
+LLM_POOL_MAX_CONNECTIONS = config('LLM_POOL_MAX_CONNECTIONS', default=100, cast=int)
+LLM_CLIENT_CONFIG_TTL = config('LLM_CLIENT_CONFIG_TTL', default=60, cast=int)
+
+# Knowledge retrieval
+# Seconds before a worker rebuilds its in-memory knowledge index from the database
+KNOWLEDGE_INDEX_MAX_AGE = config('KNOWLEDGE_INDEX_MAX_AGE', default=300, cast=int)
+# 'bm25', 'vector' or 'hybrid' (reciprocal rank fusion of both)
+KNOWLEDGE_RETRIEVAL_MODE = config('KNOWLEDGE_RETRIEVAL_MODE', default='hybrid')
+KNOWLEDGE_EMBEDDER = config('KNOWLEDGE_EMBEDDER', default='knowledge.vectors.HashingEmbedder')
+KNOWLEDGE_VECTOR_MIN_SCORE = config('KNOWLEDGE_VECTOR_MIN_SCORE', default=0.2, cast=float)
+# Collections larger than this switch from brute force to an IVF index
+KNOWLEDGE_VECTOR_IVF_THRESHOLD = config('KNOWLEDGE_VECTOR_IVF_THRESHOLD', default=5000, cast=int)
+KNOWLEDGE_VECTOR_NPROBE = config('KNOWLEDGE_VECTOR_NPROBE', default=8, cast=int)
+# Seconds between checks of the shared prompt version by each worker's prompt registry
+PROMPT_REGISTRY_CHECK_INTERVAL = config('PROMPT_REGISTRY_CHECK_INTERVAL', default=5, cast=int)
 
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
@@ -0,0 +1,43 @@
+"""
+Static file serving outside Django's middleware chain.
+
+WhiteNoise 6 only ships a sync middleware. Listed in MIDDLEWARE it made
+Django adapt the whole chain to sync for the async chat views, so each
+request held a thread for the full LLM await. ``ASGIStaticFiles`` answers
+``STATIC_URL`` requests in front of the Django ASGI application instead,
+with the same WhiteNoise configuration (``STATIC_ROOT``, compressed and
+hashed files, finders when ``DEBUG``), and leaves the middleware chain
+fully async. ``wsgi.py`` puts WhiteNoise's own WSGI application in front
+of Django the same way.
+"""
+import io
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class ASGIStaticFiles:
+    """
+    ASGI wrapper serving static files with WhiteNoise before a Django ASGIHandler
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    def _find(self, path):
+        if self.whitenoise.autorefresh:
+            return self.whitenoise.find_file(path)
+        return self.whitenoise.files.get(path)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].startswith(self.whitenoise.static_prefix):
+            request = ASGIRequest(scope, io.BytesIO())
+            # autorefresh (DEBUG) looks files up on disk
+            static_file = await sync_to_async(self._find, thread_sensitive=False)(request.path_info)
+            if static_file is not None:
+                response = await sync_to_async(self.whitenoise.serve, thread_sensitive=False)(static_file, request)
+                await self.application.send_response(response, send)
+                return
+        await self.application(scope, receive, send)
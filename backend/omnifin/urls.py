@@ -21,7 +21,12 @@ from django.conf.urls.static import static
 from rest_framework.authtoken import views as auth_views
 from order.views import (
     ChatMessageWorkflowView, ChatHistoryWorkflowView,
-    ChatVoiceWorkflowView, ChatStatusWorkflowView
+    ChatVoiceWorkflowView, ChatStatusWorkflowView, ChatStreamWorkflowView,
+    ChatUpdatesWorkflowView
+)
+from order.async_views import (
+    AsyncChatMessageWorkflowView, AsyncChatHistoryWorkflowView,
+    AsyncChatStatusWorkflowView, AsyncChatUpdatesWorkflowView
 )
 from authentication.views import (
     AdminUserListCreateView, AdminUserDetailView
@@ -43,6 +48,14 @@ urlpatterns = [
     path('api/chat/history/', ChatHistoryWorkflowView.as_view(), name='workflow-chat-history'),
     path('api/chat/voice/', ChatVoiceWorkflowView.as_view(), name='workflow-chat-voice'),
     path('api/chat/status/', ChatStatusWorkflowView.as_view(), name='workflow-chat-status'),
+    path('api/chat/stream/', ChatStreamWorkflowView.as_view(), name='workflow-chat-stream'),
+    path('api/chat/updates/', ChatUpdatesWorkflowView.as_view(), name='workflow-chat-updates'),
+    
+    # Native async workflow chat endpoints
+    path('api/chat/async/message/', AsyncChatMessageWorkflowView.as_view(), name='workflow-chat-async-message'),
+    path('api/chat/async/history/', AsyncChatHistoryWorkflowView.as_view(), name='workflow-chat-async-history'),
+    path('api/chat/async/status/', AsyncChatStatusWorkflowView.as_view(), name='workflow-chat-async-status'),
+    path('api/chat/async/updates/', AsyncChatUpdatesWorkflowView.as_view(), name='workflow-chat-async-updates'),
     
     # Admin workflow endpoints
     path('api/admin/users/', AdminUserListCreateView.as_view(), name='workflow-admin-users'),
@@ -13,4 +13,10 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'omnifin.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+django_application = get_wsgi_application()
+
+# Static files are served in front of Django rather than by middleware (see omnifin.static)
+from django.conf import settings  # noqa: E402
+from whitenoise import WhiteNoise  # noqa: E402
+
+application = WhiteNoise(django_application, root=settings.STATIC_ROOT, prefix=settings.STATIC_URL)
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class OrderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'order'
\ No newline at end of file
+    name = 'order'
+
+    def ready(self):
+        from . import signals  # noqa: F401
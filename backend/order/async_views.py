@@ -0,0 +1,321 @@
+"""
+Native async versions of the chat workflow endpoints.
+
+These are plain Django class-based views with ``async`` handlers, so under
+ASGI they run on the event loop instead of a sync_to_async thread: ORM
+calls use the async queryset API and the LLM call is awaited, letting one
+worker hold many in-flight replies. Request and response shapes match the
+DRF views in ``order.views``.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils import timezone
+from django.views import View
+from rest_framework.authentication import CSRFCheck
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from core.pagination import MessageKeysetPagination
+from core.query_shaping import shape_queryset
+
+from . import updates
+from .models import Conversation, Message
+from .serializers import ConversationSerializer, MessageSerializer, WorkflowChatMessageSerializer
+from .services import AIProcessingService
+from .views import _not_modified, _reply_to_message, _updates_response_data
+
+
+def _csrf_failure(request):
+    """Return the CSRF failure reason for a session-authenticated request, if any"""
+    check = CSRFCheck(lambda req: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+async def _authenticate(request):
+    """
+    Resolve the user from a DRF token or the session.
+
+    Returns (user, error_response); mirrors TokenAuthentication followed by
+    SessionAuthentication, including the CSRF check for session users.
+    """
+    header = request.headers.get('Authorization', '').split()
+    if header and header[0].lower() == 'token':
+        if len(header) != 2:
+            return None, JsonResponse({'detail': 'Invalid token header.'}, status=401)
+        try:
+            token = await Token.objects.select_related('user').aget(key=header[1])
+        except Token.DoesNotExist:
+            return None, JsonResponse({'detail': 'Invalid token.'}, status=401)
+        if not token.user.is_active:
+            return None, JsonResponse({'detail': 'User inactive or deleted.'}, status=401)
+        return token.user, None
+
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return None, JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    reason = await sync_to_async(_csrf_failure)(request)
+    if reason:
+        return None, JsonResponse({'detail': f'CSRF Failed: {reason}'}, status=403)
+    return user, None
+
+
+async def _aget_owned_conversation(conversation_id, user):
+    try:
+        return await Conversation.objects.aget(id=conversation_id, user=user)
+    except (Conversation.DoesNotExist, ValueError, TypeError, ValidationError):
+        return None
+
+
+def _not_found():
+    return JsonResponse({'detail': 'Not found.'}, status=404)
+
+
+class AsyncWorkflowView(View):
+    """
+    Base for async workflow endpoints: authentication and JSON handling
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Session requests are CSRF-checked in _authenticate, as in DRF
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        user, error = await _authenticate(request)
+        if error is not None:
+            return error
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_data(self, request):
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'{}')
+            except ValueError:
+                return None
+        return request.POST
+
+
+# Chat Workflow Views
+class AsyncChatMessageWorkflowView(AsyncWorkflowView):
+    """
+    Async workflow endpoint: POST /api/chat/async/message
+    """
+
+    async def post(self, request):
+        data = self.get_data(request)
+        if data is None:
+            return JsonResponse({'detail': 'JSON parse error.'}, status=400)
+        serializer = WorkflowChatMessageSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        order_type = serializer.validated_data.get('order_type', 'general')
+        conversation_id = serializer.validated_data.get('conversation_id')
+        message_text = serializer.validated_data.get('message', '')
+
+        ai_service = AIProcessingService()
+        welcome_message = None
+        welcome_obj = None
+
+        if conversation_id:
+            try:
+                conversation = await Conversation.objects.aget(id=conversation_id)
+            except Conversation.DoesNotExist:
+                return _not_found()
+            if conversation.user_id != request.user.id:
+                return JsonResponse({'detail': 'You do not have access to this conversation.'}, status=403)
+        else:
+            conversation = await Conversation.objects.acreate(
+                user=request.user,
+                conversation_type='chat',
+                metadata={'order_type': order_type}
+            )
+            welcome_message = await sync_to_async(ai_service.get_welcome_message)(
+                order_type, request.user.group_id
+            )
+            welcome_obj = await Message.objects.acreate(
+                conversation=conversation,
+                sender_type='ai',
+                content=welcome_message,
+                metadata={'type': 'welcome'}
+            )
+
+        if not message_text:
+            return JsonResponse({
+                'conversation_id': conversation.id,
+                'welcome_message': welcome_message,
+                'ai_response': MessageSerializer(welcome_obj).data if welcome_obj else None
+            }, status=201 if welcome_message else 200)
+
+        # Save user message
+        user_message = await Message.objects.acreate(
+            conversation=conversation,
+            sender=request.user,
+            sender_type='user',
+            content=message_text
+        )
+
+        if settings.CHAT_ASYNC_PROCESSING:
+            # The reply is generated by a Celery task; queueing is sync
+            ai_message, reply = await sync_to_async(_reply_to_message)(
+                ai_service, conversation, user_message, request.user
+            )
+        else:
+            ai_response = await ai_service.aprocess_chat_message(
+                conversation=conversation,
+                message=message_text,
+                user=request.user
+            )
+            ai_message = await Message.objects.acreate(
+                conversation=conversation,
+                sender_type='ai',
+                content=ai_response['response'],
+                metadata=ai_response.get('metadata', {}),
+                processed_at=timezone.now()
+            )
+            reply = {
+                'status': 'completed',
+                'intent': ai_response.get('intent'),
+                'entities': ai_response.get('entities')
+            }
+
+        return JsonResponse({
+            'conversation_id': conversation.id,
+            'user_message': MessageSerializer(user_message).data,
+            'ai_response': MessageSerializer(ai_message).data,
+            'ai_message_id': ai_message.id,
+            **reply
+        }, status=202 if reply['status'] == 'pending' else 200)
+
+
+class AsyncChatHistoryWorkflowView(AsyncWorkflowView):
+    """
+    Async workflow endpoint: GET /api/chat/async/history
+
+    Paginated like the DRF view (keyset cursors, next/previous/since_cursor/results).
+    """
+
+    async def get(self, request):
+        conversation_id = request.GET.get('conversation_id')
+        if not conversation_id:
+            return JsonResponse({'detail': 'conversation_id is required'}, status=400)
+        conversation = await _aget_owned_conversation(conversation_id, request.user)
+        if conversation is None:
+            return _not_found()
+
+        paginator = MessageKeysetPagination()
+        messages = conversation.messages.select_related('sender')
+        try:
+            page = await sync_to_async(paginator.paginate_queryset)(messages, Request(request))
+        except NotFound as e:
+            return JsonResponse({'detail': str(e.detail)}, status=404)
+        return JsonResponse(paginator.get_paginated_response(MessageSerializer(page, many=True).data).data)
+
+
+class AsyncChatStatusWorkflowView(AsyncWorkflowView):
+    """
+    Async workflow endpoint: GET /api/chat/async/status
+    """
+
+    async def get(self, request):
+        try:
+            message_id = int(request.GET.get('message_id') or 0)
+            conversation_id = int(request.GET.get('conversation_id') or 0)
+        except ValueError:
+            return JsonResponse({'detail': 'message_id and conversation_id must be integers'}, status=400)
+        if message_id:
+            # Poll the state of an AI reply queued by the message endpoint
+            try:
+                message = await Message.objects.select_related('sender').aget(
+                    id=message_id, conversation__user=request.user
+                )
+            except Message.DoesNotExist:
+                return _not_found()
+            return JsonResponse({
+                'status': message.metadata.get('status', 'completed'),
+                'message': MessageSerializer(message).data,
+                'intent': message.metadata.get('intent'),
+                'entities': message.metadata.get('entities')
+            })
+
+        # Joined with its counters for ConversationSerializer
+        conversations = shape_queryset(Conversation.objects.filter(user=request.user), ConversationSerializer)
+        if conversation_id:
+            try:
+                conversation = await conversations.aget(id=conversation_id)
+            except Conversation.DoesNotExist:
+                return _not_found()
+        else:
+            conversation = await conversations.order_by('-started_at').afirst()
+            if not conversation:
+                return JsonResponse({'active': False})
+
+        return JsonResponse({
+            'active': True,
+            # Off the loop: a conversation without counters falls back to counting its messages
+            'conversation': await sync_to_async(lambda: ConversationSerializer(conversation).data)()
+        })
+
+
+class AsyncChatUpdatesWorkflowView(AsyncWorkflowView):
+    """
+    Async workflow endpoint: GET /api/chat/async/updates
+
+    Same as the DRF updates endpoint, plus long-polling: with ?wait=<seconds>
+    a request whose If-None-Match still matches, or that finds no new
+    messages, waits on the conversation's pub/sub channel until it changes
+    (at most CHAT_UPDATES_MAX_WAIT seconds).
+    """
+
+    async def get(self, request):
+        try:
+            conversation_id, after, limit, wait = updates.parse_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({'detail': str(e)}, status=400)
+
+        user_id = request.user.pk
+        waited = False
+        version = await updates.aget_version(conversation_id)
+        if version is not None:
+            tag = updates.etag(user_id, conversation_id, version, after)
+            if tag in updates.if_none_match(request.headers.get('If-None-Match')):
+                if not wait:
+                    return _not_modified(tag)
+                version = await updates.wait_for_change(conversation_id, version, wait)
+                waited = True
+                if version is not None:
+                    tag = updates.etag(user_id, conversation_id, version, after)
+                    if tag in updates.if_none_match(request.headers.get('If-None-Match')):
+                        return _not_modified(tag)
+
+        conversation = await _aget_owned_conversation(conversation_id, request.user)
+        if conversation is None:
+            return _not_found()
+
+        async def fetch():
+            messages = conversation.messages.select_related('sender').filter(id__gt=after).order_by('id')
+            return [message async for message in messages[:limit + 1]]
+
+        messages = await fetch()
+        if not messages and wait and not waited and version is not None:
+            changed = await updates.wait_for_change(conversation_id, version, wait)
+            if changed is not None and changed != version:
+                version = changed
+                messages = await fetch()
+
+        response = JsonResponse(_updates_response_data(conversation_id, version, messages, limit))
+        if version is not None:
+            response['ETag'] = updates.etag(user_id, conversation_id, version, after)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,128 @@
+"""
+Bulk AI processing of chat messages.
+
+``BatchProcessor`` reprocesses many messages of one group at a time, in
+chunks of ``BATCH_PROCESS_CHUNK_SIZE``: intent and entity extraction runs
+on the group's compiled extractor, knowledge retrieval embeds the whole
+chunk in one call (``retrieve_knowledge_many``), and, when replies are
+requested, LLM calls fan out over at most ``BATCH_LLM_CONCURRENCY``
+threads. Results are yielded per message, in input order, as soon as
+their chunk is done, so callers can stream them (NDJSON) instead of
+holding the whole batch in memory; ``aprocess`` does the same for async
+callers, which ASGI needs to send each chunk as soon as it is ready.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import OperationalError, ProgrammingError, connections
+
+from knowledge.retrieval import retrieve_knowledge_many
+from .extraction import get_extractor, summarize_entities
+from .llm import get_llm_client
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(items, size):
+    """Yield lists of up to size items from any iterable"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _knowledge_summary(item):
+    return {'id': item['id'], 'title': item.get('title'), 'score': item.get('score')}
+
+
+class BatchProcessor:
+    """
+    Extraction, retrieval and optional replies for batches of messages
+    """
+
+    def __init__(self, group_id=None, generate=False, order_type='general', knowledge_limit=3,
+                 chunk_size=None, concurrency=None):
+        self.group_id = group_id
+        self.generate = generate
+        self.order_type = order_type
+        self.knowledge_limit = knowledge_limit
+        self.chunk_size = chunk_size or getattr(settings, 'BATCH_PROCESS_CHUNK_SIZE', 500)
+        self.concurrency = concurrency or getattr(settings, 'BATCH_LLM_CONCURRENCY', 4)
+
+    def process(self, items):
+        """
+        Yield one result per item, in order.
+
+        ``items`` is an iterable of {'id', 'message'} dicts; ``id`` is echoed
+        back so callers can match results to their source rows.
+        """
+        for chunk in chunked(items, self.chunk_size):
+            yield from self.process_chunk(chunk)
+
+    async def aprocess(self, items):
+        """Async variant of process for ASGI streaming; each chunk runs in a worker thread"""
+        for chunk in chunked(items, self.chunk_size):
+            for result in await sync_to_async(self.process_chunk)(chunk):
+                yield result
+
+    def process_chunk(self, chunk):
+        """Process one chunk and return its results"""
+        messages = [item['message'] for item in chunk]
+        extractor = get_extractor(self.group_id)
+        extracted = [extractor.extract(message) for message in messages]
+        knowledge = self._retrieve(messages)
+        replies = self._generate(messages, knowledge) if self.generate else None
+
+        results = []
+        for index, item in enumerate(chunk):
+            result = {
+                'id': item.get('id'),
+                'intent': extracted[index]['intent'],
+                'intent_score': extracted[index]['score'],
+                'intents': extracted[index]['intents'],
+                'entities': summarize_entities(extracted[index]['entities']),
+                'entity_spans': extracted[index]['entities'],
+                'knowledge': [_knowledge_summary(entry) for entry in knowledge[index]],
+            }
+            if replies is not None:
+                result['response'] = replies[index]
+            results.append(result)
+        return results
+
+    def _retrieve(self, messages):
+        try:
+            return retrieve_knowledge_many(messages, self.group_id, limit=self.knowledge_limit)
+        except (OperationalError, ProgrammingError) as db_error:
+            logger.warning("Knowledge tables unavailable during batch processing: %s", db_error)
+            return [[] for _ in messages]
+
+    def _generate(self, messages, knowledge):
+        from .services import AIProcessingService
+
+        service = AIProcessingService()
+        # Resolve the client up front so worker threads only make LLM calls
+        get_llm_client(self.group_id)
+
+        def reply(message, entries):
+            llm_messages, _ = service._build_llm_messages(message, [], entries)
+            return service._generate_ai_response(
+                message, llm_messages, entries, self.group_id, self.order_type
+            )
+
+        def threaded_reply(message, entries):
+            try:
+                return reply(message, entries)
+            finally:
+                # Breaker transitions may open a connection in this thread
+                connections.close_all()
+
+        workers = min(self.concurrency, len(messages))
+        if workers <= 1:
+            return [reply(message, entries) for message, entries in zip(messages, knowledge)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(threaded_reply, messages, knowledge))
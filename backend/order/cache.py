@@ -0,0 +1,162 @@
+"""
+Response cache for repeated chat questions.
+
+Replies generated by the LLM are stored in ``CACHES['default']`` under a
+fingerprint of (group, order type, retrieved knowledge set, conversation
+context, normalised message). The context is the summary and history turns
+sent to the LLM with the question, so a reply built from one user's
+conversation is only served to a request that sent the LLM exactly the same
+context (e.g. two fresh conversations that only hold the welcome message),
+never to another user asking the same words mid-conversation. Every key
+also carries the global and per-group generation counters, which the
+signal handlers in ``order.signals`` bump whenever a ``KnowledgeEntry`` or
+``Prompt`` changes, so edits invalidate affected replies without scanning
+Redis.
+
+With ``CHAT_RESPONSE_CACHE_NEAR_DUPLICATES`` each worker also keeps a small
+vector index of recently cached questions per (group, order type) and
+serves a stored reply when a new question embeds within
+``CHAT_RESPONSE_CACHE_SIMILARITY`` of one asked against the same knowledge
+and context.
+"""
+import hashlib
+import itertools
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from knowledge.vectors import VectorCollection, get_embedder
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'chat_response'
+NORMALIZE_RE = re.compile(r'[^\w\s]+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_message(message):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return WHITESPACE_RE.sub(' ', NORMALIZE_RE.sub(' ', message.lower())).strip()
+
+
+def knowledge_fingerprint(knowledge):
+    """Hash of the retrieved knowledge entries and their versions"""
+    pairs = sorted((item['id'], item.get('version', 1)) for item in knowledge)
+    return hashlib.sha1(repr(pairs).encode('utf-8')).hexdigest()[:16]
+
+
+def context_fingerprint(llm_messages):
+    """Hash of the conversation context (summary and history turns) sent with a question"""
+    # The first message is the system prompt (covered by the knowledge hash), the last the question
+    turns = [(item['role'], item['content']) for item in llm_messages[1:-1]]
+    return hashlib.sha256(repr(turns).encode('utf-8')).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Exact (shared) and near-duplicate (per-worker) cache of LLM replies
+    """
+
+    def __init__(self):
+        self._near = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'CHAT_RESPONSE_CACHE', True)
+
+    def _generation_key(self, group_id):
+        return f"{KEY_PREFIX}:gen:{group_id or 'global'}"
+
+    def _generation(self, group_id):
+        keys = [self._generation_key(None), self._generation_key(group_id)]
+        values = cache.get_many(keys)
+        return f"{values.get(keys[0], 0)}.{values.get(keys[1], 0)}"
+
+    def invalidate(self, group_id=None):
+        """Invalidate cached replies of a group (None: every group)"""
+        key = self._generation_key(group_id)
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key)
+        except Exception as e:
+            logger.error(f"Could not invalidate chat response cache: {str(e)}")
+
+    def lookup(self, group_id, order_type, knowledge, message, llm_messages):
+        """Return (key, cached reply or None); key is None when caching is off"""
+        if not self.enabled:
+            return None, None
+        try:
+            generation = self._generation(group_id)
+            knowledge_hash = knowledge_fingerprint(knowledge)
+            context_hash = context_fingerprint(llm_messages)
+            normalized = normalize_message(message)
+            fingerprint = hashlib.sha256(
+                f"{group_id}|{order_type}|{knowledge_hash}|{context_hash}|{normalized}".encode('utf-8')
+            ).hexdigest()
+            key = f"{KEY_PREFIX}:{generation}:{fingerprint}"
+            response = cache.get(key)
+            if response is None and self._near_enabled():
+                response = self._near_lookup(
+                    group_id, order_type, generation, knowledge_hash, context_hash, normalized
+                )
+            return key, response
+        except Exception as e:
+            logger.error(f"Chat response cache lookup failed: {str(e)}")
+            return None, None
+
+    def store(self, key, response, group_id, order_type, knowledge, message, llm_messages):
+        """Cache a generated reply under the key returned by lookup"""
+        if key is None:
+            return
+        try:
+            cache.set(key, response, timeout=getattr(settings, 'CHAT_RESPONSE_CACHE_TTL', 3600))
+            if self._near_enabled():
+                generation = key.split(':')[1]
+                self._near_add(group_id, order_type, generation, knowledge_fingerprint(knowledge),
+                               context_fingerprint(llm_messages), normalize_message(message), key)
+        except Exception as e:
+            logger.error(f"Chat response cache store failed: {str(e)}")
+
+    def _near_enabled(self):
+        return getattr(settings, 'CHAT_RESPONSE_CACHE_NEAR_DUPLICATES', False)
+
+    def _near_collection(self, group_id, order_type, generation):
+        scope = (group_id, order_type)
+        with self._lock:
+            entry = self._near.get(scope)
+            if entry is None or entry[0] != generation:
+                entry = (generation, VectorCollection(get_embedder()), OrderedDict())
+                self._near[scope] = entry
+            return entry[1], entry[2]
+
+    def _near_lookup(self, group_id, order_type, generation, knowledge_hash, context_hash, normalized):
+        collection, _ = self._near_collection(group_id, order_type, generation)
+        if not len(collection):
+            return None
+        threshold = getattr(settings, 'CHAT_RESPONSE_CACHE_SIMILARITY', 0.92)
+        for hit in collection.search(normalized, k=5, min_score=threshold):
+            if hit['knowledge'] == knowledge_hash and hit['context'] == context_hash:
+                response = cache.get(hit['key'])
+                if response is not None:
+                    return response
+        return None
+
+    def _near_add(self, group_id, order_type, generation, knowledge_hash, context_hash, normalized, key):
+        collection, order = self._near_collection(group_id, order_type, generation)
+        item_id = next(self._ids)
+        collection.add(item_id, normalized, {'key': key, 'knowledge': knowledge_hash, 'context': context_hash})
+        with self._lock:
+            order[item_id] = None
+            limit = getattr(settings, 'CHAT_RESPONSE_CACHE_NEAR_DUPLICATE_SIZE', 500)
+            while len(order) > limit:
+                oldest, _ = order.popitem(last=False)
+                collection.remove(oldest)
+
+
+response_cache = ResponseCache()
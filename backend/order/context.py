@@ -0,0 +1,150 @@
+"""
+Token-budgeted prompt assembly for the chat LLM.
+
+``ContextBuilder`` fills ``CHAT_CONTEXT_TOKEN_BUDGET`` in priority order:
+the system prompt and the new user message always go in, then knowledge
+snippets (each entry trimmed to the sentences that overlap the question),
+then the conversation summary, then as many recent turns as still fit,
+newest first. Turns that no longer fit are folded into a rolling
+extractive summary kept in ``Conversation.metadata['summary']``, so long
+conversations send a bounded digest instead of their full history.
+
+Token counts are a fast estimate (roughly one token per short word or
+punctuation mark, more for long words), close enough for budgeting.
+"""
+import re
+
+from django.conf import settings
+
+from knowledge.index import tokenize
+
+PIECE_RE = re.compile(r'\w+|[^\w\s]')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text):
+    """Estimate the number of LLM tokens in a text"""
+    return sum(1 + len(piece) // 8 for piece in PIECE_RE.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to about max_tokens, on a word boundary"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    used = 0
+    for match in PIECE_RE.finditer(text):
+        used += 1 + len(match.group()) // 8
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + '…'
+    return text
+
+
+def relevant_passages(content, query_terms, max_tokens):
+    """Keep the sentences of content that best match the query, in original order"""
+    if count_tokens(content) <= max_tokens:
+        return content
+    sentences = [s.strip() for s in SENTENCE_RE.split(content) if s.strip()]
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(query_terms.intersection(tokenize(sentences[i]))), i)
+    )
+    chosen = []
+    used = 0
+    for i in ranked:
+        cost = count_tokens(sentences[i])
+        if used + cost > max_tokens:
+            if not chosen:
+                chosen.append(i)
+                sentences[i] = truncate_to_tokens(sentences[i], max_tokens)
+            break
+        chosen.append(i)
+        used += cost
+    return ' '.join(sentences[i] for i in sorted(chosen))
+
+
+class ContextBuilder:
+    """
+    Assembles LLM messages within a token budget
+    """
+
+    def __init__(self, budget=None, snippet_tokens=None, knowledge_share=None):
+        self.budget = budget or getattr(settings, 'CHAT_CONTEXT_TOKEN_BUDGET', 2000)
+        self.snippet_tokens = snippet_tokens or getattr(settings, 'CHAT_CONTEXT_SNIPPET_TOKENS', 150)
+        self.knowledge_share = knowledge_share or getattr(settings, 'CHAT_CONTEXT_KNOWLEDGE_SHARE', 0.4)
+
+    def build(self, system_prompt, message, knowledge, history, summary=''):
+        """
+        Return (messages, dropped).
+
+        ``history`` is a list of {'id', 'role', 'content'} dicts, oldest first;
+        ``dropped`` are the older turns that did not fit the budget.
+        """
+        remaining = self.budget - count_tokens(system_prompt) - count_tokens(message) - 2 * MESSAGE_OVERHEAD
+
+        # Knowledge snippets, best-ranked first, capped at a share of the budget
+        query_terms = set(tokenize(message))
+        knowledge_budget = int(max(0, remaining) * self.knowledge_share)
+        snippets = []
+        for item in knowledge:
+            snippet = relevant_passages(item['content'], query_terms, self.snippet_tokens)
+            cost = count_tokens(snippet) + 1
+            if cost > knowledge_budget:
+                break
+            snippets.append(snippet)
+            knowledge_budget -= cost
+            remaining -= cost
+        if snippets:
+            system_prompt += "\n\nRelevant information:\n" + "\n".join(snippets)
+
+        messages = [{"role": "system", "content": system_prompt}]
+
+        # The summary may take up to half of what is left; its newest lines matter most
+        lines = summary.splitlines()
+        while lines:
+            summary_text = "Summary of the earlier conversation:\n" + "\n".join(lines)
+            cost = count_tokens(summary_text) + MESSAGE_OVERHEAD
+            if cost <= remaining // 2:
+                messages.append({"role": "system", "content": summary_text})
+                remaining -= cost
+                break
+            lines.pop(0)
+
+        turns = []
+        kept = len(history)
+        for index in range(len(history) - 1, -1, -1):
+            cost = count_tokens(history[index]['content']) + MESSAGE_OVERHEAD
+            if cost > remaining:
+                break
+            turns.append({"role": history[index]['role'], "content": history[index]['content']})
+            remaining -= cost
+            kept = index
+        messages.extend(reversed(turns))
+        messages.append({"role": "user", "content": message})
+        return messages, history[:kept]
+
+
+def roll_summary(summary, dropped, max_tokens=None):
+    """
+    Fold dropped turns into a stored summary dict ({'text', 'through_id'}).
+
+    Each turn contributes its lead sentence; the oldest lines are discarded
+    once the summary exceeds ``CHAT_SUMMARY_TOKENS``. Returns the new dict,
+    or None when nothing changed.
+    """
+    max_tokens = max_tokens or getattr(settings, 'CHAT_SUMMARY_TOKENS', 300)
+    summary = summary or {}
+    through_id = summary.get('through_id', 0)
+    new_turns = [turn for turn in dropped if turn['id'] > through_id]
+    if not new_turns:
+        return None
+
+    lines = summary.get('text', '').splitlines()
+    for turn in new_turns:
+        lead = SENTENCE_RE.split(turn['content'].strip(), 1)[0]
+        speaker = 'User' if turn['role'] == 'user' else 'Assistant'
+        lines.append(f"{speaker}: {truncate_to_tokens(lead, 40)}")
+    while len(lines) > 1 and count_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return {'text': '\n'.join(lines), 'through_id': new_turns[-1]['id']}
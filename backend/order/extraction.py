@@ -0,0 +1,234 @@
+"""
+Intent and entity extraction for chat messages.
+
+All intent keywords are compiled into one regex anchored at word starts,
+with shared prefixes factored into a trie so the scan costs about the same
+however many keywords exist. Entity patterns are compiled at import and
+skipped when a message cannot contain them (no digits, no ``@``).
+``extract`` reports every match with its character span and a score.
+
+Extra intents come from ``TrainingData`` rows with ``data_type='intent'``:
+each non-empty line of ``input_text`` is a keyword or phrase for the row's
+``intent``. Compiled extractors are cached per group and rebuilt when
+training data changes (see ``order.signals``) or after
+``KNOWLEDGE_INDEX_MAX_AGE`` seconds.
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+
+DEFAULT_INTENT = 'general_info'
+
+# Keywords per intent, in priority order (ties go to the earlier intent)
+BASE_INTENTS = {
+    'loan_inquiry': ['loan', 'borrow', 'lend', 'credit'],
+    'insurance_inquiry': ['insurance', 'policy', 'coverage', 'claim'],
+    'general_info': ['information', 'help', 'what', 'how'],
+    'greeting': ['hello', 'hi', 'hey', 'good morning', 'good afternoon'],
+    'goodbye': ['bye', 'goodbye', 'see you', 'thanks'],
+}
+
+# Catch-all and conversational intents count for less than product intents
+INTENT_WEIGHTS = {
+    'general_info': 0.5,
+    'greeting': 0.5,
+    'goodbye': 0.5,
+}
+
+AMOUNT_RE = re.compile(r'\$?\d+(?:,\d{3})*(?:\.\d{2})?')
+TIMEFRAME_RE = re.compile(r'\b(\d+)\s*(days?|weeks?|months?|years?)\b', re.IGNORECASE)
+EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+PHONE_RE = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
+DIGIT_RE = re.compile(r'\d')
+
+
+def _amount_score(text):
+    return 0.9 if text.startswith('$') or ',' in text or '.' in text else 0.5
+
+
+def extract_entities(message):
+    """Every entity match as {'type', 'value', 'start', 'end', 'score'}"""
+    entities = []
+    has_digits = DIGIT_RE.search(message) is not None
+    for match in AMOUNT_RE.finditer(message) if has_digits else ():
+        entities.append({
+            'type': 'amount', 'value': match.group(), 'start': match.start(),
+            'end': match.end(), 'score': _amount_score(match.group())
+        })
+    for match in TIMEFRAME_RE.finditer(message) if has_digits else ():
+        entities.append({
+            'type': 'timeframe', 'value': [match.group(1), match.group(2)],
+            'start': match.start(), 'end': match.end(), 'score': 0.9
+        })
+    for match in EMAIL_RE.finditer(message) if '@' in message else ():
+        entities.append({
+            'type': 'email', 'value': match.group(), 'start': match.start(),
+            'end': match.end(), 'score': 1.0
+        })
+    for match in PHONE_RE.finditer(message) if has_digits else ():
+        entities.append({
+            'type': 'phone', 'value': match.group(), 'start': match.start(),
+            'end': match.end(), 'score': 0.8
+        })
+    return entities
+
+
+def summarize_entities(entities):
+    """The legacy entity dict stored on messages: first amount/timeframe, all contacts"""
+    first = {}
+    for entity in entities:
+        first.setdefault(entity['type'], entity['value'])
+    return {
+        'amount': first.get('amount'),
+        'timeframe': first.get('timeframe'),
+        'contact_info': {
+            'emails': [e['value'] for e in entities if e['type'] == 'email'],
+            'phones': [e['value'] for e in entities if e['type'] == 'phone'],
+        }
+    }
+
+
+def _trie_regex(keywords):
+    """
+    Regex for a set of keywords with shared prefixes factored out.
+
+    Python's ``re`` tries alternatives one by one, so a flat ``a|b|c`` costs
+    O(keywords) per position; the trie form makes each step a single branch.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        if '' in node and len(node) == 1:
+            return ''
+        branches = []
+        for char in sorted(key for key in node if key):
+            piece = r'\s+' if char == ' ' else re.escape(char)
+            branches.append(piece + build(node[char]))
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            body = f'(?:{body})?'
+        return body
+
+    return build(trie)
+
+
+class IntentExtractor:
+    """
+    Single-pass keyword intent matcher plus precompiled entity patterns
+    """
+
+    def __init__(self, intents=None):
+        intents = intents or BASE_INTENTS
+        self.priority = {intent: rank for rank, intent in enumerate(intents)}
+        self.keywords = {}
+        for intent, keywords in intents.items():
+            for keyword in keywords:
+                keyword = ' '.join(keyword.lower().split())
+                if keyword:
+                    self.keywords.setdefault(keyword, []).append(intent)
+        # Messages are lowercased before matching, so IGNORECASE is only a fallback
+        source = r'\b' + _trie_regex(self.keywords) if self.keywords else None
+        self.pattern = re.compile(source) if source else None
+        self.pattern_ci = re.compile(source, re.IGNORECASE) if source else None
+        self.built_at = time.monotonic()
+
+    def match_intents(self, message):
+        """Keyword matches as {'intent', 'keyword', 'start', 'end'}"""
+        if self.pattern is None:
+            return []
+        pattern, text = self.pattern, message.lower()
+        if len(text) != len(message):
+            # Rare case mappings change length; match the original text to keep spans
+            pattern, text = self.pattern_ci, message
+        matches = []
+        for match in pattern.finditer(text):
+            keyword = ' '.join(match.group().lower().split())
+            for intent in self.keywords[keyword]:
+                matches.append({
+                    'intent': intent, 'keyword': keyword,
+                    'start': match.start(), 'end': match.end()
+                })
+        return matches
+
+    def extract(self, message):
+        """
+        Return {'intent', 'score', 'intents', 'matches', 'entities'}.
+
+        ``intents`` ranks every matched intent by weighted keyword hits, ties
+        going to the earlier intent; ``score`` is the winner's share.
+        """
+        matches = self.match_intents(message)
+        totals = {}
+        for match in matches:
+            totals[match['intent']] = totals.get(match['intent'], 0.0) + INTENT_WEIGHTS.get(match['intent'], 1.0)
+        total = sum(totals.values())
+        ranked = sorted(
+            totals.items(),
+            key=lambda item: (-item[1], self.priority.get(item[0], len(self.priority)))
+        )
+        intents = [{'intent': intent, 'score': round(value / total, 4)} for intent, value in ranked]
+        return {
+            'intent': intents[0]['intent'] if intents else DEFAULT_INTENT,
+            'score': intents[0]['score'] if intents else 0.0,
+            'intents': intents,
+            'matches': matches,
+            'entities': extract_entities(message),
+        }
+
+
+class ExtractorRegistry:
+    """
+    Per-worker extractors keyed by group, including TrainingData intents
+    """
+
+    def __init__(self):
+        self._extractors = {}
+        self._lock = threading.Lock()
+
+    def get(self, group_id=None):
+        max_age = getattr(settings, 'KNOWLEDGE_INDEX_MAX_AGE', 300)
+        extractor = self._extractors.get(group_id)
+        if extractor is not None and time.monotonic() - extractor.built_at < max_age:
+            return extractor
+
+        with self._lock:
+            extractor = self._extractors.get(group_id)
+            if extractor is None or time.monotonic() - extractor.built_at >= max_age:
+                extractor = IntentExtractor(self._intents(group_id))
+                self._extractors[group_id] = extractor
+            return extractor
+
+    def _intents(self, group_id):
+        from django.db import OperationalError, ProgrammingError
+        from knowledge.models import TrainingData
+
+        intents = {intent: list(keywords) for intent, keywords in BASE_INTENTS.items()}
+        try:
+            rows = TrainingData.objects.filter(data_type='intent').exclude(intent='').filter(
+                Q(group_id=group_id) | Q(group__isnull=True)
+            ).values_list('intent', 'input_text')
+            for intent, text in rows.iterator():
+                intents.setdefault(intent, []).extend(line for line in text.splitlines() if line.strip())
+        except (OperationalError, ProgrammingError):
+            pass
+        return intents
+
+    def clear(self):
+        with self._lock:
+            self._extractors.clear()
+
+
+extractors = ExtractorRegistry()
+
+
+def get_extractor(group_id=None):
+    """Return the compiled extractor for a group"""
+    return extractors.get(group_id)
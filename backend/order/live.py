@@ -0,0 +1,229 @@
+"""
+Channel layers for live chat delivery.
+
+Events (JSON-serialisable dicts) are published to named groups, one per
+conversation (``conversation_group``), and delivered to every open
+WebSocket subscribed to the group (see ``order.websocket``):
+
+- ``memory``: in-process fan-out, for tests and single-worker setups;
+- ``redis``: Redis pub/sub, so events published by any uvicorn worker or
+  Celery process reach sockets held by every worker.
+
+``CHAT_CHANNEL_LAYER`` selects the layer (``redis`` uses the Redis of
+``CACHES['default']``). ``publish`` is synchronous and
+safe to call from any thread (signal handlers, Celery tasks);
+``apublish`` is its async counterpart for code on the event loop.
+"""
+import asyncio
+import json
+import logging
+import threading
+import weakref
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'chat_live'
+
+
+def conversation_group(conversation_id):
+    return f"conversation.{conversation_id}"
+
+
+class InMemorySubscription:
+    """
+    Events of the groups a subscriber has joined, queued on its event loop
+    """
+
+    def __init__(self, layer, max_size):
+        self.layer = layer
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.groups = set()
+
+    async def add(self, group):
+        self.groups.add(group)
+        self.layer._join(group, self)
+
+    async def discard(self, group):
+        self.groups.discard(group)
+        self.layer._leave(group, self)
+
+    def _deliver(self, group, event):
+        try:
+            self.queue.put_nowait((group, event))
+        except asyncio.QueueFull:
+            logger.warning(f"Dropped live chat event for a slow subscriber of {group}")
+
+    async def get(self):
+        """Next (group, event) delivered to this subscriber"""
+        return await self.queue.get()
+
+    async def close(self):
+        for group in list(self.groups):
+            await self.discard(group)
+
+
+class InMemoryChannelLayer:
+    """
+    Group fan-out within this process
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def _join(self, group, subscription):
+        with self._lock:
+            self._groups.setdefault(group, set()).add(subscription)
+
+    def _leave(self, group, subscription):
+        with self._lock:
+            members = self._groups.get(group)
+            if members is not None:
+                members.discard(subscription)
+                if not members:
+                    del self._groups[group]
+
+    def subscribe(self):
+        return InMemorySubscription(self, self.max_size)
+
+    def publish(self, group, event):
+        with self._lock:
+            members = list(self._groups.get(group, ()))
+        for subscription in members:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, group, event)
+            except RuntimeError:
+                # The subscriber's loop is closed
+                self._leave(group, subscription)
+        return len(members)
+
+    async def apublish(self, group, event):
+        return self.publish(group, event)
+
+
+class RedisSubscription:
+    """
+    A Redis pub/sub connection following the groups a subscriber has joined
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.pubsub = layer._client().pubsub()
+        self.groups = set()
+        self._joined = asyncio.Event()
+
+    async def add(self, group):
+        self.groups.add(group)
+        await self.pubsub.subscribe(self.layer._channel(group))
+        self._joined.set()
+
+    async def discard(self, group):
+        if group in self.groups:
+            self.groups.discard(group)
+            await self.pubsub.unsubscribe(self.layer._channel(group))
+
+    async def get(self):
+        """Next (group, event) delivered to this subscriber"""
+        while True:
+            if not self.groups:
+                self._joined.clear()
+                await self._joined.wait()
+                continue
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None or message['type'] != 'message':
+                continue
+            channel = message['channel'].decode('utf-8')
+            group = channel[len(KEY_PREFIX) + 1:]
+            if group in self.groups:
+                return group, json.loads(message['data'])
+
+    async def close(self):
+        try:
+            await self.pubsub.unsubscribe()
+            await self.pubsub.aclose()
+        except Exception as e:
+            logger.error(f"Could not close live chat subscription: {str(e)}")
+
+
+class RedisChannelLayer:
+    """
+    Group fan-out across processes over Redis pub/sub
+    """
+
+    def __init__(self, url):
+        self.url = url
+        # One async client per event loop; connections cannot cross loops
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _channel(self, group):
+        return f"{KEY_PREFIX}:{group}"
+
+    def _client(self):
+        import redis.asyncio as aioredis
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = aioredis.Redis.from_url(self.url)
+        return client
+
+    def subscribe(self):
+        return RedisSubscription(self)
+
+    def publish(self, group, event):
+        from django_redis import get_redis_connection
+
+        return get_redis_connection('default').publish(
+            self._channel(group), json.dumps(event, cls=DjangoJSONEncoder)
+        )
+
+    async def apublish(self, group, event):
+        return await self._client().publish(self._channel(group), json.dumps(event, cls=DjangoJSONEncoder))
+
+
+_layer = None
+_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    """The configured channel layer (built once per process)"""
+    global _layer
+    if _layer is None:
+        with _layer_lock:
+            if _layer is None:
+                cache_config = settings.CACHES['default']
+                if getattr(settings, 'CHAT_CHANNEL_LAYER', 'memory') != 'redis':
+                    _layer = InMemoryChannelLayer()
+                elif cache_config['BACKEND'] != 'django_redis.cache.RedisCache':
+                    logger.warning("CHAT_CHANNEL_LAYER is 'redis' but the default cache is not Redis; "
+                                   "live chat events stay within this process")
+                    _layer = InMemoryChannelLayer()
+                else:
+                    _layer = RedisChannelLayer(cache_config['LOCATION'])
+    return _layer
+
+
+def reset_channel_layer():
+    global _layer
+    with _layer_lock:
+        _layer = None
+
+
+def publish(conversation_id, event):
+    """Publish an event to a conversation's subscribers; errors are logged, not raised"""
+    try:
+        get_channel_layer().publish(conversation_group(conversation_id), event)
+    except Exception as e:
+        logger.error(f"Could not publish live chat event for conversation {conversation_id}: {str(e)}")
+
+
+async def apublish(conversation_id, event):
+    try:
+        await get_channel_layer().apublish(conversation_group(conversation_id), event)
+    except Exception as e:
+        logger.error(f"Could not publish live chat event for conversation {conversation_id}: {str(e)}")
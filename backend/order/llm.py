@@ -0,0 +1,405 @@
+"""
+LLM chat clients used by AIProcessingService.
+
+``LLM_CLIENT`` selects the implementation (dotted path). ``FakeLLMClient``
+answers deterministically without network access, for tests and demos;
+``FAKE_LLM_LATENCY`` adds a simulated per-call delay for load benchmarks.
+
+Clients are process-wide: ``get_llm_client`` returns one instance per
+provider and group, configured from the matching active ``llm_text``
+``core.APIConfiguration`` (group-specific first, then global, then
+``OPENAI_API_KEY``). Each ``OpenAIChatClient`` keeps pooled keep-alive HTTP
+connections, bounds every call by ``LLM_TIMEOUT`` seconds including
+jittered retries, and sits behind a ``CircuitBreaker`` that rejects calls
+immediately while the upstream is failing.
+"""
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+import weakref
+
+import httpx
+import openai
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CHUNK_RE = re.compile(r'\S+\s*|\s+')
+
+# Errors that mean the upstream is unavailable or overloaded
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def chunk_text(text):
+    """Split text into word-sized chunks that concatenate back to the original"""
+    return CHUNK_RE.findall(text)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker around one upstream
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go through; admits one probe after the reset timeout"""
+        transition = None
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            if self.state == self.OPEN:
+                transition = self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                allowed = True
+            elif self._probing:
+                allowed = False
+            else:
+                self._probing = allowed = True
+        self._report(transition)
+        return allowed
+
+    def record_success(self):
+        transition = None
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                transition = self._transition(self.CLOSED)
+        self._report(transition)
+
+    def record_failure(self):
+        transition = None
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    transition = self._transition(self.OPEN)
+        self._report(transition)
+
+    def release(self):
+        """Free the half-open probe of a call that ended without a verdict (e.g. cancelled)"""
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state):
+        # Called with the lock held; the caller reports the change after releasing it
+        previous, self.state = self.state, state
+        logger.warning(f"LLM circuit '{self.name}' {previous} -> {state}")
+        return previous, state, self.failures
+
+    def _report(self, transition):
+        if transition is not None:
+            record_breaker_transition(self.name, *transition)
+
+
+def _save_transition(name, previous, state, failures):
+    from analytics.models import SystemPerformance
+
+    try:
+        SystemPerformance.objects.create(
+            metric_name='llm_circuit_state',
+            metric_value=CircuitBreaker.STATE_VALUES[state],
+            metric_unit='state',
+            category='llm',
+            metadata={'breaker': name, 'from': previous, 'to': state, 'failures': failures}
+        )
+    except Exception as e:
+        logger.error(f"Could not record LLM circuit transition: {str(e)}")
+
+
+def record_breaker_transition(name, previous, state, failures):
+    """Store a breaker state change as a SystemPerformance metric"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _save_transition(name, previous, state, failures)
+    else:
+        # Keep the ORM write off the event loop
+        loop.run_in_executor(None, _save_transition, name, previous, state, failures)
+
+
+class OpenAIChatClient:
+    """
+    Pooled chat completion client for the OpenAI API (or a compatible endpoint)
+    """
+
+    def __init__(self, api_key=None, model='gpt-3.5-turbo', base_url=None, timeout=None,
+                 max_retries=None, breaker=None):
+        self.api_key = api_key if api_key is not None else settings.OPENAI_API_KEY
+        self.model = model
+        self.base_url = base_url or None
+        self.timeout = timeout if timeout is not None else getattr(settings, 'LLM_TIMEOUT', 30.0)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'LLM_MAX_RETRIES', 2)
+        self.breaker = breaker or CircuitBreaker('openai')
+        self.backoff_base = 0.25
+        self.backoff_cap = 4.0
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return bool(self.api_key)
+
+    def _limits(self):
+        connections = getattr(settings, 'LLM_POOL_MAX_CONNECTIONS', 100)
+        return httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+    def _sync_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_retries=0,
+                        http_client=httpx.Client(limits=self._limits(), timeout=self.timeout)
+                    )
+        return self._client
+
+    def _async_client(self):
+        # httpx async pools are bound to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"LLM circuit '{self.breaker.name}' is open")
+
+    def _retry_delay(self, attempt, deadline):
+        """Full-jitter backoff for the next attempt, or None if out of retries or time"""
+        if attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _remaining(self, deadline):
+        return max(0.1, deadline - time.monotonic())
+
+    def _request(self, messages, max_tokens, temperature, **kwargs):
+        return dict(model=self.model, messages=messages, max_tokens=max_tokens,
+                    temperature=temperature, **kwargs)
+
+    def complete(self, messages, max_tokens=500, temperature=0.7):
+        """Return the full completion text"""
+        self._check_breaker()
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = self._sync_client().chat.completions.create(
+                    timeout=self._remaining(deadline),
+                    **self._request(messages, max_tokens, temperature)
+                )
+            except RETRYABLE_ERRORS:
+                delay = self._retry_delay(attempt, deadline)
+                if delay is None:
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                # The upstream answered (e.g. a 4xx), so it is not an availability failure
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return response.choices[0].message.content
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7):
+        """Return the full completion text without blocking the event loop"""
+        self._check_breaker()
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = await self._async_client().chat.completions.create(
+                    timeout=self._remaining(deadline),
+                    **self._request(messages, max_tokens, temperature)
+                )
+            except RETRYABLE_ERRORS:
+                delay = self._retry_delay(attempt, deadline)
+                if delay is None:
+                    self.breaker.record_failure()
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                self.breaker.record_success()
+                raise
+            except BaseException:
+                # Cancelled: no verdict on the upstream
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return response.choices[0].message.content
+
+    async def astream(self, messages, max_tokens=500, temperature=0.7):
+        """Yield completion text deltas as they arrive (no retries once started)"""
+        self._check_breaker()
+        try:
+            stream = await self._async_client().chat.completions.create(
+                timeout=self.timeout,
+                **self._request(messages, max_tokens, temperature, stream=True)
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except RETRYABLE_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Closed or cancelled by the consumer, or a non-retryable error: neither verdict
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+
+
+class FakeLLMClient:
+    """
+    Deterministic offline client that echoes the last user message
+    """
+
+    available = True
+
+    def __init__(self, reply=None, latency=None, **options):
+        self.reply = reply
+        self.latency = latency if latency is not None else getattr(settings, 'FAKE_LLM_LATENCY', 0.0)
+
+    def _reply_for(self, messages):
+        if self.reply is not None:
+            return self.reply
+        last_user = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        return f"You asked: {last_user}"
+
+    def complete(self, messages, max_tokens=500, temperature=0.7):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._reply_for(messages)
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._reply_for(messages)
+
+    async def astream(self, messages, max_tokens=500, temperature=0.7):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in chunk_text(self._reply_for(messages)):
+            yield chunk
+
+
+class LLMClientRegistry:
+    """
+    Process-wide LLM clients and circuit breakers keyed by (provider, group)
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, group_id=None, provider='openai'):
+        """Return the client for a group, re-reading its configuration after LLM_CLIENT_CONFIG_TTL"""
+        key = (provider, group_id)
+        ttl = getattr(settings, 'LLM_CLIENT_CONFIG_TTL', 60)
+        cached = self._clients.get(key)
+        if cached is not None and time.monotonic() - cached[2] < ttl:
+            return cached[1]
+
+        options = self._options(provider, group_id)
+        path = getattr(settings, 'LLM_CLIENT', 'order.llm.OpenAIChatClient')
+        signature = (path, tuple(sorted(options.items())))
+        with self._lock:
+            cached = self._clients.get(key)
+            if cached is not None and cached[0] == signature:
+                client = cached[1]
+            else:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = CircuitBreaker(
+                        f"{provider}:{group_id or 'global'}",
+                        failure_threshold=getattr(settings, 'LLM_BREAKER_FAILURE_THRESHOLD', 5),
+                        reset_timeout=getattr(settings, 'LLM_BREAKER_RESET_TIMEOUT', 30.0),
+                    )
+                    self._breakers[key] = breaker
+                client = import_string(path)(breaker=breaker, **options)
+            self._clients[key] = (signature, client, time.monotonic())
+            return client
+
+    def _options(self, provider, group_id):
+        from core.models import APIConfiguration
+
+        config = APIConfiguration.objects.filter(
+            api_type='llm_text', provider=provider, is_active=True
+        ).filter(
+            Q(group_id=group_id) | Q(group__isnull=True)
+        ).order_by(F('group').desc(nulls_last=True), '-updated_at').first()
+        if config is None:
+            return {}
+        options = {'api_key': config.api_key_encrypted}
+        if config.endpoint_url:
+            options['base_url'] = config.endpoint_url
+        for name in ('model', 'timeout', 'max_retries'):
+            if name in config.configuration:
+                options[name] = config.configuration[name]
+        return options
+
+    def breaker_states(self):
+        """Current state of every breaker, for monitoring"""
+        return {breaker.name: breaker.state for breaker in list(self._breakers.values())}
+
+    def clear(self):
+        """Forget cached clients so configuration is re-read (breakers are kept)"""
+        with self._lock:
+            self._clients.clear()
+
+
+llm_clients = LLMClientRegistry()
+
+
+def get_llm_client(group_id=None, provider='openai'):
+    """Return the shared LLM client for a group (reads the DB on a cache miss)"""
+    return llm_clients.get(group_id, provider)
@@ -0,0 +1,73 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from authentication.models import User
+
+ENDPOINTS = {
+    'sync': '/api/chat/message/',
+    'async': '/api/chat/async/message/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the sync and async chat message endpoints of a running server. '
+        'Start it with e.g. LLM_CLIENT=order.llm.FakeLLMClient FAKE_LLM_LATENCY=0.5 '
+        'uvicorn omnifin.asgi:application --workers 1'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--email', required=True, help='User to send chat messages as')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=['sync', 'async'])
+        parser.add_argument('--timeout', type=float, default=120.0)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['email']}")
+        token, _ = Token.objects.get_or_create(user=user)
+
+        self.stdout.write(f"{'endpoint':<8}{'conc':>6}{'ok':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for name in options['endpoints']:
+            for concurrency in options['concurrency']:
+                ok, elapsed, latencies = asyncio.run(self._run(
+                    options['url'] + ENDPOINTS[name], token.key,
+                    options['requests'], concurrency, options['timeout']
+                ))
+                latencies.sort()
+                p50 = statistics.median(latencies) if latencies else 0.0
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+                self.stdout.write(
+                    f"{name:<8}{concurrency:>6}{ok:>6}{ok / elapsed:>10.1f}{p50:>10.1f}{p99:>10.1f}"
+                )
+
+    async def _run(self, url, token, total, concurrency, timeout):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        headers = {'Authorization': f'Token {token}'}
+
+        async with httpx.AsyncClient(headers=headers, limits=limits, timeout=timeout) as client:
+            async def one(i):
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(url, json={'message': f'loan interest rate question {i}'})
+                    except httpx.HTTPError:
+                        return
+                    if response.status_code in (200, 202):
+                        latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(total)))
+            elapsed = time.perf_counter() - started
+        return len(latencies), elapsed, latencies
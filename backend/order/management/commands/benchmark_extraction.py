@@ -0,0 +1,99 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.extraction import BASE_INTENTS, IntentExtractor, summarize_entities
+
+OPENERS = ['Hi', 'Hello there', 'Good morning', 'Hey', '', '', '']
+TOPICS = [
+    'I would like to borrow {amount} for {timeframe}',
+    'what is the interest rate on a personal loan of {amount}',
+    'how do I file a claim on my car insurance policy',
+    'does my coverage include water damage',
+    'can you help me understand the credit check',
+    'I need information about repayment over {timeframe}',
+    'please call me on {phone} or email {email}',
+    'my home insurance policy renews in {timeframe}',
+]
+CLOSERS = ['thanks', 'bye', 'see you soon', '', '', '']
+FILLER = ['actually', 'really', 'quickly', 'today', 'this week', 'if possible', 'please']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the compiled intent/entity extractor against the previous per-keyword loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000)
+        parser.add_argument('--extra-intents', type=int, default=50,
+                            help='Synthetic intents (5 keywords each) added to both extractors')
+        parser.add_argument('--custom-share', type=float, default=0.3,
+                            help='Share of messages about one of the synthetic intents')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        intents = dict(BASE_INTENTS)
+        for i in range(options['extra_intents']):
+            intents[f'custom_{i}'] = [f'keyword{i}x{j}' for j in range(5)]
+        custom = [keyword for name, keywords in intents.items() if name not in BASE_INTENTS for keyword in keywords]
+        messages = [
+            self._message(rng, rng.choice(custom) if custom and rng.random() < options['custom_share'] else None)
+            for _ in range(options['messages'])
+        ]
+
+        extractor = IntentExtractor(intents)
+        runs = [
+            ('per-keyword loop', lambda message: _legacy_extract(message, intents)),
+            ('compiled', lambda message: self._compiled(extractor, message)),
+        ]
+        self.stdout.write(f"{len(messages)} messages, {len(intents)} intents")
+        self.stdout.write(f"{'extractor':<20}{'msgs/s':>12}{'us/msg':>10}")
+        results = {}
+        for name, run in runs:
+            started = time.perf_counter()
+            results[name] = [run(message) for message in messages]
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:<20}{len(messages) / elapsed:>12.0f}{elapsed / len(messages) * 1e6:>10.1f}")
+
+        same_intent = sum(a[0] == b[0] for a, b in zip(*results.values()))
+        same_entities = sum(a[1] == b[1] for a, b in zip(*results.values()))
+        self.stdout.write(
+            f"agreement: intent {same_intent / len(messages):.3f}, entities {same_entities / len(messages):.3f}"
+        )
+
+    def _compiled(self, extractor, message):
+        result = extractor.extract(message)
+        return result['intent'], summarize_entities(result['entities'])
+
+    def _message(self, rng, custom_keyword=None):
+        template = f'I have a question about {custom_keyword}' if custom_keyword else rng.choice(TOPICS)
+        topic = template.format(
+            amount=rng.choice(['$5,000', '12000', '$250.00', '40,000']),
+            timeframe=f"{rng.randrange(1, 36)} {rng.choice(['months', 'years', 'weeks'])}",
+            phone=f"555-{rng.randrange(100, 999)}-{rng.randrange(1000, 9999)}",
+            email=f"user{rng.randrange(1000)}@example.com",
+        )
+        parts = [rng.choice(OPENERS), topic] + rng.sample(FILLER, 2) + [rng.choice(CLOSERS)]
+        return ' '.join(part for part in parts if part)
+
+
+def _legacy_extract(message, intents):
+    """The substring loop and per-call regexes the service used before order.extraction"""
+    message_lower = message.lower()
+    detected_intent = 'general_info'
+    for intent, keywords in intents.items():
+        if any(keyword in message_lower for keyword in keywords):
+            detected_intent = intent
+            break
+    amounts = re.findall(r'\$?\d+(?:,\d{3})*(?:\.\d{2})?', message)
+    timeframes = re.findall(r'\b(\d+)\s*(days?|weeks?|months?|years?)\b', message, re.IGNORECASE)
+    return detected_intent, {
+        'amount': amounts[0] if amounts else None,
+        'timeframe': list(timeframes[0]) if timeframes else None,
+        'contact_info': {
+            'emails': re.findall(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', message),
+            'phones': re.findall(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b', message),
+        }
+    }
@@ -0,0 +1,109 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+
+from core.utils import day_start
+from knowledge.models import TrainingData
+from order.batch import BatchProcessor, chunked
+from order.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Re-run intent/entity extraction (and optionally replies) over stored messages, writing NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['messages', 'training'], default='messages',
+                            help='Chat messages, or TrainingData rows of the knowledge database')
+        parser.add_argument('--since', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Day to stop before (YYYY-MM-DD)')
+        parser.add_argument('--group', type=int, help='Only this group')
+        parser.add_argument('--sender-type', default='user', help="Message sender type, or 'all'")
+        parser.add_argument('--generate', action='store_true', help='Also generate an AI reply per message')
+        parser.add_argument('--update', action='store_true',
+                            help='Store the new intent/entities in each message\'s metadata')
+        parser.add_argument('--chunk-size', type=int, help='Messages per processing chunk')
+        parser.add_argument('--concurrency', type=int, help='Concurrent LLM calls with --generate')
+        parser.add_argument('--output', help='NDJSON file to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        if options['update'] and options['source'] != 'messages':
+            raise CommandError('--update only applies to --source messages')
+
+        queryset, group_field = self._queryset(options)
+        groups = list(queryset.order_by().values_list(group_field, flat=True).distinct())
+        output = open(options['output'], 'w') if options['output'] else sys.stdout
+        started = time.perf_counter()
+        processed = 0
+        try:
+            for group_id in groups:
+                processor = BatchProcessor(
+                    group_id=group_id,
+                    generate=options['generate'],
+                    chunk_size=options['chunk_size'],
+                    concurrency=options['concurrency']
+                )
+                rows = queryset.filter(**{group_field: group_id}).order_by('id')
+                items = (
+                    {'id': row_id, 'message': text, 'extra': extra}
+                    for row_id, text, extra in rows.values_list('id', *self._fields(options)).iterator()
+                )
+                for chunk in chunked(items, processor.chunk_size):
+                    results = processor.process_chunk(chunk)
+                    for item, result in zip(chunk, results):
+                        if options['source'] == 'training':
+                            result['expected_intent'] = item['extra']
+                        else:
+                            result['conversation_id'] = item['extra']
+                        output.write(json.dumps(result, cls=DjangoJSONEncoder) + '\n')
+                    if options['update']:
+                        self._update(results)
+                    processed += len(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write(self.style.SUCCESS(
+            f"Processed {processed} messages in {elapsed:.1f}s "
+            f"({processed / elapsed if elapsed else 0:.0f} msgs/s)"
+        ))
+
+    def _queryset(self, options):
+        since = parse_date(options['since']) if options['since'] else None
+        until = parse_date(options['until']) if options['until'] else None
+        if (options['since'] and since is None) or (options['until'] and until is None):
+            raise CommandError('Dates must be YYYY-MM-DD')
+
+        if options['source'] == 'training':
+            queryset, group_field = TrainingData.objects.all(), 'group_id'
+        else:
+            queryset, group_field = Message.objects.exclude(content=''), 'conversation__user__group_id'
+            if options['sender_type'] != 'all':
+                queryset = queryset.filter(sender_type=options['sender_type'])
+        # Day bounds as datetime ranges so the created_at index is usable
+        if since:
+            queryset = queryset.filter(created_at__gte=day_start(since))
+        if until:
+            queryset = queryset.filter(created_at__lt=day_start(until))
+        if options['group']:
+            queryset = queryset.filter(**{group_field: options['group']})
+        return queryset, group_field
+
+    def _fields(self, options):
+        if options['source'] == 'training':
+            return ('input_text', 'intent')
+        return ('content', 'conversation_id')
+
+    def _update(self, results):
+        messages = Message.objects.in_bulk([result['id'] for result in results])
+        for result in results:
+            message = messages.get(result['id'])
+            if message is None:
+                continue
+            message.metadata = dict(message.metadata or {}, intent=result['intent'], entities=result['entities'])
+        Message.objects.bulk_update(messages.values(), ['metadata'])
+
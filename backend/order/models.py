@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 
@@ -134,10 +134,19 @@ class Message(models.Model):
         verbose_name = _('Message')
         verbose_name_plural = _('Messages')
         ordering = ['created_at']
+        indexes = [
+            # Keyset pagination of a conversation's messages (core.pagination)
+            models.Index(fields=['conversation', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.sender_type.title()} - {self.conversation.id} - {self.created_at}"
     
+    def save(self, *args, **kwargs):
+        # The insert and the conversation counters updated on post_save (analytics.signals) commit together
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+    
     @property
     def is_from_user(self):
         return self.sender_type == 'user'
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 from .models import (
     Order, Conversation, Message, VoiceRecording, 
     OrderDocument, OrderStatusHistory
@@ -27,17 +29,26 @@ class ConversationSerializer(serializers.ModelSerializer):
     """
     user_email = serializers.ReadOnlyField(source='user.email')
     message_count = serializers.SerializerMethodField()
+    last_message_at = serializers.ReadOnlyField(source='analytics.last_message_at')
+    last_message_id = serializers.ReadOnlyField(source='analytics.last_message_id')
     
     class Meta:
         model = Conversation
         fields = [
             'id', 'user', 'user_email', 'conversation_type', 'status',
-            'started_at', 'ended_at', 'duration', 'metadata', 'message_count'
+            'started_at', 'ended_at', 'duration', 'metadata', 'message_count',
+            'last_message_at', 'last_message_id'
         ]
         read_only_fields = ['id', 'started_at', 'ended_at', 'duration']
+        # Denormalized counters (analytics.counters), joined by core.query_shaping
+        related_fields = ['analytics']
     
     def get_message_count(self, obj):
-        return obj.messages.count()
+        try:
+            return obj.analytics.message_count
+        except ObjectDoesNotExist:
+            # Not backfilled yet (conversation_counters backfill)
+            return obj.messages.count()
 
 class MessageSerializer(serializers.ModelSerializer):
     """
@@ -141,6 +152,38 @@ class WorkflowChatMessageSerializer(serializers.Serializer):
     def validate_message(self, value):
         return value.strip()
 
+class BatchMessageField(serializers.Field):
+    """
+    A message string or an {"id", "message"} object, as {'id', 'message'}
+    """
+    
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = {'id': None, 'message': data}
+        if not isinstance(data, dict) or not isinstance(data.get('message'), str):
+            raise serializers.ValidationError('Expected a string or an object with a "message" string.')
+        if not data['message'].strip():
+            raise serializers.ValidationError("Message cannot be empty")
+        return {'id': data.get('id'), 'message': data['message'].strip()}
+
+class BatchProcessMessagesSerializer(serializers.Serializer):
+    """
+    Batch AI processing request
+    """
+    messages = serializers.ListField(child=BatchMessageField(), required=False, default=list)
+    message_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    generate = serializers.BooleanField(required=False, default=False)
+    order_type = serializers.CharField(required=False, default='general')
+    
+    def validate(self, attrs):
+        total = len(attrs['messages']) + len(attrs['message_ids'])
+        if not total:
+            raise serializers.ValidationError("Provide messages or message_ids")
+        limit = settings.BATCH_PROCESS_MAX_MESSAGES
+        if total > limit:
+            raise serializers.ValidationError(f"At most {limit} messages per request")
+        return attrs
+
 class VoiceMessageSerializer(serializers.Serializer):
     """
     Voice message serializer
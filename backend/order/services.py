@@ -1,9 +1,16 @@
 import logging
-import openai
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.db import models, OperationalError, ProgrammingError
-from knowledge.models import Prompt, KnowledgeEntry
+from django.utils import timezone
+from django.db import OperationalError, ProgrammingError, transaction
+from knowledge.prompts import prompt_registry
+from knowledge.retrieval import retrieve_knowledge
 from .models import Message, Conversation
+from .llm import get_llm_client, chunk_text, CircuitOpenError
+from .cache import response_cache
+from .context import ContextBuilder, roll_summary
+from .extraction import get_extractor, summarize_entities
+from .batch import BatchProcessor
 
 logger = logging.getLogger(__name__)
 
@@ -12,19 +19,12 @@ class AIProcessingService:
     Service for processing messages with AI and generating responses
     """
     
-    def __init__(self):
-        openai.api_key = settings.OPENAI_API_KEY
-    
-    def get_welcome_message(self, order_type='general'):
-        """Get welcome message based on order type"""
+    def get_welcome_message(self, order_type='general', group_id=None):
+        """Get welcome message based on order type (group prompt first, then global)"""
         try:
-            prompt = Prompt.objects.get(
-                name='welcome_message',
-                category=order_type,
-                is_active=True
-            )
-            return prompt.render(order_type=order_type)
-        except Prompt.DoesNotExist:
+            prompt = prompt_registry.get('welcome_message', category=order_type, group_id=group_id)
+            if prompt is not None:
+                return prompt.render(order_type=order_type)
             return f"Welcome to Omnifin! I'm here to help you with {order_type}. How can I assist you today?"
         except (OperationalError, ProgrammingError) as db_error:
             logger.warning(
@@ -42,11 +42,17 @@ class AIProcessingService:
             # Get relevant knowledge
             knowledge = self._get_relevant_knowledge(message, user.group)
             
+            # Fit prompt, knowledge and history into the token budget
+            llm_messages = self._prepare_llm_messages(conversation, message, context, knowledge)
+            
             # Generate AI response
-            response = self._generate_ai_response(message, context, knowledge)
+            response = self._generate_ai_response(
+                message, llm_messages, knowledge, user.group_id,
+                conversation.metadata.get('order_type', 'general')
+            )
             
             # Extract intent and entities
-            intent, entities = self._extract_intent_and_entities(message)
+            intent, entities = self._extract_intent_and_entities(message, user.group_id)
             
             return {
                 'response': response,
@@ -67,138 +73,282 @@ class AIProcessingService:
                 'metadata': {'error': str(e)}
             }
     
-    def _get_conversation_context(self, conversation, limit=5):
-        """Get recent conversation context"""
-        recent_messages = conversation.messages.filter(
-            sender_type__in=['user', 'ai']
-        ).order_by('-created_at')[:limit]
-        
+    async def aprocess_chat_message(self, conversation, message, user):
+        """Async variant of process_chat_message that awaits the LLM call"""
+        try:
+            context = await self._aget_conversation_context(conversation)
+            
+            # The group lookup and lazy index builds hit the ORM, so run them off the event loop
+            knowledge = await sync_to_async(lambda: self._get_relevant_knowledge(message, user.group))()
+            
+            summary = conversation.metadata.get('summary') or {}
+            llm_messages, dropped = self._build_llm_messages(message, context, knowledge, summary.get('text', ''))
+            await sync_to_async(self._roll_summary)(conversation, context, dropped)
+            
+            client = await sync_to_async(get_llm_client)(user.group_id)
+            response = await self._agenerate_ai_response(
+                client, message, llm_messages, knowledge, user.group_id,
+                conversation.metadata.get('order_type', 'general')
+            )
+            intent, entities = await sync_to_async(self._extract_intent_and_entities)(message, user.group_id)
+            
+            return {
+                'response': response,
+                'intent': intent,
+                'entities': entities,
+                'metadata': {
+                    'knowledge_used': knowledge,
+                    'confidence': 0.8
+                }
+            }
+        except Exception as e:
+            logger.error(f"Error processing chat message: {str(e)}")
+            return {
+                'response': "I apologize, but I'm having trouble processing your request. Please try again.",
+                'intent': 'error',
+                'entities': {},
+                'metadata': {'error': str(e)}
+            }
+    
+    def process_message(self, message, context=None, user=None):
+        """Run extraction, knowledge retrieval and a reply for a single message"""
+        context = context or {}
+        processor = BatchProcessor(
+            group_id=getattr(user, 'group_id', None),
+            generate=True,
+            order_type=context.get('order_type', 'general')
+        )
+        return processor.process_chunk([{'id': context.get('id'), 'message': message}])[0]
+    
+    def process_messages(self, items, user=None, generate=False, order_type='general'):
+        """Yield process_message-style results for many {'id', 'message'} items, in order"""
+        processor = BatchProcessor(
+            group_id=getattr(user, 'group_id', None),
+            generate=generate,
+            order_type=order_type
+        )
+        return processor.process(items)
+    
+    def aprocess_messages(self, items, user=None, generate=False, order_type='general'):
+        """Async iterator over the process_messages results, for streaming under ASGI"""
+        processor = BatchProcessor(
+            group_id=getattr(user, 'group_id', None),
+            generate=generate,
+            order_type=order_type
+        )
+        return processor.aprocess(items)
+    
+    def generate_response(self, prompt, model=None, group_id=None):
+        """Complete a bare prompt with the group's LLM client (its configured model is used)"""
+        client = get_llm_client(group_id)
+        if not client.available:
+            return self._fallback_ai_response(prompt, [])
+        try:
+            return client.complete([{"role": "user", "content": prompt}], max_tokens=500, temperature=0.7)
+        except Exception as e:
+            logger.error(f"Error generating AI response: {str(e)}")
+            return self._fallback_ai_response(prompt, [])
+    
+    def create_pending_response(self, conversation):
+        """Create a placeholder AI message to be completed by a background task"""
+        return Message.objects.create(
+            conversation=conversation,
+            sender_type='ai',
+            content='',
+            metadata={'status': 'pending'}
+        )
+    
+    def complete_pending_response(self, ai_message, message_text, user):
+        """Generate the AI reply for a pending message and store it"""
+        ai_response = self.process_chat_message(
+            conversation=ai_message.conversation,
+            message=message_text,
+            user=user
+        )
+        ai_message.content = ai_response['response']
+        ai_message.metadata = {
+            **ai_response.get('metadata', {}),
+            'status': 'failed' if ai_response.get('intent') == 'error' else 'completed',
+            'intent': ai_response.get('intent'),
+            'entities': ai_response.get('entities'),
+        }
+        ai_message.processed_at = timezone.now()
+        ai_message.save(update_fields=['content', 'metadata', 'processed_at'])
+        return ai_response
+    
+    def _get_conversation_context(self, conversation, limit=None):
+        """Get recent conversation turns not yet folded into the summary"""
+        return self._format_context(self._recent_messages(conversation, limit))
+    
+    async def _aget_conversation_context(self, conversation, limit=None):
+        """Get recent conversation turns using the async ORM"""
+        recent_messages = [msg async for msg in self._recent_messages(conversation, limit)]
+        return self._format_context(recent_messages)
+    
+    def _unsummarized_messages(self, conversation):
+        summary = conversation.metadata.get('summary') or {}
+        return conversation.messages.filter(
+            sender_type__in=['user', 'ai'],
+            id__gt=summary.get('through_id', 0)
+        ).exclude(content='').only('id', 'sender_type', 'content')
+    
+    def _recent_messages(self, conversation, limit):
+        limit = limit or getattr(settings, 'CHAT_CONTEXT_MAX_MESSAGES', 20)
+        return self._unsummarized_messages(conversation).order_by('-created_at', '-id')[:limit]
+    
+    def _format_context(self, recent_messages):
         context = []
-        for msg in reversed(recent_messages):
+        for msg in reversed(list(recent_messages)):
             context.append({
+                'id': msg.id,
                 'role': 'user' if msg.sender_type == 'user' else 'assistant',
                 'content': msg.content
             })
         
         return context
     
-    def _get_relevant_knowledge(self, message, group):
-        """Get relevant knowledge entries for the message"""
-        # Simple keyword matching for now
-        keywords = message.lower().split()
-        
+    def _get_relevant_knowledge(self, message, group, limit=3):
+        """Get the best-ranked knowledge entries for the message"""
+        group_id = group.id if group else None
         try:
-            knowledge_entries = KnowledgeEntry.objects.filter(
-                is_active=True
-            ).filter(
-                models.Q(group=group) | models.Q(group__isnull=True)
-            )
+            return retrieve_knowledge(message, group_id, limit=limit)
         except (OperationalError, ProgrammingError) as db_error:
             logger.warning(
                 "Knowledge tables unavailable while fetching relevant knowledge: %s",
                 db_error
             )
             return []
+    
+    def _build_llm_messages(self, message, context, knowledge, summary=''):
+        """Assemble the system prompt, knowledge and history within the token budget"""
+        system_prompt = """You are an AI assistant for Omnifin, a financial services platform. 
+            You help users with loans and insurance inquiries. Be helpful, professional, and accurate."""
         
-        relevant_knowledge = []
-        for entry in knowledge_entries:
-            entry_text = (entry.title + ' ' + entry.content).lower()
-            if any(keyword in entry_text for keyword in keywords):
-                relevant_knowledge.append({
-                    'title': entry.title,
-                    'content': entry.content,
-                    'category': entry.category
-                })
+        # The message being answered is usually already saved as the latest turn
+        if context and context[-1]['role'] == 'user' and context[-1]['content'] == message:
+            context = context[:-1]
         
-        return relevant_knowledge[:3]  # Limit to top 3 relevant entries
+        return ContextBuilder().build(system_prompt, message, knowledge, context, summary)
     
-    def _generate_ai_response(self, message, context, knowledge):
-        """Generate AI response using OpenAI API or fallback"""
-        if not settings.OPENAI_API_KEY:
+    def _prepare_llm_messages(self, conversation, message, context, knowledge):
+        """Budgeted LLM messages; turns that no longer fit roll into the summary"""
+        summary = conversation.metadata.get('summary') or {}
+        messages, dropped = self._build_llm_messages(message, context, knowledge, summary.get('text', ''))
+        self._roll_summary(conversation, context, dropped)
+        return messages
+    
+    def _roll_summary(self, conversation, context, dropped):
+        """Fold dropped turns, and any older than the loaded window, into Conversation.metadata['summary']"""
+        if context and len(context) >= getattr(settings, 'CHAT_CONTEXT_MAX_MESSAGES', 20):
+            # Turns older than a full window were never sent to the LLM; summarize them too
+            older = self._unsummarized_messages(conversation).filter(id__lt=context[0]['id']).order_by('id')
+            dropped = self._format_context(reversed(list(older))) + list(dropped)
+        if not dropped:
+            return
+        with transaction.atomic():
+            # Re-read under a row lock: the Celery reply task may have written metadata meanwhile
+            locked = Conversation.objects.select_for_update().only('metadata').get(pk=conversation.pk)
+            updated = roll_summary(locked.metadata.get('summary') or {}, dropped)
+            if updated is not None:
+                locked.metadata['summary'] = updated
+                locked.save(update_fields=['metadata'])
+        conversation.metadata = locked.metadata
+    
+    def _generate_ai_response(self, message, llm_messages, knowledge, group_id=None, order_type='general'):
+        """Generate AI response using the response cache, the group's LLM client or fallback"""
+        cache_key, cached = response_cache.lookup(group_id, order_type, knowledge, message, llm_messages)
+        if cached is not None:
+            return cached
+        
+        client = get_llm_client(group_id)
+        if not client.available:
             return self._fallback_ai_response(message, knowledge)
         
         try:
-            # Prepare system prompt
-            system_prompt = """You are an AI assistant for Omnifin, a financial services platform. 
-            You help users with loans and insurance inquiries. Be helpful, professional, and accurate."""
-            
-            # Add knowledge context
-            if knowledge:
-                knowledge_text = "\n".join([k['content'] for k in knowledge])
-                system_prompt += f"\n\nRelevant information:\n{knowledge_text}"
-            
-            # Prepare messages
-            messages = [{"role": "system", "content": system_prompt}]
-            messages.extend(context)
-            messages.append({"role": "user", "content": message})
-            
-            # Generate response
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
+            response = client.complete(llm_messages, max_tokens=500, temperature=0.7)
+            response_cache.store(cache_key, response, group_id, order_type, knowledge, message, llm_messages)
+            return response
+        except CircuitOpenError:
+            return self._fallback_ai_response(message, knowledge)
         except Exception as e:
             logger.error(f"Error generating AI response: {str(e)}")
             return self._fallback_ai_response(message, knowledge)
     
-    def _extract_intent_and_entities(self, message):
-        """Extract intent and entities from message"""
-        # Simple intent classification
-        message_lower = message.lower()
-        
-        intents = {
-            'loan_inquiry': ['loan', 'borrow', 'lend', 'credit'],
-            'insurance_inquiry': ['insurance', 'policy', 'coverage', 'claim'],
-            'general_info': ['information', 'help', 'what', 'how'],
-            'greeting': ['hello', 'hi', 'hey', 'good morning', 'good afternoon'],
-            'goodbye': ['bye', 'goodbye', 'see you', 'thanks']
-        }
-        
-        detected_intent = 'general_info'
-        for intent, keywords in intents.items():
-            if any(keyword in message_lower for keyword in keywords):
-                detected_intent = intent
-                break
+    async def _agenerate_ai_response(self, client, message, llm_messages, knowledge, group_id=None, order_type='general'):
+        """Generate AI response with the response cache, the client's async API or fallback"""
+        cache_key, cached = await sync_to_async(response_cache.lookup)(
+            group_id, order_type, knowledge, message, llm_messages
+        )
+        if cached is not None:
+            return cached
         
-        # Simple entity extraction
-        entities = {
-            'amount': self._extract_amount(message),
-            'timeframe': self._extract_timeframe(message),
-            'contact_info': self._extract_contact_info(message)
-        }
+        if not client.available:
+            return self._fallback_ai_response(message, knowledge)
         
-        return detected_intent, entities
-    
-    def _extract_amount(self, message):
-        """Extract monetary amounts from message"""
-        import re
-        amounts = re.findall(r'\$?\d+(?:,\d{3})*(?:\.\d{2})?', message)
-        return amounts[0] if amounts else None
+        try:
+            response = await client.acomplete(llm_messages, max_tokens=500, temperature=0.7)
+            await sync_to_async(response_cache.store)(
+                cache_key, response, group_id, order_type, knowledge, message, llm_messages
+            )
+            return response
+        except CircuitOpenError:
+            return self._fallback_ai_response(message, knowledge)
+        except Exception as e:
+            logger.error(f"Error generating AI response: {str(e)}")
+            return self._fallback_ai_response(message, knowledge)
     
-    def _extract_timeframe(self, message):
-        """Extract timeframes from message"""
-        import re
-        time_patterns = r'\b(\d+)\s*(days?|weeks?|months?|years?)\b'
-        matches = re.findall(time_patterns, message, re.IGNORECASE)
-        return matches[0] if matches else None
+    def prepare_stream(self, conversation, message, user):
+        """Gather context and knowledge for a streamed reply (sync, touches the DB)"""
+        context = self._get_conversation_context(conversation)
+        knowledge = self._get_relevant_knowledge(message, user.group)
+        order_type = conversation.metadata.get('order_type', 'general')
+        llm_messages = self._prepare_llm_messages(conversation, message, context, knowledge)
+        cache_key, cached = response_cache.lookup(user.group_id, order_type, knowledge, message, llm_messages)
+        return {
+            'message': message,
+            'knowledge': knowledge,
+            'group_id': user.group_id,
+            'order_type': order_type,
+            'cache_key': cache_key,
+            'cached': cached,
+            'llm_messages': llm_messages,
+            'client': get_llm_client(user.group_id)
+        }
     
-    def _extract_contact_info(self, message):
-        """Extract contact information from message"""
-        import re
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        phone_pattern = r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
+    async def astream_ai_response(self, prepared):
+        """Yield reply chunks from the LLM, or the chunked fallback reply"""
+        if prepared['cached'] is not None:
+            for chunk in chunk_text(prepared['cached']):
+                yield chunk
+            return
         
-        emails = re.findall(email_pattern, message)
-        phones = re.findall(phone_pattern, message)
+        client = prepared['client']
+        emitted = []
+        if client.available:
+            try:
+                async for chunk in client.astream(prepared['llm_messages'], max_tokens=500, temperature=0.7):
+                    emitted.append(chunk)
+                    yield chunk
+                await sync_to_async(response_cache.store)(
+                    prepared['cache_key'], ''.join(emitted), prepared['group_id'],
+                    prepared['order_type'], prepared['knowledge'], prepared['message'],
+                    prepared['llm_messages']
+                )
+                return
+            except CircuitOpenError:
+                pass
+            except Exception as e:
+                logger.error(f"Error streaming AI response: {str(e)}")
+                if emitted:
+                    return
         
-        return {
-            'emails': emails,
-            'phones': phones
-        }
+        for chunk in chunk_text(self._fallback_ai_response(prepared['message'], prepared['knowledge'])):
+            yield chunk
+    
+    def _extract_intent_and_entities(self, message, group_id=None):
+        """Extract intent and entities from message"""
+        result = get_extractor(group_id).extract(message)
+        return result['intent'], summarize_entities(result['entities'])
 
     def _fallback_ai_response(self, message, knowledge):
         """Generate a simple deterministic response when LLM is unavailable"""
@@ -0,0 +1,77 @@
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import APIConfiguration
+from knowledge.models import KnowledgeEntry, Prompt, TrainingData
+from . import live, updates
+from .cache import response_cache
+from .extraction import extractors
+from .llm import llm_clients
+from .models import Message
+from .serializers import MessageSerializer
+
+
+@receiver(post_save, sender=APIConfiguration)
+@receiver(post_delete, sender=APIConfiguration)
+def reset_llm_clients(sender, instance, **kwargs):
+    """Rebuild LLM clients in this worker after an API configuration change"""
+    if instance.api_type == 'llm_text':
+        llm_clients.clear()
+
+
+@receiver(setting_changed)
+def reset_llm_clients_on_setting_change(sender, setting, **kwargs):
+    """Pick up overridden LLM_* settings (e.g. override_settings in tests)"""
+    if setting.startswith('LLM_') or setting in ('OPENAI_API_KEY', 'FAKE_LLM_LATENCY'):
+        llm_clients.clear()
+    if setting == 'CHAT_CHANNEL_LAYER':
+        live.reset_channel_layer()
+
+
+@receiver(post_save, sender=KnowledgeEntry)
+@receiver(post_delete, sender=KnowledgeEntry)
+@receiver(post_save, sender=Prompt)
+@receiver(post_delete, sender=Prompt)
+def invalidate_response_cache(sender, instance, **kwargs):
+    """Expire cached chat replies that may depend on the changed row"""
+    response_cache.invalidate(instance.group_id)
+
+
+@receiver(post_save, sender=TrainingData)
+@receiver(post_delete, sender=TrainingData)
+def reset_intent_extractors(sender, instance, **kwargs):
+    """Recompile intent keywords after intent training data changes"""
+    if instance.data_type == 'intent':
+        extractors.clear()
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def bump_conversation_version(sender, instance, **kwargs):
+    """Wake chat pollers of the message's conversation once the change is committed"""
+    conversation_id = instance.conversation_id
+    transaction.on_commit(lambda: updates.bump(conversation_id))
+
+
+@receiver(post_save, sender=Message)
+def publish_saved_message(sender, instance, created, **kwargs):
+    """Push a saved message to the conversation's WebSocket subscribers after commit"""
+    def publish():
+        live.publish(instance.conversation_id, {
+            'type': 'message',
+            'conversation_id': instance.conversation_id,
+            'created': created,
+            'message': MessageSerializer(instance).data,
+        })
+    transaction.on_commit(publish)
+
+
+@receiver(post_delete, sender=Message)
+def publish_deleted_message(sender, instance, **kwargs):
+    conversation_id, message_id = instance.conversation_id, instance.id
+    transaction.on_commit(lambda: live.publish(conversation_id, {
+        'type': 'message_deleted',
+        'conversation_id': conversation_id,
+        'message_id': message_id,
+    }))
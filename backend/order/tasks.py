@@ -0,0 +1,36 @@
+import logging
+from celery import shared_task
+from django.utils import timezone
+from .models import Message
+from .services import AIProcessingService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_ai_response(ai_message_id, user_message_id):
+    """Fill in a pending AI message with the reply to a user message"""
+    try:
+        ai_message = Message.objects.select_related('conversation').get(id=ai_message_id)
+        user_message = Message.objects.select_related('sender').get(id=user_message_id)
+    except Message.DoesNotExist:
+        logger.warning(
+            "Skipping AI generation for missing message(s) %s/%s",
+            ai_message_id, user_message_id
+        )
+        return None
+
+    if ai_message.metadata.get('status') != 'pending':
+        return ai_message.metadata.get('status')
+
+    try:
+        AIProcessingService().complete_pending_response(
+            ai_message, user_message.content, user_message.sender
+        )
+    except Exception as e:
+        logger.error(f"Error generating AI response for message {ai_message_id}: {str(e)}")
+        ai_message.content = "I apologize, but I'm having trouble processing your request. Please try again."
+        ai_message.metadata = {'status': 'failed', 'error': str(e)}
+        ai_message.processed_at = timezone.now()
+        ai_message.save(update_fields=['content', 'metadata', 'processed_at'])
+    return ai_message.metadata.get('status')
@@ -0,0 +1,167 @@
+"""
+Conversation change notifications for incremental chat polling.
+
+Every conversation has a version counter in ``CACHES['default']`` that the
+signal handlers in ``order.signals`` bump (after commit) whenever one of
+its messages is saved or deleted, publishing the new version on a Redis
+pub/sub channel. Counters start at the current time in milliseconds, so a
+counter evicted and re-created never repeats a version a client has seen.
+
+The updates endpoints turn (user, conversation, version, after id) into
+an ETag: a client repeating a request with ``If-None-Match`` gets a 304
+from the counter alone, and the async endpoint can instead long-poll with
+``wait_for_change`` until the version moves. When the cache is not Redis
+there is no pub/sub and waiting falls back to re-reading the counter every
+``CHAT_UPDATES_POLL_INTERVAL`` seconds.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'chat_updates'
+# Idle counters expire; a re-created one starts past any version it could have reached
+VERSION_TTL = 7 * 24 * 3600
+
+
+def version_key(conversation_id):
+    return f"{KEY_PREFIX}:version:{conversation_id}"
+
+
+def channel_name(conversation_id):
+    return f"{KEY_PREFIX}:channel:{conversation_id}"
+
+
+def _uses_redis():
+    return settings.CACHES['default']['BACKEND'] == 'django_redis.cache.RedisCache'
+
+
+def _seed():
+    return int(time.time() * 1000)
+
+
+def get_version(conversation_id):
+    """Current version of a conversation (created if needed), or None when the cache is unavailable"""
+    key = version_key(conversation_id)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, _seed(), timeout=VERSION_TTL)
+            version = cache.get(key)
+    except Exception as e:
+        logger.error(f"Could not read chat version of conversation {conversation_id}: {str(e)}")
+        return None
+    return version
+
+
+async def aget_version(conversation_id):
+    key = version_key(conversation_id)
+    try:
+        version = await cache.aget(key)
+        if version is None:
+            await cache.aadd(key, _seed(), timeout=VERSION_TTL)
+            version = await cache.aget(key)
+    except Exception as e:
+        logger.error(f"Could not read chat version of conversation {conversation_id}: {str(e)}")
+        return None
+    return version
+
+
+def bump(conversation_id):
+    """Advance a conversation's version and notify waiting pollers"""
+    key = version_key(conversation_id)
+    try:
+        cache.add(key, _seed(), timeout=VERSION_TTL)
+        version = cache.incr(key)
+    except Exception as e:
+        logger.error(f"Could not bump chat version of conversation {conversation_id}: {str(e)}")
+        return None
+    if _uses_redis():
+        try:
+            from django_redis import get_redis_connection
+
+            get_redis_connection('default').publish(channel_name(conversation_id), version)
+        except Exception as e:
+            logger.error(f"Could not publish chat update of conversation {conversation_id}: {str(e)}")
+    return version
+
+
+def etag(user_id, conversation_id, version, after):
+    """
+    Strong ETag of an updates response.
+
+    Signed with the user, so a matching If-None-Match also proves the
+    ownership check passed when it was issued.
+    """
+    digest = salted_hmac(KEY_PREFIX, f"{user_id}:{conversation_id}:{version}:{after}").hexdigest()[:20]
+    return f'"{version}-{digest}"'
+
+
+def if_none_match(header):
+    """ETags listed in an If-None-Match header"""
+    return {tag.strip() for tag in (header or '').split(',') if tag.strip()}
+
+
+async def _poll(conversation_id, version, deadline):
+    interval = getattr(settings, 'CHAT_UPDATES_POLL_INTERVAL', 1.0)
+    current = await aget_version(conversation_id)
+    while current == version and time.monotonic() < deadline:
+        await asyncio.sleep(min(interval, max(0, deadline - time.monotonic())))
+        current = await aget_version(conversation_id)
+    return current
+
+
+async def wait_for_change(conversation_id, version, timeout):
+    """Wait up to ``timeout`` seconds for the version to move past ``version``; returns the current one"""
+    deadline = time.monotonic() + timeout
+    if not _uses_redis():
+        return await _poll(conversation_id, version, deadline)
+
+    import redis.asyncio as aioredis
+
+    client = aioredis.Redis.from_url(settings.CACHES['default']['LOCATION'])
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(channel_name(conversation_id))
+        # Re-read after subscribing, so a bump in between is not missed
+        current = await aget_version(conversation_id)
+        while current == version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None:
+                current = await aget_version(conversation_id)
+        return current
+    except Exception as e:
+        logger.error(f"Chat update subscription failed for conversation {conversation_id}: {str(e)}")
+    finally:
+        try:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception:
+            pass
+    return await _poll(conversation_id, version, deadline)
+
+
+def parse_params(params):
+    """(conversation_id, after, limit, wait) of an updates request; raises ValueError"""
+    try:
+        conversation_id = int(params.get('conversation_id') or '')
+    except ValueError:
+        raise ValueError('conversation_id is required')
+    try:
+        after = int(params.get('after') or 0)
+        limit = int(params.get('limit') or settings.REST_FRAMEWORK.get('PAGE_SIZE', 20))
+        wait = float(params.get('wait') or 0)
+    except ValueError:
+        raise ValueError('after, limit and wait must be numbers')
+    limit = max(1, min(limit, 100))
+    wait = max(0.0, min(wait, getattr(settings, 'CHAT_UPDATES_MAX_WAIT', 25)))
+    return conversation_id, after, limit, wait
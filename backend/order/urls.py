@@ -15,7 +15,7 @@ from .views import (
     # Voice chat specific
     VoiceChatStartView, VoiceMessageView,
     # AI processing
-    ProcessMessageView, GenerateAIResponseView,
+    ProcessMessageView, BatchProcessMessagesView, GenerateAIResponseView,
 )
 
 app_name = 'order'
@@ -55,5 +55,6 @@ urlpatterns = [
     
     # AI processing endpoints
     path('ai/process-message/', ProcessMessageView.as_view(), name='process-message'),
+    path('ai/process-messages/', BatchProcessMessagesView.as_view(), name='process-messages'),
     path('ai/generate-response/', GenerateAIResponseView.as_view(), name='generate-response'),
 ]
\ No newline at end of file
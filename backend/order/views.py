@@ -3,8 +3,12 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
+from django.conf import settings
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from .models import (
     Order, Conversation, Message, VoiceRecording, 
     OrderDocument, OrderStatusHistory
@@ -14,17 +18,86 @@ from .serializers import (
     VoiceRecordingSerializer, OrderDocumentSerializer,
     ChatMessageSerializer, VoiceMessageSerializer,
     VoiceRecordingUploadSerializer, WorkflowChatMessageSerializer,
-    WorkflowVoiceMessageSerializer
+    WorkflowVoiceMessageSerializer, BatchProcessMessagesSerializer
 )
 from .permissions import IsOrderOwner, IsConversationParticipant
+from authentication.permissions import IsAdminOrSuperAdmin
 from .services import AIProcessingService, VoiceProcessingService
-from analytics.models import UserActivity
+from .tasks import generate_ai_response
+from . import updates
+from analytics.middleware import track_activity, annotate_activity
+from core.pagination import MessageKeysetPagination
+from core.query_shaping import QueryShapingMixin, shape_queryset
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _dispatch_ai_generation(ai_message_id, user_message_id):
+    """Queue AI generation, running it inline if the broker is unreachable"""
+    try:
+        generate_ai_response.delay(ai_message_id, user_message_id)
+    except Exception as e:
+        logger.error(f"Could not queue AI generation, running inline: {str(e)}")
+        generate_ai_response(ai_message_id, user_message_id)
+
+def _reply_to_message(ai_service, conversation, user_message, user):
+    """
+    Produce the AI reply to a saved user message.
+    
+    With CHAT_ASYNC_PROCESSING the reply is a pending message that a Celery
+    task completes; clients poll ChatStatusWorkflowView with its id.
+    Returns (ai_message, payload) where payload carries status/intent/entities.
+    """
+    if settings.CHAT_ASYNC_PROCESSING:
+        ai_message = ai_service.create_pending_response(conversation)
+        transaction.on_commit(
+            lambda: _dispatch_ai_generation(ai_message.id, user_message.id)
+        )
+        ai_message.refresh_from_db()
+        return ai_message, {
+            'status': ai_message.metadata.get('status'),
+            'intent': ai_message.metadata.get('intent'),
+            'entities': ai_message.metadata.get('entities')
+        }
+    
+    ai_response = ai_service.process_chat_message(
+        conversation=conversation,
+        message=user_message.content,
+        user=user
+    )
+    ai_message = Message.objects.create(
+        conversation=conversation,
+        sender_type='ai',
+        content=ai_response['response'],
+        metadata=ai_response.get('metadata', {})
+    )
+    return ai_message, {
+        'status': 'completed',
+        'intent': ai_response.get('intent'),
+        'entities': ai_response.get('entities')
+    }
+
+def _updates_response_data(conversation_id, version, messages, limit):
+    """Body of a chat updates response from up to limit + 1 messages after the cursor"""
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return {
+        'conversation_id': conversation_id,
+        'version': version,
+        'results': MessageSerializer(messages, many=True).data,
+        'last_id': messages[-1].id if messages else None,
+        'has_more': has_more,
+    }
+
+def _not_modified(tag):
+    response = HttpResponseNotModified()
+    response['ETag'] = tag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 # Order Views
-class OrderListView(generics.ListCreateAPIView):
+class OrderListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create orders
     """
@@ -37,17 +110,13 @@ class OrderListView(generics.ListCreateAPIView):
             return Order.objects.all()
         return Order.objects.filter(user=user)
     
+    @track_activity('order_created', resource_type='order')
     def perform_create(self, serializer):
         order = serializer.save(user=self.request.user)
         
-        # Track order creation activity
-        UserActivity.objects.create(
-            user=self.request.user,
-            action='order_created',
-            resource_type='order',
+        annotate_activity(
+            self.request,
             resource_id=order.id,
-            ip_address=self.request.META.get('REMOTE_ADDR'),
-            user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
             metadata={
                 'order_type': order.order_type,
                 'product_type': order.product_type,
@@ -55,7 +124,7 @@ class OrderListView(generics.ListCreateAPIView):
             }
         )
 
-class OrderDetailView(generics.RetrieveUpdateAPIView):
+class OrderDetailView(QueryShapingMixin, generics.RetrieveUpdateAPIView):
     """
     Retrieve and update order details
     """
@@ -74,6 +143,7 @@ class OrderStatusUpdateView(generics.GenericAPIView):
     """
     permission_classes = [permissions.IsAuthenticated, IsOrderOwner]
     
+    @track_activity('order_updated', resource_type='order')
     def post(self, request, pk):
         order = get_object_or_404(Order, pk=pk)
         new_status = request.data.get('status')
@@ -97,14 +167,9 @@ class OrderStatusUpdateView(generics.GenericAPIView):
             notes=notes
         )
         
-        # Track order update activity
-        UserActivity.objects.create(
-            user=request.user,
-            action='order_updated',
-            resource_type='order',
+        annotate_activity(
+            request,
             resource_id=order.id,
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
             metadata={
                 'old_status': old_status,
                 'new_status': new_status,
@@ -115,7 +180,7 @@ class OrderStatusUpdateView(generics.GenericAPIView):
         return Response({'message': 'Status updated successfully'})
 
 # Conversation Views
-class ConversationListView(generics.ListCreateAPIView):
+class ConversationListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and create conversations
     """
@@ -128,21 +193,17 @@ class ConversationListView(generics.ListCreateAPIView):
             return Conversation.objects.all()
         return Conversation.objects.filter(user=user)
     
+    @track_activity('chat_start', resource_type='conversation')
     def perform_create(self, serializer):
         conversation = serializer.save(user=self.request.user)
         
-        # Track conversation start activity
-        UserActivity.objects.create(
-            user=self.request.user,
-            action='chat_start',
-            resource_type='conversation',
+        annotate_activity(
+            self.request,
             resource_id=conversation.id,
-            ip_address=self.request.META.get('REMOTE_ADDR'),
-            user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
-            metadata={'conversation_type': conversation.type}
+            metadata={'conversation_type': conversation.conversation_type}
         )
 
-class ConversationDetailView(generics.RetrieveUpdateAPIView):
+class ConversationDetailView(QueryShapingMixin, generics.RetrieveUpdateAPIView):
     """
     Retrieve and update conversation details
     """
@@ -167,11 +228,12 @@ class ConversationEndView(generics.GenericAPIView):
         return Response({'message': 'Conversation ended successfully'})
 
 # Message Views
-class MessageListView(generics.ListAPIView):
+class MessageListView(QueryShapingMixin, generics.ListAPIView):
     """
     List messages in a conversation
     """
     serializer_class = MessageSerializer
+    pagination_class = MessageKeysetPagination
     permission_classes = [permissions.IsAuthenticated, IsConversationParticipant]
     
     def get_queryset(self):
@@ -185,6 +247,7 @@ class MessageCreateView(generics.CreateAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated, IsConversationParticipant]
     
+    @track_activity('chat_message', resource_type='message')
     def perform_create(self, serializer):
         conversation_id = self.kwargs['conversation_id']
         message = serializer.save(
@@ -193,18 +256,13 @@ class MessageCreateView(generics.CreateAPIView):
             sender_type='user'
         )
         
-        # Track message activity
-        UserActivity.objects.create(
-            user=self.request.user,
-            action='chat_message',
-            resource_type='message',
+        annotate_activity(
+            self.request,
             resource_id=message.id,
-            ip_address=self.request.META.get('REMOTE_ADDR'),
-            user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
             metadata={'conversation_id': conversation_id}
         )
 
-class MessageDetailView(generics.RetrieveAPIView):
+class MessageDetailView(QueryShapingMixin, generics.RetrieveAPIView):
     """
     Retrieve a message
     """
@@ -236,7 +294,7 @@ class VoiceRecordingUploadView(generics.GenericAPIView):
         
         return Response(result)
 
-class VoiceRecordingDetailView(generics.RetrieveAPIView):
+class VoiceRecordingDetailView(QueryShapingMixin, generics.RetrieveAPIView):
     """
     Retrieve voice recording details
     """
@@ -250,7 +308,7 @@ class VoiceRecordingDetailView(generics.RetrieveAPIView):
         return VoiceRecording.objects.filter(message__sender=user)
 
 # Document Views
-class OrderDocumentListView(generics.ListCreateAPIView):
+class OrderDocumentListView(QueryShapingMixin, generics.ListCreateAPIView):
     """
     List and upload documents for an order
     """
@@ -269,7 +327,7 @@ class OrderDocumentListView(generics.ListCreateAPIView):
             uploaded_by=self.request.user
         )
 
-class OrderDocumentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class OrderDocumentDetailView(QueryShapingMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a document
     """
@@ -298,7 +356,7 @@ class ChatStartView(generics.GenericAPIView):
         
         # Create welcome message
         ai_service = AIProcessingService()
-        welcome_message = ai_service.get_welcome_message(order_type)
+        welcome_message = ai_service.get_welcome_message(order_type, request.user.group_id)
         
         Message.objects.create(
             conversation=conversation,
@@ -335,32 +393,21 @@ class ChatMessageView(generics.GenericAPIView):
         
         # Process with AI
         ai_service = AIProcessingService()
-        ai_response = ai_service.process_chat_message(
-            conversation=conversation,
-            message=message_content,
-            user=request.user
-        )
-        
-        # Save AI response
-        ai_message = Message.objects.create(
-            conversation=conversation,
-            sender_type='ai',
-            content=ai_response['response'],
-            metadata=ai_response['metadata']
-        )
+        ai_message, reply = _reply_to_message(ai_service, conversation, user_message, request.user)
         
         return Response({
             'user_message': MessageSerializer(user_message).data,
             'ai_response': MessageSerializer(ai_message).data,
-            'intent': ai_response.get('intent'),
-            'entities': ai_response.get('entities')
-        })
+            'ai_message_id': ai_message.id,
+            **reply
+        }, status=status.HTTP_202_ACCEPTED if reply['status'] == 'pending' else status.HTTP_200_OK)
 
-class ChatHistoryView(generics.ListAPIView):
+class ChatHistoryView(QueryShapingMixin, generics.ListAPIView):
     """
     Get chat history
     """
     serializer_class = MessageSerializer
+    pagination_class = MessageKeysetPagination
     permission_classes = [permissions.IsAuthenticated, IsConversationParticipant]
     
     def get_queryset(self):
@@ -396,7 +443,7 @@ class ChatMessageWorkflowView(generics.GenericAPIView):
                 conversation_type='chat',
                 metadata={'order_type': order_type}
             )
-            welcome_message = ai_service.get_welcome_message(order_type)
+            welcome_message = ai_service.get_welcome_message(order_type, request.user.group_id)
             welcome_obj = Message.objects.create(
                 conversation=conversation,
                 sender_type='ai',
@@ -419,32 +466,109 @@ class ChatMessageWorkflowView(generics.GenericAPIView):
             content=message_text
         )
         
-        ai_response = ai_service.process_chat_message(
-            conversation=conversation,
-            message=message_text,
-            user=request.user
-        )
-        
-        ai_message = Message.objects.create(
-            conversation=conversation,
-            sender_type='ai',
-            content=ai_response['response'],
-            metadata=ai_response.get('metadata', {})
-        )
+        ai_message, reply = _reply_to_message(ai_service, conversation, user_message, request.user)
         
         return Response({
             'conversation_id': conversation.id,
             'user_message': MessageSerializer(user_message).data,
             'ai_response': MessageSerializer(ai_message).data,
-            'intent': ai_response.get('intent'),
-            'entities': ai_response.get('entities')
-        })
+            'ai_message_id': ai_message.id,
+            **reply
+        }, status=status.HTTP_202_ACCEPTED if reply['status'] == 'pending' else status.HTTP_200_OK)
+
+def _sse(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
 
-class ChatHistoryWorkflowView(generics.ListAPIView):
+class ChatStreamWorkflowView(generics.GenericAPIView):
+    """
+    Workflow endpoint: POST /api/chat/stream
+    
+    Streams the AI reply as server-sent events: ``start`` with the saved user
+    message, one ``token`` event per chunk, then ``done`` with the persisted
+    AI message. Tokens are produced by an async generator so that ASGI
+    servers flush each event as it is generated.
+    """
+    serializer_class = WorkflowChatMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        order_type = serializer.validated_data.get('order_type', 'general')
+        conversation_id = serializer.validated_data.get('conversation_id')
+        message_text = serializer.validated_data.get('message', '')
+        if not message_text:
+            return Response({'message': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        ai_service = AIProcessingService()
+        if conversation_id:
+            conversation = get_object_or_404(Conversation, id=conversation_id)
+            if conversation.user != request.user:
+                return Response({'detail': 'You do not have access to this conversation.'}, status=status.HTTP_403_FORBIDDEN)
+        else:
+            conversation = Conversation.objects.create(
+                user=request.user,
+                conversation_type='chat',
+                metadata={'order_type': order_type}
+            )
+        
+        # Save user message
+        user_message = Message.objects.create(
+            conversation=conversation,
+            sender=request.user,
+            sender_type='user',
+            content=message_text
+        )
+        
+        # Context and knowledge are loaded here, before the response starts
+        prepared = ai_service.prepare_stream(conversation, message_text, request.user)
+        intent, entities = ai_service._extract_intent_and_entities(message_text, request.user.group_id)
+        start_payload = {
+            'conversation_id': conversation.id,
+            'user_message': MessageSerializer(user_message).data
+        }
+        
+        async def events():
+            yield _sse('start', start_payload)
+            chunks = []
+            async for chunk in ai_service.astream_ai_response(prepared):
+                chunks.append(chunk)
+                yield _sse('token', {'content': chunk})
+            
+            ai_message = await Message.objects.acreate(
+                conversation=conversation,
+                sender_type='ai',
+                content=''.join(chunks),
+                metadata={
+                    'knowledge_used': prepared['knowledge'],
+                    'intent': intent,
+                    'entities': entities,
+                    'streamed': True
+                },
+                processed_at=timezone.now()
+            )
+            yield _sse('done', {
+                'conversation_id': conversation.id,
+                'ai_response': MessageSerializer(ai_message).data,
+                'ai_message_id': ai_message.id,
+                'status': 'completed',
+                'intent': intent,
+                'entities': entities
+            })
+        
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class ChatHistoryWorkflowView(QueryShapingMixin, generics.ListAPIView):
     """
     Workflow endpoint: GET /api/chat/history
     """
     serializer_class = MessageSerializer
+    pagination_class = MessageKeysetPagination
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
@@ -467,6 +591,7 @@ class VoiceChatStartView(generics.GenericAPIView):
     """
     permission_classes = [permissions.IsAuthenticated]
     
+    @track_activity('voice_start', resource_type='conversation')
     def post(self, request):
         order_type = request.data.get('order_type', 'general')
         
@@ -476,14 +601,9 @@ class VoiceChatStartView(generics.GenericAPIView):
             metadata={'order_type': order_type}
         )
         
-        # Track voice chat start activity
-        UserActivity.objects.create(
-            user=request.user,
-            action='voice_start',
-            resource_type='conversation',
+        annotate_activity(
+            request,
             resource_id=conversation.id,
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
             metadata={'order_type': order_type}
         )
         
@@ -560,21 +680,73 @@ class ChatStatusWorkflowView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        conversation_id = request.query_params.get('conversation_id')
+        try:
+            message_id = int(request.query_params.get('message_id') or 0)
+            conversation_id = int(request.query_params.get('conversation_id') or 0)
+        except ValueError:
+            return Response(
+                {'detail': 'message_id and conversation_id must be integers'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if message_id:
+            # Poll the state of an AI reply queued by ChatMessageWorkflowView
+            message = get_object_or_404(
+                Message, id=message_id, conversation__user=request.user
+            )
+            return Response({
+                'status': message.metadata.get('status', 'completed'),
+                'message': MessageSerializer(message).data,
+                'intent': message.metadata.get('intent'),
+                'entities': message.metadata.get('entities')
+            })
+        
+        # message_count comes from the joined counters row, not a count of orders_message per poll
+        conversations = shape_queryset(Conversation.objects.filter(user=request.user), ConversationSerializer)
         if conversation_id:
-            conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+            conversation = get_object_or_404(conversations, id=conversation_id)
         else:
-            conversation = Conversation.objects.filter(user=request.user).order_by('-started_at').first()
+            conversation = conversations.order_by('-started_at').first()
             if not conversation:
                 return Response({'active': False})
         
-        data = ConversationSerializer(conversation).data
-        data['message_count'] = conversation.messages.count()
         return Response({
             'active': True,
-            'conversation': data
+            'conversation': ConversationSerializer(conversation).data
         })
 
+class ChatUpdatesWorkflowView(generics.GenericAPIView):
+    """
+    Workflow endpoint: GET /api/chat/updates
+
+    Messages of a conversation with an id above ?after=, oldest first. The
+    ETag changes with the conversation's version (see order.updates), so a
+    repeated request with If-None-Match answers 304 without querying the
+    database while nothing changed. Long-polling (?wait=) is served by the
+    async endpoint, where waiting does not hold a worker thread.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            conversation_id, after, limit, _ = updates.parse_params(request.query_params)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Read before the messages, so a change in between only makes the tag stale
+        version = updates.get_version(conversation_id)
+        tag = updates.etag(request.user.pk, conversation_id, version, after) if version is not None else None
+        if tag and tag in updates.if_none_match(request.headers.get('If-None-Match')):
+            return _not_modified(tag)
+        
+        conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+        messages = list(
+            conversation.messages.select_related('sender').filter(id__gt=after).order_by('id')[:limit + 1]
+        )
+        response = Response(_updates_response_data(conversation_id, version, messages, limit))
+        if tag:
+            response['ETag'] = tag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 # AI Processing Views
 class ProcessMessageView(generics.GenericAPIView):
     """
@@ -594,6 +766,49 @@ class ProcessMessageView(generics.GenericAPIView):
         
         return Response(result)
 
+class BatchProcessMessagesView(generics.GenericAPIView):
+    """
+    Process many messages at once, streaming one NDJSON result per line.
+
+    Back-office endpoint for admins. Accepts {"messages": [...]} (strings or
+    {"id", "message"} objects), {"message_ids": [...]} for stored messages,
+    or both. Superadmins may name any message, admins those of their group's
+    conversations (their own when they have no group); other ids are skipped.
+    """
+    permission_classes = [IsAdminOrSuperAdmin]
+    serializer_class = BatchProcessMessagesSerializer
+    
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        items = list(data['messages'])
+        if data['message_ids']:
+            stored = Message.objects.filter(id__in=data['message_ids'])
+            if request.user.role != 'superadmin':
+                if request.user.group_id is not None:
+                    stored = stored.filter(conversation__user__group_id=request.user.group_id)
+                else:
+                    # Never match on a NULL group: that would reach every group-less user
+                    stored = stored.filter(conversation__user=request.user)
+            items.extend({'id': message_id, 'message': content}
+                         for message_id, content in stored.order_by('id').values_list('id', 'content'))
+        
+        ai_service = AIProcessingService()
+        results = ai_service.aprocess_messages(
+            items, request.user, generate=data['generate'], order_type=data['order_type']
+        )
+        
+        async def lines():
+            # Async, so ASGI sends each chunk's lines as they are ready instead of buffering the batch
+            async for result in results:
+                yield json.dumps(result, cls=DjangoJSONEncoder) + '\n'
+        
+        response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 class GenerateAIResponseView(generics.GenericAPIView):
     """
     Generate AI response for a given prompt
@@ -608,6 +823,6 @@ class GenerateAIResponseView(generics.GenericAPIView):
             return Response({'error': 'Prompt is required'}, status=status.HTTP_400_BAD_REQUEST)
         
         ai_service = AIProcessingService()
-        response = ai_service.generate_response(prompt, model)
+        response = ai_service.generate_response(prompt, model, request.user.group_id)
         
         return Response({'response': response})
\ No newline at end of file
@@ -0,0 +1,317 @@
+"""
+Live chat over WebSocket (ASGI), served at ``/ws/chat/`` by ``omnifin.asgi``.
+
+A socket subscribes to conversations it owns and receives, through the
+channel layer (``order.live``), every message saved in them — the user's
+own, pending and completed AI replies, whichever worker or Celery process
+wrote them — plus the tokens of replies streamed by any socket.
+
+Client frames (JSON text):
+
+- ``{"type": "authenticate", "token": "<DRF token>"}``, unless the
+  handshake carried a session cookie from an allowed origin;
+- ``{"type": "subscribe" | "unsubscribe", "conversation_id": 1}``;
+- ``{"type": "message", "message": "...", "conversation_id": 1,
+  "order_type": "general", "stream": true, "request_id": "..."}`` — without a
+  conversation_id a new conversation is started;
+- ``{"type": "ping"}``.
+
+Server frames: ``authenticated``, ``subscribed``, ``unsubscribed``,
+``ack`` (the saved user message, echoing ``request_id``), ``message``,
+``message_deleted``, ``token``, ``error`` and ``pong``.
+"""
+import asyncio
+import json
+import logging
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import live
+from .models import Conversation, Message
+from .serializers import WorkflowChatMessageSerializer
+from .services import AIProcessingService
+from .views import _reply_to_message
+
+logger = logging.getLogger(__name__)
+
+# Close codes (4000-4999 are application defined)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+def _origin_allowed(headers):
+    """Whether a browser handshake comes from this site or a CORS-allowed origin"""
+    origin = headers.get('origin')
+    if not origin:
+        return True
+    if origin in getattr(settings, 'CORS_ALLOWED_ORIGINS', []):
+        return True
+    return urlsplit(origin).netloc == headers.get('host')
+
+
+def _session_user(cookie_header):
+    cookie = SimpleCookie()
+    cookie.load(cookie_header or '')
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+    user = get_user(SimpleNamespace(session=session))
+    return user if user.is_authenticated else None
+
+
+class ChatSocket:
+    """
+    One WebSocket connection: authentication, subscriptions and chat messages
+    """
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self.headers = _headers(scope)
+        self.user = None
+        self.subscription = None
+        self._tasks = set()
+
+    async def send_json(self, data):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.send', 'text': json.dumps(data, cls=DjangoJSONEncoder)})
+
+    async def close(self, code):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.close', 'code': code})
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if not _origin_allowed(self.headers):
+            await self.close(CLOSE_FORBIDDEN)
+            return
+        # Session cookies authenticate the handshake; token clients send an authenticate frame
+        self.user = await sync_to_async(_session_user)(self.headers.get('cookie'))
+        await self._send({'type': 'websocket.accept'})
+        if self.user is not None:
+            await self.send_json({'type': 'authenticated', 'user_id': self.user.pk})
+
+        self.subscription = live.get_channel_layer().subscribe()
+        forwarder = asyncio.create_task(self._forward())
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] == 'websocket.receive':
+                    if not await self._dispatch(message.get('text') or (message.get('bytes') or b'').decode('utf-8', 'replace')):
+                        break
+        finally:
+            forwarder.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            await self.subscription.close()
+
+    async def _forward(self):
+        """Relay channel layer events of subscribed conversations to the client"""
+        while True:
+            _, event = await self.subscription.get()
+            try:
+                await self.send_json(event)
+            except Exception as e:
+                logger.error(f"Could not deliver live chat event: {str(e)}")
+                return
+
+    async def _dispatch(self, text):
+        """Handle one client frame; returns False when the socket was closed"""
+        try:
+            frame = json.loads(text)
+        except ValueError:
+            frame = None
+        if not isinstance(frame, dict):
+            await self.send_json({'type': 'error', 'detail': 'Frames must be JSON objects.'})
+            return True
+
+        kind = frame.get('type')
+        if kind == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif kind == 'authenticate':
+            return await self._authenticate(frame)
+        elif self.user is None:
+            await self.send_json({'type': 'error', 'detail': 'Authentication credentials were not provided.'})
+        elif kind == 'subscribe':
+            await self._subscribe(frame.get('conversation_id'))
+        elif kind == 'unsubscribe':
+            await self._unsubscribe(frame.get('conversation_id'))
+        elif kind == 'message':
+            # Replies take a while; keep reading frames meanwhile
+            task = asyncio.create_task(self._message(frame))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            await self.send_json({'type': 'error', 'detail': f"Unknown frame type: {kind}"})
+        return True
+
+    async def _authenticate(self, frame):
+        try:
+            token = await Token.objects.select_related('user').aget(key=str(frame.get('token') or ''))
+        except Token.DoesNotExist:
+            token = None
+        if token is None or not token.user.is_active:
+            await self.send_json({'type': 'error', 'detail': 'Invalid token.'})
+            await self.close(CLOSE_UNAUTHORIZED)
+            return False
+        self.user = token.user
+        await self.send_json({'type': 'authenticated', 'user_id': self.user.pk})
+        return True
+
+    async def _owned_conversation(self, conversation_id):
+        try:
+            return await Conversation.objects.aget(id=int(conversation_id), user=self.user)
+        except (Conversation.DoesNotExist, ValueError, TypeError):
+            return None
+
+    async def _subscribe(self, conversation_id):
+        conversation = await self._owned_conversation(conversation_id)
+        if conversation is None:
+            await self.send_json({'type': 'error', 'detail': 'Not found.', 'conversation_id': conversation_id})
+            return
+        group = live.conversation_group(conversation.id)
+        if group not in self.subscription.groups:
+            limit = getattr(settings, 'CHAT_WEBSOCKET_MAX_SUBSCRIPTIONS', 20)
+            if len(self.subscription.groups) >= limit:
+                await self.send_json({'type': 'error', 'detail': f"At most {limit} subscriptions per socket."})
+                return
+            await self.subscription.add(group)
+        await self.send_json({'type': 'subscribed', 'conversation_id': conversation.id})
+
+    async def _unsubscribe(self, conversation_id):
+        try:
+            conversation_id = int(conversation_id)
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'detail': 'conversation_id is required'})
+            return
+        await self.subscription.discard(live.conversation_group(conversation_id))
+        await self.send_json({'type': 'unsubscribed', 'conversation_id': conversation_id})
+
+    async def _message(self, frame):
+        request_id = frame.get('request_id')
+        try:
+            await self._chat(frame, request_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket chat message failed: {str(e)}")
+            await self.send_json({'type': 'error', 'detail': str(e), 'request_id': request_id})
+
+    async def _chat(self, frame, request_id):
+        serializer = WorkflowChatMessageSerializer(data=frame)
+        if not serializer.is_valid() or not serializer.validated_data.get('message'):
+            errors = serializer.errors if serializer.errors else {'message': ['This field is required.']}
+            await self.send_json({'type': 'error', 'detail': errors, 'request_id': request_id})
+            return
+        order_type = serializer.validated_data.get('order_type', 'general')
+        conversation_id = serializer.validated_data.get('conversation_id')
+        message_text = serializer.validated_data['message']
+        ai_service = AIProcessingService()
+
+        if conversation_id:
+            conversation = await self._owned_conversation(conversation_id)
+            if conversation is None:
+                await self.send_json({'type': 'error', 'detail': 'Not found.', 'request_id': request_id})
+                return
+            await self._subscribe(conversation.id)
+        else:
+            conversation = await Conversation.objects.acreate(
+                user=self.user,
+                conversation_type='chat',
+                metadata={'order_type': order_type}
+            )
+            await self._subscribe(conversation.id)
+            welcome_message = await sync_to_async(ai_service.get_welcome_message)(order_type, self.user.group_id)
+            await Message.objects.acreate(
+                conversation=conversation,
+                sender_type='ai',
+                content=welcome_message,
+                metadata={'type': 'welcome'}
+            )
+
+        # Saved messages reach subscribers through the post_save signal (order.signals)
+        user_message = await Message.objects.acreate(
+            conversation=conversation,
+            sender=self.user,
+            sender_type='user',
+            content=message_text
+        )
+        await self.send_json({
+            'type': 'ack',
+            'request_id': request_id,
+            'conversation_id': conversation.id,
+            'user_message_id': user_message.id,
+        })
+
+        if settings.CHAT_ASYNC_PROCESSING:
+            # A Celery task completes the pending reply; its save is published like any other
+            await sync_to_async(_reply_to_message)(ai_service, conversation, user_message, self.user)
+        elif frame.get('stream', True):
+            await self._stream_reply(ai_service, conversation, user_message)
+        else:
+            ai_response = await ai_service.aprocess_chat_message(
+                conversation=conversation,
+                message=message_text,
+                user=self.user
+            )
+            await Message.objects.acreate(
+                conversation=conversation,
+                sender_type='ai',
+                content=ai_response['response'],
+                metadata=ai_response.get('metadata', {}),
+                processed_at=timezone.now()
+            )
+
+    async def _stream_reply(self, ai_service, conversation, user_message):
+        """Publish reply tokens to the conversation as they arrive, then save the reply"""
+        prepared = await sync_to_async(ai_service.prepare_stream)(conversation, user_message.content, self.user)
+        intent, entities = await sync_to_async(ai_service._extract_intent_and_entities)(
+            user_message.content, self.user.group_id
+        )
+        chunks = []
+        async for chunk in ai_service.astream_ai_response(prepared):
+            chunks.append(chunk)
+            await live.apublish(conversation.id, {
+                'type': 'token',
+                'conversation_id': conversation.id,
+                'reply_to': user_message.id,
+                'content': chunk,
+            })
+        await Message.objects.acreate(
+            conversation=conversation,
+            sender_type='ai',
+            content=''.join(chunks),
+            metadata={
+                'knowledge_used': prepared['knowledge'],
+                'intent': intent,
+                'entities': entities,
+                'streamed': True,
+                'reply_to': user_message.id
+            },
+            processed_at=timezone.now()
+        )
+
+
+async def chat_websocket(scope, receive, send):
+    """ASGI application of one chat WebSocket"""
+    await ChatSocket(scope, receive, send).run()
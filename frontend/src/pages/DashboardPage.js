@@ -43,12 +43,12 @@ const DashboardPage = () => {
 
   const fetchDashboardData = async () => {
     try {
-      const [statsData, activityData] = await Promise.all([
-        dashboardService.getStats(),
-        dashboardService.getRecentActivity(),
-      ]);
-      setStats(statsData);
-      setRecentActivity(activityData.results || activityData);
+      const { stats: statsData, recent_activity: activityData } = await dashboardService.getDashboardData();
+      if (statsData.error || activityData.error) {
+        throw new Error(statsData.error || activityData.error);
+      }
+      setStats(statsData.data);
+      setRecentActivity(activityData.data);
     } catch (error) {
       showNotification('Failed to load dashboard data', 'error');
     } finally {
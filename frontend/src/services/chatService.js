@@ -1,5 +1,8 @@
 import api from './authService';
 
+const LONG_POLL_WAIT_S = 20;
+const POLL_TIMEOUT_MS = 60000;
+
 export const chatService = {
   async startConversation(orderType = 'general') {
     const response = await api.post('/chat/message/', { order_type: orderType });
@@ -12,9 +15,54 @@ export const chatService = {
       message,
       context,
     });
+    if (response.data.status === 'pending') {
+      return this.waitForResponse(response.data);
+    }
     return response.data;
   },
 
+  async waitForResponse(data) {
+    // The AI reply is generated in the background; long-poll the conversation until it is ready.
+    // Messages are asked for after the user's message, so the pending reply comes back once completed.
+    const deadline = Date.now() + POLL_TIMEOUT_MS;
+    let etag;
+    while (Date.now() < deadline) {
+      const update = await this.getUpdates(data.conversation_id, data.user_message.id, {
+        etag,
+        wait: LONG_POLL_WAIT_S,
+      });
+      if (update.notModified) {
+        continue;
+      }
+      etag = update.etag;
+      const reply = update.results.find((message) => message.id === data.ai_message_id);
+      const metadata = reply ? reply.metadata || {} : {};
+      if (reply && metadata.status !== 'pending') {
+        return {
+          ...data,
+          status: metadata.status || 'completed',
+          ai_response: reply,
+          intent: metadata.intent,
+          entities: metadata.entities,
+        };
+      }
+    }
+    return data;
+  },
+
+  async getUpdates(conversationId, after = 0, { etag, wait } = {}) {
+    // Messages after an id; answers 304 while the conversation is unchanged since `etag`
+    const response = await api.get('/chat/async/updates/', {
+      params: { conversation_id: conversationId, after, wait },
+      headers: etag ? { 'If-None-Match': etag } : {},
+      validateStatus: (status) => status === 200 || status === 304,
+    });
+    if (response.status === 304) {
+      return { notModified: true, etag };
+    }
+    return { notModified: false, etag: response.headers.etag, ...response.data };
+  },
+
   async getChatHistory(conversationId) {
     const response = await api.get(`/chat/history/?conversation_id=${conversationId}`);
     return response.data;
@@ -6,6 +6,17 @@ export const dashboardService = {
     return response.data;
   },
 
+  // Stats and recent activity in one request, through the widget data endpoint
+  async getDashboardData(activityLimit = 10) {
+    const response = await api.post('/analytics/widgets/data/', {
+      sources: [
+        { key: 'stats', source: 'dashboard_stats', refresh_interval: 30 },
+        { key: 'recent_activity', source: 'recent_activity', params: { limit: activityLimit }, refresh_interval: 30 },
+      ],
+    });
+    return response.data.sources;
+  },
+
   async getSystemHealth() {
     const response = await api.get('/core/system/health/');
     return response.data;